@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from decimal import Decimal
+from datetime import timedelta
+from pathlib import Path
+
+# --- CONFIG ---
+# Run from anywhere: python TEST/bench_json_renderer.py [--rows 2000]
+# No database needed, payloads are synthetic but shaped like the real responses.
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend" / "tps_backend_folder"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tps_backend.settings")
+ITERATIONS = 30
+
+import django
+django.setup()
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from tps_backend.renderers import FRAGMENT, ORJSONRenderer, RawJSON, orjson
+
+
+# --- PAYLOADS ---
+def polygon(lat, lng, vertices=12):
+    return [
+        {"lat": round(lat + random.uniform(-0.001, 0.001), 6), "lng": round(lng + random.uniform(-0.001, 0.001), 6)}
+        for _ in range(vertices)
+    ]
+
+
+def search_map_rows(rows, raw_polygons=False):
+    data = []
+    for i in range(rows):
+        lat, lng = 45.0 + i * 0.0001, 7.6 + i * 0.0001
+        coords = polygon(lat, lng)
+        data.append({
+            "id": i, "name": f"Parking {i}", "city": "Torino", "address": f"Via Roma {i}",
+            "latitude": lat, "longitude": lng, "marker_latitude": lat, "marker_longitude": lng,
+            "polygon_coords": RawJSON(json.dumps(coords)) if raw_polygons else coords,
+        })
+    return data
+
+
+def fine_rows(rows):
+    now = timezone.now()
+    return [
+        {
+            "id": i, "vehicle_plate": f"AB{i:03d}CD", "amount": Decimal("50.00") + i,
+            "reason": "Parking Violation", "status": "unpaid",
+            "issued_at": now - timedelta(minutes=i, microseconds=i), "notes": "", "contestation_reason": None,
+        }
+        for i in range(rows)
+    ]
+
+
+# --- MEASURE ---
+def measure(renderer, data):
+    times = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        body = renderer.render(data)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000, len(body)
+
+
+def compare(label, data, raw_data=None):
+    default_ms, size = measure(JSONRenderer(), data)
+    fast_ms, fast_size = measure(ORJSONRenderer(), data)
+    same = json.loads(JSONRenderer().render(data)) == json.loads(ORJSONRenderer().render(data))
+    print(f"{label:<28} default {default_ms:8.2f} ms   orjson {fast_ms:8.2f} ms   "
+          f"x{default_ms / fast_ms:5.1f}   {size / 1024:8.1f} KiB   same output: {same}")
+    if raw_data is not None:
+        raw_ms, _ = measure(ORJSONRenderer(), raw_data)
+        same = json.loads(ORJSONRenderer().render(raw_data)) == json.loads(JSONRenderer().render(data))
+        print(f"{label + ' (raw polygons)':<28} default {default_ms:8.2f} ms   orjson {raw_ms:8.2f} ms   "
+              f"x{default_ms / raw_ms:5.1f}   {'':>13}   same output: {same}")
+
+
+# --- MAIN SCRIPT ---
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed, ORJSONRenderer falls back to the default renderer.")
+    else:
+        print(f"orjson {orjson.__version__}, Fragment passthrough: {FRAGMENT is not None}")
+    random.seed(0)
+    map_rows = search_map_rows(args.rows)
+    random.seed(0)
+    raw_rows = search_map_rows(args.rows, raw_polygons=True)
+    compare(f"search_map x{args.rows}", map_rows, raw_rows)
+    compare(f"fines x{args.rows}", fine_rows(args.rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import timedelta
+from pathlib import Path
+
+# --- CONFIG ---
+# Run from anywhere: python TEST/explain_session_indexes.py [--seed 200000]
+# Everything (seed data, dropped indexes) happens inside a transaction that is rolled back.
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend" / "tps_backend_folder"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tps_backend.settings")
+ITERATIONS = 20
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from django.utils import timezone
+from parkings.models import Parking
+from users.models import CustomUser
+from vehicles.models import ParkingSession, Vehicle
+from tps_backend.dates import day_bounds
+
+# Indexes added for the hot paths, dropped temporarily for the "before" plans
+SESSION_INDEXES = [
+    index for index in ParkingSession._meta.indexes
+    if index.name != 'session_active_planned_end_idx'
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+# --- SEED ---
+def seed(count):
+    now = timezone.now()
+    user = CustomUser.objects.create_user(email=f"bench{random.randint(0, 10**9)}@bench.local", password="bench")
+    vehicles = Vehicle.objects.bulk_create(
+        [Vehicle(user=user, plate=f"BENCH{i:06d}", plate_normalized=f"BENCH{i:06d}") for i in range(count // 20 or 1)]
+    )
+    parkings = list(Parking.objects.all()[:50]) or [None]
+    sessions = []
+    for i in range(count):
+        start = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+        sessions.append(ParkingSession(
+            user=user,
+            vehicle=random.choice(vehicles),
+            parking_lot=random.choice(parkings),
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            planned_end_time=start + timedelta(hours=1),
+            is_active=i % 100 == 0,
+        ))
+    ParkingSession.objects.bulk_create(sessions, batch_size=5000)
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("ANALYZE vehicles_parkingsession")
+        elif connection.vendor == "sqlite":
+            cursor.execute("ANALYZE")
+
+
+# --- QUERIES ---
+def hot_queries():
+    sample = ParkingSession.objects.exclude(vehicle=None).exclude(parking_lot=None).order_by().first()
+    if sample is None:
+        return []
+    vehicle_id, parking_id, user_id = sample.vehicle_id, sample.parking_lot_id, sample.user_id
+    today_start, today_end = day_bounds()
+    today = timezone.localdate()
+    qs = ParkingSession.objects
+    return [
+        ("vehicle has active session", qs.filter(vehicle_id=vehicle_id, is_active=True)),
+        ("latest session of vehicle", qs.filter(vehicle_id=vehicle_id).order_by("-start_time")[:1]),
+        ("last ended session of vehicle", qs.filter(vehicle_id=vehicle_id).order_by("-end_time")[:1]),
+        ("active sessions of parking", qs.filter(parking_lot_id=parking_id, is_active=True).order_by("-start_time")),
+        ("parking today, __date (old)", qs.filter(parking_lot_id=parking_id, start_time__date=today)),
+        ("parking today, range (new)", qs.filter(parking_lot_id=parking_id, start_time__gte=today_start, start_time__lt=today_end)),
+        ("all today, __date (old)", qs.filter(start_time__date=today)),
+        ("all today, range (new)", qs.filter(start_time__gte=today_start, start_time__lt=today_end)),
+        ("active sessions of user", qs.filter(user_id=user_id, is_active=True)),
+        ("session list of user", qs.filter(user_id=user_id).order_by("-start_time")[:50]),
+        ("recent sessions", qs.order_by("-start_time")[:10]),
+    ]
+
+
+def measure(queryset):
+    times = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        list(queryset.all())
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def report(title):
+    print(f"\n===== {title} =====")
+    for label, queryset in hot_queries():
+        print(f"\n--- {label}: median {measure(queryset):.2f} ms")
+        print(queryset.explain())
+
+
+# --- MAIN SCRIPT ---
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic sessions to add (rolled back)")
+    args = parser.parse_args()
+
+    print(f"Database: {connection.vendor}, sessions: {ParkingSession.objects.count()}")
+    try:
+        with transaction.atomic():
+            if args.seed:
+                print(f"Seeding {args.seed} sessions...")
+                seed(args.seed)
+
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in SESSION_INDEXES:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+                analyze()
+                report("BEFORE (without session indexes)")
+                transaction.set_rollback(True)
+
+            analyze()
+            report("AFTER (with session indexes)")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == "__main__":
+    main()
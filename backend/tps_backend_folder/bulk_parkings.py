@@ -8,7 +8,11 @@ from django.utils import timezone
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tps_backend.settings")
 django.setup()
 
+from parkings.changes import PARKING, SPOT, log_changes
+from parkings.counters import rebuild_counters
 from parkings.models import Parking, Spot, City  
+from parkings.spatial import GEOMETRY_VERSION
+from tps_backend.versioning import bump_version
 
 # Constants
 BATCH_SIZE = 100
@@ -79,6 +83,8 @@ for i in range(1, num_parkings + 1):
         longitude=lon,
         polygon_coordinates=json.dumps(polygon)
     )
+    # bulk_create skips save(), fill the derived geometry columns here
+    parking.refresh_geometry()
     parkings_to_create.append(parking)
 
 # 4. Bulk create parkings in batches
@@ -87,9 +93,16 @@ created_parkings = []
 for start in range(0, len(parkings_to_create), BATCH_SIZE):
     batch = parkings_to_create[start:start + BATCH_SIZE]
     Parking.objects.bulk_create(batch)
+    # bulk_create skips the signals that feed the change log, ?since= clients need the rows too
+    log_changes(PARKING, [(parking.pk, parking.pk, None) for parking in batch])
     created_parkings.extend(batch)
 print(f"Created {len(created_parkings)} parkings.")
 
+# bulk_create skips post_save, refresh the map spatial index explicitly.
+# Running servers see this bump through REDIS_URL; on per-process caches
+# their stamps expire within LOCAL_VERSION_TIMEOUT instead.
+bump_version(GEOMETRY_VERSION)
+
 # 5. Create spots per parking
 print("Creating spots for each parking...")
 spots_to_create = []
@@ -110,7 +123,12 @@ for parking in last_parkings:
         )
     # Bulk create spots in batches per parking
     for start in range(0, len(spots_to_create), BATCH_SIZE):
-        Spot.objects.bulk_create(spots_to_create[start:start + BATCH_SIZE])
+        spot_batch = Spot.objects.bulk_create(spots_to_create[start:start + BATCH_SIZE])
+        log_changes(SPOT, [(spot.pk, spot.parking_id, None) for spot in spot_batch])
     spots_to_create = []  # reset for next parking
 
+# bulk_create skips the signals that maintain ParkingCounter, recount once at the end
+print("Rebuilding parking counters...")
+rebuild_counters()
+
 print("Done! All parkings and spots created in 0_TEST_CITY.")
@@ -51,8 +51,10 @@ class ParkingAdmin(ModelAdmin):
     fields = (
         'name', 'city', 'address', 'rate_per_hour', 
         'polygon_coordinates',
-        'tariff_config_json' 
+        'tariff_config_json',
+        'marker_latitude', 'marker_longitude',
     )
+    readonly_fields = ('marker_latitude', 'marker_longitude')
     
     help_texts = {
         'polygon_coordinates': 'JSON array of coordinates: [{"lat": 41.123, "lng": 12.456}, ...]'
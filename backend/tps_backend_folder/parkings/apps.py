@@ -7,5 +7,4 @@ class ParkingsConfig(AppConfig):
     verbose_name = 'Parking Management'
 
     def ready(self):
-        # Import signals here if needed
-        pass
+        from . import signals  # noqa: F401
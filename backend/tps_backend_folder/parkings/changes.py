@@ -0,0 +1,121 @@
+"""
+Delta sync for the list endpoints of parkings, spots, sessions and fines.
+
+Every write to a synced row appends a ChangeLog entry. Full list responses
+carry the current cursor in the X-Sync-Cursor header; passing it back as
+?since=<cursor> returns only what changed afterwards:
+
+    {"cursor": <next cursor>, "changed": [<rows as in the full list>], "deleted": [<ids>]}
+
+Rows that changed but no longer match the list (a session that ended, a
+parking moved out of the requested city) are reported as deleted, so a
+client can apply a delta to its list without knowing the list's filters.
+Deltas are idempotent, a change may be sent twice but is never missed.
+"""
+from datetime import timedelta
+from django.db.models import Max, Min
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import ChangeLog
+
+PARKING = 'parking'
+SPOT = 'spot'
+SESSION = 'session'
+FINE = 'fine'
+
+CURSOR_HEADER = 'X-Sync-Cursor'
+
+# Entries younger than this may belong to transactions still in flight,
+# the cursor stays behind them so they are sent again on the next sync
+CURSOR_SETTLE_SECONDS = 5
+
+CHANGE_RETENTION = timedelta(days=7)
+
+
+def log_change(resource, object_id, parking_id=None, owner_id=None, deleted=False):
+    ChangeLog.objects.create(
+        resource=resource, object_id=object_id, parking_id=parking_id, owner_id=owner_id, deleted=deleted,
+    )
+
+
+def log_changes(resource, rows, deleted=False):
+    """Bulk variant for set-based writes, rows of (object_id, parking_id, owner_id)"""
+    ChangeLog.objects.bulk_create(
+        [
+            ChangeLog(resource=resource, object_id=object_id, parking_id=parking_id, owner_id=owner_id, deleted=deleted)
+            for object_id, parking_id, owner_id in rows
+        ],
+        batch_size=1000,
+    )
+
+
+def current_cursor(now=None, after=0):
+    """Highest change id that no in-flight transaction can still precede"""
+    now = now or timezone.now()
+    settled = (
+        ChangeLog.objects.filter(id__gt=after, created_at__lt=now - timedelta(seconds=CURSOR_SETTLE_SECONDS))
+        .aggregate(cursor=Max('id'))['cursor']
+    )
+    return settled or after
+
+
+def changes_since(resource, since, **scope):
+    """(changed_ids, deleted_ids) after `since`, or None when pruned entries make a full reload necessary"""
+    oldest = ChangeLog.objects.aggregate(oldest=Min('id'))['oldest']
+    if oldest is not None and since < oldest - 1:
+        return None
+    latest = dict(
+        ChangeLog.objects.filter(resource=resource, id__gt=since, **scope)
+        .order_by('id')
+        .values_list('object_id', 'deleted')
+    )
+    changed = [object_id for object_id, deleted in latest.items() if not deleted]
+    deleted = [object_id for object_id, deleted in latest.items() if deleted]
+    return changed, deleted
+
+
+def sync_delta(request, resource, queryset, serialize, **scope):
+    """
+    Delta response for ?since=, None when the request asks for the full list.
+    `queryset` is the endpoint's own (filtered) list queryset and
+    `serialize` turns a queryset of it into the list's row format.
+    """
+    since = request.query_params.get('since')
+    if since is None:
+        return None
+    try:
+        since = int(since)
+    except ValueError:
+        return Response({"detail": "since must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    cursor = current_cursor(after=since)
+    changes = changes_since(resource, since, **scope)
+    if changes is None:
+        return Response(
+            {"detail": "Cursor too old, download the full list again."},
+            status=status.HTTP_410_GONE,
+        )
+    changed_ids, deleted_ids = changes
+    rows = serialize(queryset.filter(id__in=changed_ids)) if changed_ids else []
+    visible = {row['id'] for row in rows}
+    deleted_ids += [object_id for object_id in changed_ids if object_id not in visible]
+    return Response({'cursor': cursor, 'changed': rows, 'deleted': deleted_ids})
+
+
+def stamp_cursor(response, cursor):
+    """Cursor taken before the list was read, so nothing written meanwhile is skipped"""
+    response[CURSOR_HEADER] = str(cursor)
+    return response
+
+
+def prune_changes(now=None):
+    """Drop entries older than CHANGE_RETENTION, always keeping the newest one"""
+    now = now or timezone.now()
+    newest = ChangeLog.objects.aggregate(newest=Max('id'))['newest']
+    if newest is None:
+        return 0
+    deleted, _ = ChangeLog.objects.filter(
+        created_at__lt=now - CHANGE_RETENTION, id__lt=newest
+    ).delete()
+    return deleted
@@ -0,0 +1,50 @@
+from .geometry import POLYGON_DECIMALS, parse_polygon
+
+# Columns of search_map's ?layout=columnar, each a list with one entry per parking
+COLUMNAR_FIELDS = ('id', 'name', 'city', 'address', 'latitude', 'longitude', 'marker_latitude', 'marker_longitude')
+
+
+def _quantize(value, factor):
+    return None if value is None else round(value * factor)
+
+
+def columnar_map(queryset, include_polygons=True):
+    """
+    Compact search_map payload: parallel arrays instead of one object per parking.
+    Coordinates are integers in units of 10**-precision degrees.
+    Polygons are flattened into `polygon_deltas` ([dlat, dlng, dlat, dlng, ...])
+    with `polygon_lengths` vertices per parking. The deltas are a single running
+    sum over the whole array: start from (0, 0) and add each pair to get the
+    next vertex.
+    """
+    factor = 10 ** POLYGON_DECIMALS
+    ids, names, cities, addresses, marker_lats, marker_lngs, lengths, deltas = [], [], [], [], [], [], [], []
+    fields = COLUMNAR_FIELDS + (('polygon_coordinates',) if include_polygons else ())
+    prev_lat = prev_lng = 0
+    for pk, name, city, address, lat, lng, marker_lat, marker_lng, *polygon in queryset.values_list(*fields):
+        ids.append(pk)
+        names.append(name)
+        cities.append(city)
+        addresses.append(address)
+        # Same precedence as ParkingMapSerializer's marker fields
+        marker_lats.append(_quantize(lat or marker_lat, factor))
+        marker_lngs.append(_quantize(lng or marker_lng, factor))
+        points = parse_polygon(polygon[0]) if polygon else []
+        lengths.append(len(points))
+        for vertex_lat, vertex_lng in points:
+            vertex_lat, vertex_lng = round(vertex_lat * factor), round(vertex_lng * factor)
+            deltas.append(vertex_lat - prev_lat)
+            deltas.append(vertex_lng - prev_lng)
+            prev_lat, prev_lng = vertex_lat, vertex_lng
+    return {
+        'layout': 'columnar',
+        'precision': POLYGON_DECIMALS,
+        'ids': ids,
+        'names': names,
+        'cities': cities,
+        'addresses': addresses,
+        'marker_latitudes': marker_lats,
+        'marker_longitudes': marker_lngs,
+        'polygon_lengths': lengths,
+        'polygon_deltas': deltas,
+    }
@@ -0,0 +1,373 @@
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from .changes import PARKING, log_change
+from .models import CityDailyCounter, Parking, ParkingCounter, ParkingDailyCounter, Spot
+
+def _adjust(parking_id, create=True, **deltas):
+    if create:
+        ParkingCounter.objects.get_or_create(parking_id=parking_id)
+    ParkingCounter.objects.filter(parking_id=parking_id).update(**{
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+    # Occupancy is part of the parking rows, delta sync must resend them
+    log_change(PARKING, parking_id, parking_id=parking_id)
+
+
+def _adjust_day(model, key, peak=None, create=True, **deltas):
+    """
+    Add deltas to the day row identified by `key`, raising its peak to `peak` if given.
+    Take-backs pass create=False: there is nothing to undo on a missing row,
+    and it may be a parking's row being cascade-deleted.
+    """
+    if create:
+        model.objects.get_or_create(**key)
+    updates = {}
+    for field, delta in deltas.items():
+        if field == 'revenue':
+            # Prepaid costs are computed as floats, keep the column arithmetic in Decimal
+            delta = Decimal(str(delta))
+        updates[field] = F(field) + delta
+    if peak is not None:
+        updates['peak_occupancy'] = Greatest(F('peak_occupancy'), peak)
+    model.objects.filter(**key).update(**updates)
+
+
+def _city_active_sessions(city):
+    return Subquery(
+        ParkingCounter.objects.filter(parking__city=city)
+        .values('parking__city')
+        .annotate(total=Sum('active_sessions'))
+        .values('total')[:1]
+    )
+
+
+def _parking_active_sessions(parking_id):
+    return Subquery(ParkingCounter.objects.filter(parking_id=parking_id).values('active_sessions')[:1])
+
+
+def _session_location(session):
+    if not session.parking_lot_id:
+        return None, ''
+    return session.parking_lot_id, session.parking_lot.city
+
+
+def _fine_location(fine):
+    """Fines are attributed to the parking of their session, if any"""
+    from vehicles.models import ParkingSession
+
+    if not fine.session_id:
+        return None, ''
+    row = (
+        ParkingSession.objects.filter(pk=fine.session_id)
+        .values_list('parking_lot_id', 'parking_lot__city').first()
+    )
+    if not row or row[0] is None:
+        return None, ''
+    return row
+
+
+def _record(parking_id, city, day, peak=False, create=True, **deltas):
+    if parking_id:
+        _adjust_day(
+            ParkingDailyCounter, {'parking_id': parking_id, 'day': day},
+            peak=Coalesce(_parking_active_sessions(parking_id), 0) if peak else None, create=create, **deltas,
+        )
+    _adjust_day(
+        CityDailyCounter, {'city': city, 'day': day},
+        peak=Coalesce(_city_active_sessions(city), 0) if peak and city else None, create=create, **deltas,
+    )
+
+
+def record_spot_added(spot):
+    _adjust(spot.parking_id, total_spots=1)
+
+
+def record_spot_removed(spot):
+    _adjust(spot.parking_id, total_spots=-1)
+
+
+def record_session_started(session):
+    """New session: one more active session and one entry for its start day"""
+    parking_id, city = _session_location(session)
+    with transaction.atomic():
+        if parking_id and session.is_active:
+            _adjust(parking_id, active_sessions=1)
+        _record(
+            parking_id, city, timezone.localdate(session.start_time),
+            peak=session.is_active,
+            entries=1,
+            revenue=session.total_cost or Decimal('0.00'),
+        )
+
+
+def record_session_changed(session, previous):
+    """
+    Saved session: follow is_active flips, parking moves and cost changes.
+    `previous` is its (is_active, parking_lot_id, city, total_cost) row before the save.
+    """
+    was_active, previous_parking_id, previous_city, previous_cost = previous
+    parking_id, city = _session_location(session)
+    moved = previous_parking_id != parking_id
+    with transaction.atomic():
+        if was_active and previous_parking_id and (moved or not session.is_active):
+            _adjust(previous_parking_id, active_sessions=-1)
+        if session.is_active and parking_id and (moved or not was_active):
+            _adjust(parking_id, active_sessions=1)
+        if moved:
+            # The entry follows the session to its new parking
+            day = timezone.localdate(session.start_time)
+            _record(
+                previous_parking_id, previous_city or '', day, create=False,
+                entries=-1,
+                revenue=-(previous_cost or Decimal('0.00')),
+            )
+            _record(
+                parking_id, city, day,
+                peak=session.is_active,
+                entries=1,
+                revenue=session.total_cost or Decimal('0.00'),
+            )
+            return
+        if session.is_active and parking_id and not was_active:
+            _record(parking_id, city, timezone.localdate(), peak=True)
+        revenue = Decimal(str(session.total_cost or 0)) - (previous_cost or Decimal('0.00'))
+        if revenue:
+            # end_session() settles the cost at the prepaid amount
+            _record(parking_id, city, timezone.localdate(session.start_time), create=False, revenue=revenue)
+
+
+def record_session_removed(session):
+    """Deleted session: take back what record_session_started booked"""
+    parking_id, city = _session_location(session)
+    with transaction.atomic():
+        if parking_id and session.is_active:
+            _adjust(parking_id, create=False, active_sessions=-1)
+        _record(
+            parking_id, city, timezone.localdate(session.start_time), create=False,
+            entries=-1,
+            revenue=-(session.total_cost or Decimal('0.00')),
+        )
+
+
+def record_sessions_ended(counts_by_parking):
+    """Bulk variant for set-based expiry: {parking_id: ended_sessions}"""
+    with transaction.atomic():
+        for parking_id, count in counts_by_parking.items():
+            if parking_id:
+                _adjust(parking_id, active_sessions=-count)
+
+
+def record_fine_issued(fine):
+    parking_id, city = _fine_location(fine)
+    _record(parking_id, city, timezone.localdate(fine.issued_at), fines_issued=1)
+
+
+def record_fine_paid(fine, paid=True, paid_at=None):
+    """Count a fine on its payment day, or take it back (paid=False)"""
+    parking_id, city = _fine_location(fine)
+    paid_at = paid_at or fine.paid_at or timezone.now()
+    _record(parking_id, city, timezone.localdate(paid_at), fines_paid=1 if paid else -1)
+
+
+def record_fine_removed(fine):
+    with transaction.atomic():
+        parking_id, city = _fine_location(fine)
+        _record(parking_id, city, timezone.localdate(fine.issued_at), fines_issued=-1)
+        if fine.status == 'paid':
+            record_fine_paid(fine, paid=False)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _peak_occupancy(since):
+    """
+    Sweep over session intervals: highest number of concurrent active
+    sessions reached on each day, per parking and per city.
+    Sessions count as occupying from start_time until end_time, or until
+    now while still active. Only days >= since are reported.
+    """
+    from vehicles.models import ArchivedParkingSession, ParkingSession
+
+    since_start = _day_start(since) if since else None
+    recent = Q(is_active=True) | Q(end_time__gt=since_start) if since_start else Q()
+    events = []
+    rows = ParkingSession.objects.filter(recent).values_list(
+        'parking_lot_id', 'parking_lot__city', 'start_time', 'end_time', 'is_active',
+    )
+    archived = ArchivedParkingSession.objects.filter(
+        Q(end_time__gt=since_start) if since_start else Q()
+    ).values_list('parking_lot_id', 'city', 'start_time', 'end_time', Value(False))
+    for parking_id, city, start, end, active in list(rows.iterator(chunk_size=5000)) + list(archived):
+        if active:
+            end = None
+        elif not end or end <= start:
+            continue
+        events.append((start, 1, parking_id, city or ''))
+        if end is not None:
+            events.append((end, -1, parking_id, city or ''))
+
+    # Ends sort before starts at the same instant
+    events.sort(key=lambda e: (e[0], e[1]))
+    parking_peaks, parking_running = {}, defaultdict(int)
+    city_peaks, city_running = {}, defaultdict(int)
+    for moment, delta, parking_id, city in events:
+        day = timezone.localdate(moment)
+        counted = since is None or day >= since
+        for key, peaks, running in ((parking_id, parking_peaks, parking_running), (city, city_peaks, city_running)):
+            if not key:
+                continue
+            if counted:
+                # Sessions carried over from the previous day count too
+                peaks[key, day] = max(peaks.get((key, day), 0), running[key])
+            running[key] += delta
+            if counted:
+                peaks[key, day] = max(peaks[key, day], running[key])
+    return parking_peaks, city_peaks
+
+
+def _daily_totals(since):
+    """{(kind, key, day): {field: value}} from live and archived sessions and fines"""
+    from vehicles.models import ArchivedFine, ArchivedParkingSession, Fine, ParkingSession
+
+    since_start = _day_start(since) if since else None
+    totals = defaultdict(lambda: defaultdict(int))
+
+    def add(rows, field, value_field=None):
+        for row in rows:
+            value = row[value_field] if value_field else row['cnt']
+            if value is None:
+                continue
+            if row['rollup_parking'] is not None:
+                totals['parking', row['rollup_parking'], row['day']][field] += value
+            totals['city', row['rollup_city'] or '', row['day']][field] += value
+
+    def grouped(queryset, time_field, parking_path, city_path, **aggregates):
+        if since_start:
+            queryset = queryset.filter(**{f'{time_field}__gte': since_start})
+        return (
+            queryset.annotate(day=TruncDate(time_field))
+            .values('day', rollup_parking=F(parking_path), rollup_city=F(city_path))
+            .annotate(**aggregates)
+            .order_by()
+        )
+
+    session_aggregates = {'cnt': Count('id'), 'revenue': Sum('total_cost')}
+    for rows in (
+        grouped(ParkingSession.objects.all(), 'start_time', 'parking_lot_id', 'parking_lot__city', **session_aggregates),
+        grouped(ArchivedParkingSession.objects.all(), 'start_time', 'parking_lot_id', 'city', **session_aggregates),
+    ):
+        rows = list(rows)
+        add(rows, 'entries')
+        add(rows, 'revenue', 'revenue')
+
+    for fines, parking_path, city_path in (
+        (Fine.objects.all(), 'session__parking_lot_id', 'session__parking_lot__city'),
+        (ArchivedFine.objects.all(), 'parking_lot_id', 'city'),
+    ):
+        add(grouped(fines, 'issued_at', parking_path, city_path, cnt=Count('id')), 'fines_issued')
+        add(
+            grouped(fines.filter(status='paid', paid_at__isnull=False), 'paid_at', parking_path, city_path, cnt=Count('id')),
+            'fines_paid',
+        )
+
+    parking_peaks, city_peaks = _peak_occupancy(since)
+    for (parking_id, day), peak in parking_peaks.items():
+        totals['parking', parking_id, day]['peak_occupancy'] = peak
+    for (city, day), peak in city_peaks.items():
+        totals['city', city, day]['peak_occupancy'] = peak
+    return totals
+
+
+ROLLUP_FIELDS = ('entries', 'revenue', 'fines_issued', 'fines_paid', 'peak_occupancy')
+
+
+def _rewrite_days(model, key_field, rows, totals):
+    """
+    Set the locked day `rows` to `totals` ({(key, day): values}) in place,
+    zeroing the days without activity, and create the missing days.
+    """
+    for row in rows:
+        values = totals.pop((getattr(row, key_field), row.day), {})
+        for field in ROLLUP_FIELDS:
+            setattr(row, field, values.get(field, 0))
+    model.objects.bulk_update(rows, ROLLUP_FIELDS, batch_size=1000)
+    model.objects.bulk_create(
+        [model(**{key_field: key, 'day': day}, **values) for (key, day), values in totals.items()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_counters(since=None):
+    """
+    Recompute the counters from the raw spot, session and fine tables
+    (archived rows included). Idempotent: with `since` (a date) only the
+    daily rows from that day on are replaced, for incremental runs.
+    Days up to the last `archive_history --file` export are never replaced,
+    their rows are no longer in the database. Returns the first day rebuilt.
+    The counter and day rows are locked before counting, so writers that
+    adjust them wait for the rebuild and apply their delta on top of it.
+    Rows are updated in place rather than deleted for the same reason.
+    """
+    from vehicles.archive import rebuild_floor
+    from vehicles.models import ParkingSession
+
+    floor = rebuild_floor()
+    if floor and (since is None or since < floor):
+        since = floor
+
+    with transaction.atomic():
+        counters = list(ParkingCounter.objects.select_for_update())
+        parking_days = ParkingDailyCounter.objects.select_for_update()
+        city_days = CityDailyCounter.objects.select_for_update()
+        if since:
+            parking_days = parking_days.filter(day__gte=since)
+            city_days = city_days.filter(day__gte=since)
+        parking_days, city_days = list(parking_days), list(city_days)
+
+        spots = dict(
+            Spot.objects.values('parking_id').annotate(cnt=Count('id')).values_list('parking_id', 'cnt')
+        )
+        active = dict(
+            ParkingSession.objects.filter(is_active=True, parking_lot__isnull=False)
+            .values('parking_lot_id').annotate(cnt=Count('id')).values_list('parking_lot_id', 'cnt')
+        )
+        totals = _daily_totals(since)
+        parking_ids = set(Parking.objects.values_list('id', flat=True))
+
+        for counter in counters:
+            counter.total_spots = spots.get(counter.parking_id, 0)
+            counter.active_sessions = active.get(counter.parking_id, 0)
+        ParkingCounter.objects.bulk_update(counters, ['total_spots', 'active_sessions'], batch_size=1000)
+        ParkingCounter.objects.bulk_create(
+            [
+                ParkingCounter(
+                    parking_id=parking_id,
+                    total_spots=spots.get(parking_id, 0),
+                    active_sessions=active.get(parking_id, 0),
+                )
+                for parking_id in parking_ids - {counter.parking_id for counter in counters}
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+        _rewrite_days(ParkingDailyCounter, 'parking_id', parking_days, {
+            (key, day): values
+            for (kind, key, day), values in totals.items()
+            if kind == 'parking' and key in parking_ids
+        })
+        _rewrite_days(CityDailyCounter, 'city', city_days, {
+            (key, day): values
+            for (kind, key, day), values in totals.items()
+            if kind == 'city'
+        })
+    return since
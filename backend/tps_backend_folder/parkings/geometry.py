@@ -0,0 +1,118 @@
+import json
+
+# Parking columns derived from the polygon, lat/lng and entrances
+GEOMETRY_FIELDS = (
+    'marker_latitude', 'marker_longitude',
+    'centroid_latitude', 'centroid_longitude',
+    'bbox_min_latitude', 'bbox_min_longitude',
+    'bbox_max_latitude', 'bbox_max_longitude',
+)
+
+# Polygon columns rewritten by refresh_geometry(): canonical JSON text and its polyline
+POLYGON_FIELDS = ('polygon_coordinates', 'polygon_polyline')
+
+# Stored vertices are rounded to 6 decimals (~0.1 m), the polyline to 5 (~1 m)
+POLYGON_DECIMALS = 6
+POLYLINE_DECIMALS = 5
+
+
+def parse_polygon(raw):
+    """Decode a stored polygon into a list of (lat, lng) tuples, skipping bad vertices"""
+    try:
+        coords = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(coords, list):
+        return []
+    points = []
+    for c in coords:
+        try:
+            points.append((float(c['lat']), float(c['lng'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return points
+
+
+def validate_polygon(value):
+    """
+    Strict counterpart of parse_polygon() for writes: `value` is JSON text or
+    an already decoded list of {"lat", "lng"} objects. Raises ValueError.
+    """
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value) if value.strip() else []
+        except ValueError:
+            raise ValueError('Polygon must be valid JSON.')
+    if not isinstance(value, list):
+        raise ValueError('Polygon must be a JSON array of {"lat": ..., "lng": ...} objects.')
+    points = []
+    for i, vertex in enumerate(value):
+        try:
+            lat, lng = float(vertex['lat']), float(vertex['lng'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Vertex {i} must be an object with numeric "lat" and "lng".')
+        # NaN fails both comparisons
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f'Vertex {i} is out of range.')
+        points.append((lat, lng))
+    if 0 < len(points) < 3:
+        raise ValueError('A polygon needs at least 3 vertices.')
+    return points
+
+
+def polygon_text(points):
+    """Canonical stored form: compact JSON, vertices rounded to POLYGON_DECIMALS"""
+    return json.dumps(
+        [{'lat': round(lat, POLYGON_DECIMALS), 'lng': round(lng, POLYGON_DECIMALS)} for lat, lng in points],
+        separators=(',', ':'),
+    )
+
+
+def normalize_polygon(value):
+    """Validate polygon input and return its canonical text, ValueError if invalid"""
+    return polygon_text(validate_polygon(value))
+
+
+def encode_polyline(points, decimals=POLYLINE_DECIMALS):
+    """Encoded polyline (Google's algorithm) of a list of (lat, lng) tuples"""
+    factor = 10 ** decimals
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat, lng = round(lat * factor), round(lng * factor)
+        for delta in (lat - prev_lat, lng - prev_lng):
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                chunks.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            chunks.append(chr(delta + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(chunks)
+
+
+def compute_geometry(latitude, longitude, polygon_coordinates, entrance=None):
+    """
+    Derive the stored geometry columns of a parking.
+    Marker precedence: first entrance, then explicit lat/lng, then polygon centroid.
+    `entrance` is a (lat, lng) tuple or None.
+    """
+    points = parse_polygon(polygon_coordinates)
+
+    centroid = (None, None)
+    bbox = (None, None, None, None)
+    if points:
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+        centroid = (sum(lats) / len(lats), sum(lngs) / len(lngs))
+        bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    if entrance and entrance[0] and entrance[1]:
+        marker = entrance
+    elif latitude is not None and longitude is not None:
+        marker = (latitude, longitude)
+    elif len(points) >= 3:
+        marker = centroid
+    else:
+        marker = (None, None)
+
+    return dict(zip(GEOMETRY_FIELDS, (*marker, *centroid, *bbox)))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from parkings.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute live counters and daily rollups from the spot, session and fine tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Only rebuild the daily rollups of the last N days (default: all history)",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] is not None:
+            since = timezone.localdate() - timedelta(days=options['days'])
+        rebuilt_since = rebuild_counters(since)
+        if rebuilt_since and rebuilt_since != since:
+            self.stdout.write(
+                f"Daily rollups before {rebuilt_since} kept as they are: "
+                "their rows were exported to files by archive_history."
+            )
+        self.stdout.write(self.style.SUCCESS("Parking counters rebuilt."))
@@ -0,0 +1,143 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:46
+
+import json
+from django.db import migrations, models
+
+# Frozen copies of parkings.geometry as of this migration
+
+GEOMETRY_FIELDS = (
+    'marker_latitude', 'marker_longitude',
+    'centroid_latitude', 'centroid_longitude',
+    'bbox_min_latitude', 'bbox_min_longitude',
+    'bbox_max_latitude', 'bbox_max_longitude',
+)
+
+
+def parse_polygon(raw):
+    try:
+        coords = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(coords, list):
+        return []
+    points = []
+    for c in coords:
+        try:
+            points.append((float(c['lat']), float(c['lng'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return points
+
+
+def compute_geometry(latitude, longitude, polygon_coordinates, entrance=None):
+    points = parse_polygon(polygon_coordinates)
+
+    centroid = (None, None)
+    bbox = (None, None, None, None)
+    if points:
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+        centroid = (sum(lats) / len(lats), sum(lngs) / len(lngs))
+        bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    if entrance and entrance[0] and entrance[1]:
+        marker = entrance
+    elif latitude is not None and longitude is not None:
+        marker = (latitude, longitude)
+    elif len(points) >= 3:
+        marker = centroid
+    else:
+        marker = (None, None)
+
+    return dict(zip(GEOMETRY_FIELDS, (*marker, *centroid, *bbox)))
+
+
+def backfill_geometry(apps, schema_editor):
+    Parking = apps.get_model('parkings', 'Parking')
+    ParkingEntrance = apps.get_model('parkings', 'ParkingEntrance')
+
+    first_entrance = {}
+    for parking_id, lat, lng in ParkingEntrance.objects.order_by('-id').values_list('parking_id', 'latitude', 'longitude'):
+        first_entrance[parking_id] = (lat, lng)
+
+    batch = []
+    for parking in Parking.objects.all().iterator(chunk_size=500):
+        geometry = compute_geometry(
+            parking.latitude, parking.longitude, parking.polygon_coordinates,
+            first_entrance.get(parking.id),
+        )
+        for field, value in geometry.items():
+            setattr(parking, field, value)
+        batch.append(parking)
+        if len(batch) >= 500:
+            Parking.objects.bulk_update(batch, GEOMETRY_FIELDS)
+            batch = []
+    if batch:
+        Parking.objects.bulk_update(batch, GEOMETRY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0002_auto_20260208_1909'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parking',
+            name='bbox_max_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='bbox_max_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='bbox_min_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='bbox_min_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='centroid_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='centroid_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='marker_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parking',
+            name='marker_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='parking',
+            index=models.Index(fields=['city'], name='parkings_pa_city_f456b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parking',
+            index=models.Index(fields=['name'], name='parkings_pa_name_fd12ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parking',
+            index=models.Index(fields=['marker_latitude', 'marker_longitude'], name='parkings_pa_marker__95ddd0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parking',
+            index=models.Index(fields=['bbox_min_latitude', 'bbox_max_latitude', 'bbox_min_longitude', 'bbox_max_longitude'], name='parkings_pa_bbox_mi_494c37_idx'),
+        ),
+        migrations.RunPython(backfill_geometry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:51
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_counters(apps, schema_editor):
+    Parking = apps.get_model('parkings', 'Parking')
+    Spot = apps.get_model('parkings', 'Spot')
+    ParkingCounter = apps.get_model('parkings', 'ParkingCounter')
+    ParkingDailyCounter = apps.get_model('parkings', 'ParkingDailyCounter')
+    ParkingSession = apps.get_model('vehicles', 'ParkingSession')
+
+    spots = dict(
+        Spot.objects.values('parking_id').annotate(cnt=Count('id')).values_list('parking_id', 'cnt')
+    )
+    active = dict(
+        ParkingSession.objects.filter(is_active=True, parking_lot__isnull=False)
+        .values('parking_lot_id').annotate(cnt=Count('id')).order_by().values_list('parking_lot_id', 'cnt')
+    )
+    ParkingCounter.objects.bulk_create(
+        [
+            ParkingCounter(
+                parking_id=parking_id,
+                total_spots=spots.get(parking_id, 0),
+                active_sessions=active.get(parking_id, 0),
+            )
+            for parking_id in Parking.objects.values_list('id', flat=True)
+        ],
+        batch_size=1000,
+    )
+
+    daily = (
+        ParkingSession.objects.filter(parking_lot__isnull=False)
+        .annotate(day=TruncDate('start_time'))
+        .values('parking_lot_id', 'day')
+        .annotate(entries=Count('id'), revenue=Sum('total_cost'))
+        .order_by()
+    )
+    ParkingDailyCounter.objects.bulk_create(
+        [
+            ParkingDailyCounter(
+                parking_id=row['parking_lot_id'],
+                day=row['day'],
+                entries=row['entries'],
+                revenue=row['revenue'] or Decimal('0.00'),
+            )
+            for row in daily
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0003_parking_geometry'),
+        ('vehicles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParkingCounter',
+            fields=[
+                ('parking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='parkings.parking')),
+                ('total_spots', models.IntegerField(default=0)),
+                ('active_sessions', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParkingDailyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('entries', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('parking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counters', to='parkings.parking')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('parking', 'day'), name='unique_parking_daily_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
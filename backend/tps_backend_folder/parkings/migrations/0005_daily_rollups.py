@@ -0,0 +1,165 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:06
+
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Frozen copies of parkings.counters as of this migration, over the whole history
+
+
+def peak_occupancy(ParkingSession, ArchivedParkingSession):
+    # Highest number of concurrent active sessions reached on each day
+    events = []
+    rows = ParkingSession.objects.values_list(
+        'parking_lot_id', 'parking_lot__city', 'start_time', 'end_time', 'is_active',
+    )
+    archived = ArchivedParkingSession.objects.values_list(
+        'parking_lot_id', 'city', 'start_time', 'end_time', Value(False),
+    )
+    for parking_id, city, start, end, active in list(rows.iterator(chunk_size=5000)) + list(archived):
+        if active:
+            end = None
+        elif not end or end <= start:
+            continue
+        events.append((start, 1, parking_id, city or ''))
+        if end is not None:
+            events.append((end, -1, parking_id, city or ''))
+
+    # Ends sort before starts at the same instant
+    events.sort(key=lambda e: (e[0], e[1]))
+    parking_peaks, parking_running = {}, defaultdict(int)
+    city_peaks, city_running = {}, defaultdict(int)
+    for moment, delta, parking_id, city in events:
+        day = timezone.localdate(moment)
+        for key, peaks, running in ((parking_id, parking_peaks, parking_running), (city, city_peaks, city_running)):
+            if not key:
+                continue
+            peaks[key, day] = max(peaks.get((key, day), 0), running[key])
+            running[key] += delta
+            peaks[key, day] = max(peaks[key, day], running[key])
+    return parking_peaks, city_peaks
+
+
+def daily_totals(apps):
+    # {(kind, key, day): {field: value}} from live and archived sessions and fines
+    ParkingSession = apps.get_model('vehicles', 'ParkingSession')
+    ArchivedParkingSession = apps.get_model('vehicles', 'ArchivedParkingSession')
+    Fine = apps.get_model('vehicles', 'Fine')
+    ArchivedFine = apps.get_model('vehicles', 'ArchivedFine')
+    totals = defaultdict(lambda: defaultdict(int))
+
+    def add(rows, field, value_field=None):
+        for row in rows:
+            value = row[value_field] if value_field else row['cnt']
+            if value is None:
+                continue
+            if row['rollup_parking'] is not None:
+                totals['parking', row['rollup_parking'], row['day']][field] += value
+            totals['city', row['rollup_city'] or '', row['day']][field] += value
+
+    def grouped(queryset, time_field, parking_path, city_path, **aggregates):
+        return (
+            queryset.annotate(day=TruncDate(time_field))
+            .values('day', rollup_parking=F(parking_path), rollup_city=F(city_path))
+            .annotate(**aggregates)
+            .order_by()
+        )
+
+    session_aggregates = {'cnt': Count('id'), 'revenue': Sum('total_cost')}
+    for rows in (
+        grouped(ParkingSession.objects.all(), 'start_time', 'parking_lot_id', 'parking_lot__city', **session_aggregates),
+        grouped(ArchivedParkingSession.objects.all(), 'start_time', 'parking_lot_id', 'city', **session_aggregates),
+    ):
+        rows = list(rows)
+        add(rows, 'entries')
+        add(rows, 'revenue', 'revenue')
+
+    for fines, parking_path, city_path in (
+        (Fine.objects.all(), 'session__parking_lot_id', 'session__parking_lot__city'),
+        (ArchivedFine.objects.all(), 'parking_lot_id', 'city'),
+    ):
+        add(grouped(fines, 'issued_at', parking_path, city_path, cnt=Count('id')), 'fines_issued')
+        add(
+            grouped(fines.filter(status='paid', paid_at__isnull=False), 'paid_at', parking_path, city_path, cnt=Count('id')),
+            'fines_paid',
+        )
+
+    parking_peaks, city_peaks = peak_occupancy(ParkingSession, ArchivedParkingSession)
+    for (parking_id, day), peak in parking_peaks.items():
+        totals['parking', parking_id, day]['peak_occupancy'] = peak
+    for (city, day), peak in city_peaks.items():
+        totals['city', city, day]['peak_occupancy'] = peak
+    return totals
+
+
+def backfill_rollups(apps, schema_editor):
+    Parking = apps.get_model('parkings', 'Parking')
+    ParkingDailyCounter = apps.get_model('parkings', 'ParkingDailyCounter')
+    CityDailyCounter = apps.get_model('parkings', 'CityDailyCounter')
+
+    totals = daily_totals(apps)
+    parking_ids = set(Parking.objects.values_list('id', flat=True))
+    # 0004 only filled entries and revenue, recreate the rows with every column
+    ParkingDailyCounter.objects.all().delete()
+    ParkingDailyCounter.objects.bulk_create(
+        [
+            ParkingDailyCounter(parking_id=key, day=day, **values)
+            for (kind, key, day), values in totals.items()
+            if kind == 'parking' and key in parking_ids
+        ],
+        batch_size=1000,
+    )
+    CityDailyCounter.objects.bulk_create(
+        [
+            CityDailyCounter(city=key, day=day, **values)
+            for (kind, key, day), values in totals.items()
+            if kind == 'city'
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0004_parking_counters'),
+        ('vehicles', '0007_archived_fine_parking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingdailycounter',
+            name='fines_issued',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parkingdailycounter',
+            name='fines_paid',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parkingdailycounter',
+            name='peak_occupancy',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CityDailyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('entries', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('fines_issued', models.IntegerField(default=0)),
+                ('fines_paid', models.IntegerField(default=0)),
+                ('peak_occupancy', models.IntegerField(default=0)),
+                ('city', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='parkings_ci_day_0286cc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('city', 'day'), name='unique_city_daily_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
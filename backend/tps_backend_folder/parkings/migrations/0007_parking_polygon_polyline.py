@@ -0,0 +1,86 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:25
+
+import json
+import parkings.models
+from django.db import migrations, models
+
+# Frozen copies of parkings.geometry as of this migration
+
+POLYGON_FIELDS = ('polygon_coordinates', 'polygon_polyline')
+POLYGON_DECIMALS = 6
+POLYLINE_DECIMALS = 5
+
+
+def parse_polygon(raw):
+    try:
+        coords = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(coords, list):
+        return []
+    points = []
+    for c in coords:
+        try:
+            points.append((float(c['lat']), float(c['lng'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return points
+
+
+def polygon_text(points):
+    return json.dumps(
+        [{'lat': round(lat, POLYGON_DECIMALS), 'lng': round(lng, POLYGON_DECIMALS)} for lat, lng in points],
+        separators=(',', ':'),
+    )
+
+
+def encode_polyline(points):
+    factor = 10 ** POLYLINE_DECIMALS
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat, lng = round(lat * factor), round(lng * factor)
+        for delta in (lat - prev_lat, lng - prev_lng):
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                chunks.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            chunks.append(chr(delta + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(chunks)
+
+
+def normalize_polygons(apps, schema_editor):
+    Parking = apps.get_model('parkings', 'Parking')
+    batch = []
+    for parking in Parking.objects.all().iterator(chunk_size=500):
+        points = parse_polygon(parking.polygon_coordinates)
+        parking.polygon_coordinates = polygon_text(points)
+        parking.polygon_polyline = encode_polyline(points)
+        batch.append(parking)
+        if len(batch) >= 500:
+            Parking.objects.bulk_update(batch, POLYGON_FIELDS)
+            batch = []
+    if batch:
+        Parking.objects.bulk_update(batch, POLYGON_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0006_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parking',
+            name='polygon_polyline',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AlterField(
+            model_name='parking',
+            name='polygon_coordinates',
+            field=models.TextField(default='[]', help_text='JSON array of coordinates forming the parking polygon', validators=[parkings.models.validate_polygon_coordinates]),
+        ),
+        migrations.RunPython(normalize_polygons, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
 from django.db import models
+from django.utils import timezone
 from django.db.models.fields import DecimalField
+from django.core.exceptions import ValidationError
 import json
+from .geometry import (
+    GEOMETRY_FIELDS, POLYGON_FIELDS, compute_geometry, encode_polyline, parse_polygon,
+    polygon_text, validate_polygon,
+)
 
 DEFAULT_TARIFF_JSON = """{
     "type": "HOURLY_LINEAR",
@@ -12,6 +18,14 @@ DEFAULT_TARIFF_JSON = """{
     "flex_rules": []
 }"""
 
+
+def validate_polygon_coordinates(value):
+    try:
+        validate_polygon(value)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
 class City(models.Model):
     """
     Master list of cities - only modifiable by superusers
@@ -39,18 +53,57 @@ class Parking(models.Model):
     longitude = models.FloatField(null=True, blank=True)
     polygon_coordinates = models.TextField(
         default='[]',
+        validators=[validate_polygon_coordinates],
         help_text='JSON array of coordinates forming the parking polygon'
     )
 
+    # Derived on save from polygon/entrances, never edited directly
+    marker_latitude = models.FloatField(null=True, blank=True, editable=False)
+    marker_longitude = models.FloatField(null=True, blank=True, editable=False)
+    centroid_latitude = models.FloatField(null=True, blank=True, editable=False)
+    centroid_longitude = models.FloatField(null=True, blank=True, editable=False)
+    bbox_min_latitude = models.FloatField(null=True, blank=True, editable=False)
+    bbox_min_longitude = models.FloatField(null=True, blank=True, editable=False)
+    bbox_max_latitude = models.FloatField(null=True, blank=True, editable=False)
+    bbox_max_longitude = models.FloatField(null=True, blank=True, editable=False)
+    # Encoded polyline of the polygon, served by the map with ?polygon_format=polyline
+    polygon_polyline = models.TextField(default='', blank=True, editable=False)
+
     class Meta:
         indexes = [
             models.Index(fields=['city']),      
             models.Index(fields=['name']),     
+            models.Index(fields=['marker_latitude', 'marker_longitude']),
+            models.Index(fields=['bbox_min_latitude', 'bbox_max_latitude', 'bbox_min_longitude', 'bbox_max_longitude']),
         ]
 
     def __str__(self):
         return f"{self.name} ({self.city})"
 
+    def save(self, *args, **kwargs):
+        self.refresh_geometry()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(GEOMETRY_FIELDS) | set(POLYGON_FIELDS)
+        super().save(*args, **kwargs)
+
+    def refresh_geometry(self):
+        """
+        Recompute marker, centroid and bounding box columns (no save).
+        The polygon is rewritten in canonical form, so the stored text is always
+        valid JSON and can be embedded in responses as is (see RawJSON).
+        """
+        points = parse_polygon(self.polygon_coordinates)
+        self.polygon_coordinates = polygon_text(points)
+        self.polygon_polyline = encode_polyline(points)
+        entrance = None
+        if self.pk:
+            entrance = self.entrances.order_by('id').values_list('latitude', 'longitude').first()
+        for field, value in compute_geometry(
+            self.latitude, self.longitude, self.polygon_coordinates, entrance
+        ).items():
+            setattr(self, field, value)
+
     def get_polygon_coords(self):
         """Returns polygon coordinates as list of dicts"""
         try:
@@ -63,39 +116,14 @@ class Parking(models.Model):
         self.polygon_coordinates = json.dumps(coords_list)
 
     def calculate_centroid(self):
-        """Calculate centroid of polygon for marker placement"""
-        coords = self.get_polygon_coords()
-        if not coords:
-            return None, None
-        
-        lat_sum = sum(c['lat'] for c in coords)
-        lng_sum = sum(c['lng'] for c in coords)
-        count = len(coords)
-        
-        return lat_sum / count, lng_sum / count
+        """Centroid of the polygon, stored by refresh_geometry()"""
+        return self.centroid_latitude, self.centroid_longitude
 
     def get_marker_position(self):
         """
-        Returns the marker position using cached entrances to avoid N+1 queries.
+        Returns the marker position stored by refresh_geometry().
         """
-
-        entrances = list(self.entrances.all()) 
-        
-        if entrances:
-            entrance = entrances[0] 
-            if entrance.latitude and entrance.longitude:
-                return (entrance.latitude, entrance.longitude)
-
-        if self.latitude is not None and self.longitude is not None:
-            return (self.latitude, self.longitude)
-
-        coords = self.get_polygon_coords()
-        if len(coords) >= 3:
-            sum_lat = sum(c['lat'] for c in coords)
-            sum_lng = sum(c['lng'] for c in coords)
-            return (sum_lat / len(coords), sum_lng / len(coords))
-        
-        return (None, None)
+        return (self.marker_latitude, self.marker_longitude)
 
     @property
     def total_spots(self):
@@ -134,4 +162,94 @@ class Spot(models.Model):
     is_occupied = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"Spot {self.number} at {self.parking.name}"
\ No newline at end of file
+        return f"Spot {self.number} at {self.parking.name}"
+
+class ParkingCounter(models.Model):
+    """
+    Live counters of a parking, maintained by parkings.counters
+    in the same transaction as the session/spot write.
+    """
+    parking = models.OneToOneField(
+        Parking,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+    )
+    total_spots = models.IntegerField(default=0)
+    active_sessions = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Counters for {self.parking_id}"
+
+
+class DailyRollup(models.Model):
+    """
+    Per-day activity on the local calendar day: entries and revenue by session
+    start, fines by issue and payment day, highest concurrent active sessions.
+    """
+    day = models.DateField()
+    entries = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fines_issued = models.IntegerField(default=0)
+    fines_paid = models.IntegerField(default=0)
+    peak_occupancy = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ParkingDailyCounter(DailyRollup):
+    parking = models.ForeignKey(Parking, on_delete=models.CASCADE, related_name='daily_counters')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['parking', 'day'], name='unique_parking_daily_counter'),
+        ]
+
+    def __str__(self):
+        return f"Counters for {self.parking_id} on {self.day}"
+
+
+class CityDailyCounter(DailyRollup):
+    """
+    Same figures per city. Sessions and fines without a parking are
+    counted under the empty city, so the rows also add up to global totals.
+    """
+    city = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'day'], name='unique_city_daily_counter'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"Counters for {self.city or '-'} on {self.day}"
+
+
+class ChangeLog(models.Model):
+    """
+    Append-only log of inserted, updated and deleted rows of the synced
+    resources (parkings, spots, sessions, fines). The id is the monotonic
+    cursor clients pass back as ?since= (see parkings.changes).
+    Plain id columns, entries must outlive the rows they describe.
+    """
+    resource = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    parking_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['resource', 'id'], name='changelog_resource_idx'),
+            models.Index(fields=['resource', 'parking_id', 'id'], name='changelog_parking_idx'),
+            models.Index(fields=['resource', 'owner_id', 'id'], name='changelog_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.resource} {self.object_id}{' deleted' if self.deleted else ''}"
@@ -1,7 +1,21 @@
 import json
 from rest_framework import serializers
+from tps_backend.renderers import RawJSON, supports_raw_json
+from .geometry import normalize_polygon
 from .models import Parking, Spot, ParkingEntrance, City
 
+
+def stored_polygon(obj, context):
+    """
+    The stored polygon, embedded as is when the response renderer takes raw
+    JSON (the text is kept canonical on save), decoded otherwise.
+    """
+    request = context.get('request')
+    if supports_raw_json(getattr(request, 'accepted_renderer', None)):
+        return RawJSON(obj.polygon_coordinates)
+    return obj.get_polygon_coords()
+
+
 class CitySerializer(serializers.ModelSerializer):
     # Mappiamo i campi del model ai nomi attesi dal frontend
     latitude = serializers.FloatField(source='center_latitude')
@@ -20,6 +34,7 @@ class ParkingEntranceSerializer(serializers.ModelSerializer):
 
 class ParkingMapSerializer(serializers.ModelSerializer):
     polygon_coords = serializers.SerializerMethodField()
+    polygon_polyline = serializers.SerializerMethodField()
     marker_latitude = serializers.SerializerMethodField()
     marker_longitude = serializers.SerializerMethodField()
 
@@ -35,20 +50,34 @@ class ParkingMapSerializer(serializers.ModelSerializer):
             'marker_latitude', 
             'marker_longitude',
             'polygon_coords', 
+            'polygon_polyline',
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # context['polygon_format'] == 'polyline' swaps polygon_coords for the encoded polyline
+        if self.context.get('polygon_format') == 'polyline':
+            self.fields.pop('polygon_coords')
+        else:
+            self.fields.pop('polygon_polyline')
+
     def get_polygon_coords(self, obj):
-        return obj.get_polygon_coords()
+        if not self.context.get('include_polygons', True):
+            return []
+        return stored_polygon(obj, self.context)
+
+    def get_polygon_polyline(self, obj):
+        if not self.context.get('include_polygons', True):
+            return ''
+        return obj.polygon_polyline
 
     def get_marker_latitude(self, obj):
         if obj.latitude: return obj.latitude
-        lat, _ = obj.get_marker_position()
-        return lat
+        return obj.marker_latitude
 
     def get_marker_longitude(self, obj):
         if obj.longitude: return obj.longitude
-        _, lng = obj.get_marker_position()
-        return lng
+        return obj.marker_longitude
     
 class ParkingSerializer(serializers.ModelSerializer):
     total_spots = serializers.IntegerField(read_only=True, source='annotated_total_spots')
@@ -62,10 +91,13 @@ class ParkingSerializer(serializers.ModelSerializer):
     )
     
     polygon_coords = serializers.SerializerMethodField()
-    marker_latitude = serializers.SerializerMethodField()
-    marker_longitude = serializers.SerializerMethodField()
+    marker_latitude = serializers.FloatField(read_only=True)
+    marker_longitude = serializers.FloatField(read_only=True)
     entrances = ParkingEntranceSerializer(many=True, read_only=True)
 
+    # Query plan of list endpoints, see tps_backend.query_plans
+    prefetch_related_fields = ('entrances',)
+
     class Meta:
         model = Parking
         fields = [
@@ -80,36 +112,19 @@ class ParkingSerializer(serializers.ModelSerializer):
 
     def get_polygon_coords(self, obj):
         """Return polygon coordinates as list"""
-        return obj.get_polygon_coords()
+        return stored_polygon(obj, self.context)
 
-    def get_marker_latitude(self, obj):
-        """Return marker latitude (entrance or centroid)"""
-        lat, lng = obj.get_marker_position()
-        return lat
-
-    def get_marker_longitude(self, obj):
-        """Return marker longitude (entrance or centroid)"""
-        lat, lng = obj.get_marker_position()
-        return lng
-
-    def create(self, validated_data):
+    def validate(self, attrs):
+        # polygon_coordinates is not a declared field, read it from the raw input
         polygon_coords = self.initial_data.get('polygon_coordinates')
         if polygon_coords:
-            if isinstance(polygon_coords, str):
-                validated_data['polygon_coordinates'] = polygon_coords
-            else:
-                validated_data['polygon_coordinates'] = json.dumps(polygon_coords)
-        
-        return super().create(validated_data)
+            try:
+                attrs['polygon_coordinates'] = normalize_polygon(polygon_coords)
+            except ValueError as e:
+                raise serializers.ValidationError({'polygon_coordinates': str(e)})
+        return attrs
 
     def update(self, instance, validated_data):
-        polygon_coords = self.initial_data.get('polygon_coordinates')
-        if polygon_coords:
-            if isinstance(polygon_coords, str):
-                validated_data['polygon_coordinates'] = polygon_coords
-            else:
-                validated_data['polygon_coordinates'] = json.dumps(polygon_coords)
-        
         # Handle polygon coordinates
         polygon_coords = validated_data.pop('polygon_coords', None)
         if polygon_coords is not None:
@@ -120,4 +135,32 @@ class ParkingSerializer(serializers.ModelSerializer):
 class SpotSerializer(serializers.ModelSerializer):
     class Meta:
         model = Spot
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+# Upper bound of (start_time, duration) pairs priced in one quote request
+MAX_QUOTE_ITEMS = 1000
+
+class QuoteItemSerializer(serializers.Serializer):
+    start_time = serializers.DateTimeField(required=False)
+    duration_minutes = serializers.IntegerField(min_value=0, max_value=60 * 24 * 31)
+
+class QuoteRequestSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=QuoteItemSerializer(),
+        allow_empty=False,
+        max_length=MAX_QUOTE_ITEMS,
+    )
+
+class TariffSimulationSerializer(serializers.Serializer):
+    tariff_config_json = serializers.JSONField()
+    days = serializers.IntegerField(min_value=1, max_value=365, default=30)
+
+    def validate_tariff_config_json(self, value):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError("Invalid JSON.")
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Tariff config must be a JSON object.")
+        return value
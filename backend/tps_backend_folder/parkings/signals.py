@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from tps_backend.versioning import bump_version
+from .changes import PARKING, SPOT, log_change
+from .counters import record_spot_added, record_spot_removed
+from .geometry import GEOMETRY_FIELDS
+from .models import City, Parking, ParkingEntrance, Spot
+from .spatial import EXTENT_FIELDS, GEOMETRY_VERSION, parking_extent
+from .tariffs import invalidate_tariff
+from .tiles import invalidate_tiles
+
+CITY_VERSION = 'parkings:cities'
+
+
+def _extent(parking):
+    return parking_extent(*(getattr(parking, field) for field in EXTENT_FIELDS))
+
+
+def _invalidate_on_commit(*extents):
+    # Bump after commit so other workers never rebuild from uncommitted rows
+    def invalidate():
+        bump_version(GEOMETRY_VERSION)
+        for extent in set(extents):
+            invalidate_tiles(extent)
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=Parking)
+def remember_previous_extent(sender, instance, **kwargs):
+    """Tiles the parking is moving out of must be invalidated too"""
+    instance._previous_extent = None
+    if instance.pk:
+        row = Parking.objects.filter(pk=instance.pk).values_list(*EXTENT_FIELDS).first()
+        if row:
+            instance._previous_extent = parking_extent(*row)
+
+
+@receiver(post_save, sender=Parking)
+@receiver(post_delete, sender=Parking)
+def invalidate_parking_geometry(sender, instance, **kwargs):
+    _invalidate_on_commit(getattr(instance, '_previous_extent', None), _extent(instance))
+
+
+@receiver(post_save, sender=Parking)
+@receiver(post_delete, sender=Parking)
+def invalidate_parking_tariff(sender, instance, **kwargs):
+    invalidate_tariff(instance.pk)
+
+
+@receiver(post_save, sender=ParkingEntrance)
+@receiver(post_delete, sender=ParkingEntrance)
+def refresh_parking_marker(sender, instance, **kwargs):
+    """The first entrance drives the marker, keep the stored columns in sync"""
+    parking = Parking.objects.filter(pk=instance.parking_id).first()
+    if parking is None:
+        # Parking is being cascade-deleted
+        return
+    previous_extent = _extent(parking)
+    parking.refresh_geometry()
+    Parking.objects.filter(pk=parking.pk).update(
+        **{field: getattr(parking, field) for field in GEOMETRY_FIELDS}
+    )
+    log_change(PARKING, parking.pk, parking_id=parking.pk)
+    _invalidate_on_commit(previous_extent, _extent(parking))
+
+
+@receiver(post_save, sender=Spot)
+def count_spot_added(sender, instance, created, **kwargs):
+    if created:
+        record_spot_added(instance)
+
+
+@receiver(post_delete, sender=Spot)
+def count_spot_removed(sender, instance, origin=None, **kwargs):
+    # Cascading from a parking delete: its counter row goes away with it
+    if isinstance(origin, Parking) or getattr(origin, 'model', None) is Parking:
+        return
+    record_spot_removed(instance)
+
+
+@receiver(post_save, sender=Parking)
+@receiver(post_delete, sender=Parking)
+def log_parking_change(sender, instance, signal, **kwargs):
+    log_change(PARKING, instance.pk, parking_id=instance.pk, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=Spot)
+@receiver(post_delete, sender=Spot)
+def log_spot_change(sender, instance, signal, **kwargs):
+    log_change(SPOT, instance.pk, parking_id=instance.parking_id, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_cities(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(CITY_VERSION))
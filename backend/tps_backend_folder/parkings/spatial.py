@@ -0,0 +1,121 @@
+import math
+import threading
+from tps_backend.versioning import get_version
+
+# Version name bumped whenever a parking's geometry changes
+GEOMETRY_VERSION = 'parkings:geometry'
+
+# Stored columns that make up a parking's indexed extent
+EXTENT_FIELDS = (
+    'marker_latitude', 'marker_longitude',
+    'bbox_min_latitude', 'bbox_min_longitude',
+    'bbox_max_latitude', 'bbox_max_longitude',
+)
+
+# ~1.1 km at the equator, a few hundred parkings per cell in dense cities
+DEFAULT_CELL_SIZE = 0.01
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid over parking extents.
+    Each parking is registered in every cell its bounding box touches,
+    so a viewport query only visits the cells under the viewport.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.extents = {}
+
+    def __len__(self):
+        return len(self.extents)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def insert(self, item_id, min_lat, min_lng, max_lat, max_lng):
+        self.extents[item_id] = (min_lat, min_lng, max_lat, max_lng)
+        row_min, col_min = self._cell(min_lat, min_lng)
+        row_max, col_max = self._cell(max_lat, max_lng)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                self.cells.setdefault((row, col), []).append(item_id)
+
+    def query(self, south, west, north, east):
+        """Return the ids whose extent intersects the given bounding box"""
+        row_min, col_min = self._cell(south, west)
+        row_max, col_max = self._cell(north, east)
+        cell_count = (row_max - row_min + 1) * (col_max - col_min + 1)
+
+        # Zoomed far out: scanning every extent is cheaper than walking empty cells
+        if cell_count > len(self.extents):
+            candidates = self.extents.keys()
+        else:
+            candidates = set()
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    candidates.update(self.cells.get((row, col), ()))
+
+        result = set()
+        for item_id in candidates:
+            min_lat, min_lng, max_lat, max_lng = self.extents[item_id]
+            if min_lat <= north and max_lat >= south and min_lng <= east and max_lng >= west:
+                result.add(item_id)
+        return result
+
+
+def parse_bbox(raw):
+    """
+    Parse a 'south,west,north,east' query parameter.
+    Raises ValueError on malformed or inverted boxes.
+    """
+    parts = [float(p) for p in raw.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must have 4 comma separated values')
+    south, west, north, east = parts
+    if not all(math.isfinite(p) for p in parts):
+        raise ValueError('bbox values must be finite numbers')
+    if south > north or west > east:
+        raise ValueError('bbox must be ordered as south,west,north,east')
+    return south, west, north, east
+
+
+def parking_extent(marker_lat, marker_lng, min_lat, min_lng, max_lat, max_lng):
+    """Union of the stored polygon bounding box and the marker point"""
+    lats = [v for v in (marker_lat, min_lat, max_lat) if v is not None]
+    lngs = [v for v in (marker_lng, min_lng, max_lng) if v is not None]
+    if not lats or not lngs:
+        return None
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def build_parking_index():
+    from .models import Parking
+
+    index = GridIndex()
+    rows = Parking.objects.values_list('id', *EXTENT_FIELDS)
+    for parking_id, *geometry in rows.iterator(chunk_size=2000):
+        extent = parking_extent(*geometry)
+        if extent:
+            index.insert(parking_id, *extent)
+    return index
+
+
+_index_lock = threading.Lock()
+_cached_index = {'version': None, 'index': None}
+
+
+def get_parking_index():
+    """
+    Return the process-wide parking index, rebuilding it only when
+    the shared geometry version has moved since the last build.
+    """
+    version = get_version(GEOMETRY_VERSION)
+    if _cached_index['version'] == version:
+        return _cached_index['index']
+    with _index_lock:
+        if _cached_index['version'] != version:
+            _cached_index['index'] = build_parking_index()
+            _cached_index['version'] = version
+    return _cached_index['index']
@@ -0,0 +1,242 @@
+import json
+import threading
+import numpy as np
+from dataclasses import dataclass
+from django.utils import timezone
+
+MINUTES_PER_DAY = 24 * 60
+
+FIXED_DAILY = 'FIXED_DAILY'
+HOURLY_LINEAR = 'HOURLY_LINEAR'
+HOURLY_VARIABLE = 'HOURLY_VARIABLE'
+
+
+def _parse_clock(value, default):
+    """'HH:MM' -> minutes since midnight"""
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return (int(hours) * 60 + int(minutes)) % MINUTES_PER_DAY
+    except (TypeError, ValueError):
+        return default
+
+
+def _rate(config, key, default):
+    try:
+        return float(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class FlexRule:
+    """Multiplier applied to the base rate while elapsed time is in [from, to) minutes"""
+    from_minutes: float
+    to_minutes: float
+    multiplier: float
+
+
+@dataclass(frozen=True)
+class CompiledTariff:
+    """
+    Immutable pricing object compiled from a parking's tariff_config_json.
+    Rates are per hour. daily_rate only prices FIXED_DAILY (proportionally,
+    capped at one daily_rate); hourly types are capped per 24h block of a
+    session only by an explicit daily_cap (0 = no cap).
+    """
+    type: str
+    daily_rate: float
+    day_rate: float
+    night_rate: float
+    night_start: int
+    night_end: int
+    daily_cap: float = 0.0
+    flex_rules: tuple = ()
+
+    def is_night(self, minute_of_day):
+        if self.night_start == self.night_end:
+            return False
+        if self.night_start > self.night_end:
+            return minute_of_day >= self.night_start or minute_of_day < self.night_end
+        return self.night_start <= minute_of_day < self.night_end
+
+    def multiplier(self, elapsed_minutes):
+        if self.type != HOURLY_VARIABLE:
+            return 1.0
+        for rule in self.flex_rules:
+            if rule.from_minutes <= elapsed_minutes < rule.to_minutes:
+                return rule.multiplier
+        return 1.0
+
+    def price(self, start_time, duration_minutes):
+        """Price of a single session, same arithmetic as price_many()"""
+        if duration_minutes <= 0:
+            return 0.00
+        return float(self.price_many([local_minute_of_day(start_time)], [duration_minutes])[0])
+
+    def _cumulative_base(self, t):
+        """Integral of the day/night base rate (per minute) from midnight to t minutes"""
+        knots = sorted({0, self.night_start, self.night_end, MINUTES_PER_DAY})
+        values = [0.0]
+        for a, b in zip(knots, knots[1:]):
+            rate = self.night_rate if self.is_night(a) else self.day_rate
+            values.append(values[-1] + rate / 60.0 * (b - a))
+        days, minute = np.divmod(t, MINUTES_PER_DAY)
+        return days * values[-1] + np.interp(minute, knots, values)
+
+    def _multiplier_intervals(self):
+        """Flex multipliers as contiguous [from, to) elapsed intervals covering [0, inf)"""
+        bounds = sorted({0.0, *(r.from_minutes for r in self.flex_rules), *(r.to_minutes for r in self.flex_rules)})
+        bounds = [b for b in bounds if b >= 0] + [np.inf]
+        return [
+            (a, b, self.multiplier(a if b == np.inf else (a + b) / 2))
+            for a, b in zip(bounds, bounds[1:])
+        ]
+
+    def price_many(self, start_minutes, durations):
+        """
+        Vectorized price(): start_minutes are local minutes since midnight,
+        durations in minutes. Loops only over flex intervals and, with a daily_cap, 24h blocks.
+        """
+        start = np.asarray(start_minutes, dtype=float)
+        duration = np.maximum(np.asarray(durations, dtype=float), 0.0)
+        if duration.size == 0:
+            return np.zeros(0)
+
+        if self.type == FIXED_DAILY:
+            return np.round(np.minimum(duration / 60.0 * self.daily_rate / 24.0, self.daily_rate), 2)
+
+        intervals = self._multiplier_intervals()
+
+        def cost_between(a, b):
+            cost = np.zeros_like(start)
+            for lo, hi, multiplier in intervals:
+                seg_a = np.clip(a, lo, hi)
+                seg_b = np.clip(b, lo, hi)
+                cost += multiplier * (self._cumulative_base(start + seg_b) - self._cumulative_base(start + seg_a))
+            return cost
+
+        if self.daily_cap <= 0:
+            return np.round(cost_between(np.zeros_like(duration), duration), 2)
+
+        total = np.zeros_like(start)
+        blocks = int(np.ceil(duration.max() / MINUTES_PER_DAY))
+        for k in range(blocks):
+            a = np.minimum(duration, k * MINUTES_PER_DAY)
+            b = np.minimum(duration, (k + 1) * MINUTES_PER_DAY)
+            total += np.minimum(cost_between(a, b), self.daily_cap)
+        return np.round(total, 2)
+
+
+# Used when the stored config cannot be parsed, the historical flat 2.00/h
+FALLBACK_TARIFF = CompiledTariff(
+    type=HOURLY_LINEAR, daily_rate=0.0, day_rate=2.00, night_rate=2.00,
+    night_start=0, night_end=0,
+)
+
+
+def local_minute_of_day(moment):
+    local = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    return local.hour * 60 + local.minute + local.second / 60.0
+
+
+def compile_tariff(raw):
+    """Compile tariff_config_json (text or dict) into a CompiledTariff"""
+    try:
+        config = json.loads(raw) if isinstance(raw, str) else raw
+        if not isinstance(config, dict):
+            return FALLBACK_TARIFF
+    except (TypeError, ValueError):
+        return FALLBACK_TARIFF
+
+    day_rate = _rate(config, 'day_base_rate', 2.00)
+    flex_rules = []
+    for rule in config.get('flex_rules') or []:
+        if not isinstance(rule, dict) or rule.get('rule_type', 'DURATION') != 'DURATION':
+            continue
+        # Manager app writes duration_*_hours, user app reads *_hours
+        start = rule.get('duration_from_hours', rule.get('from_hours'))
+        end = rule.get('duration_to_hours', rule.get('to_hours'))
+        try:
+            flex_rules.append(FlexRule(
+                from_minutes=float(start) * 60,
+                to_minutes=float(end) * 60,
+                multiplier=float(rule.get('multiplier', rule.get('modifier', 1.0))),
+            ))
+        except (TypeError, ValueError):
+            continue
+
+    return CompiledTariff(
+        type=config.get('type') or HOURLY_LINEAR,
+        daily_rate=_rate(config, 'daily_rate', 20.00),
+        daily_cap=_rate(config, 'daily_cap', 0.0),
+        day_rate=day_rate,
+        night_rate=_rate(config, 'night_base_rate', day_rate),
+        night_start=_parse_clock(config.get('night_start_time'), 22 * 60),
+        night_end=_parse_clock(config.get('night_end_time'), 6 * 60),
+        flex_rules=tuple(flex_rules),
+    )
+
+
+def simulate(tariff, start_minutes, durations, current_costs):
+    """
+    Replay historical sessions through a tariff.
+    All inputs are equal-length arrays; returns projected revenue and price distribution.
+    """
+    prices = tariff.price_many(start_minutes, durations)
+    current = np.asarray(current_costs, dtype=float)
+    if prices.size == 0:
+        return {
+            'sessions': 0,
+            'current_revenue': 0.0,
+            'projected_revenue': 0.0,
+            'revenue_delta': 0.0,
+            'average_price': 0.0,
+            'price_percentiles': {},
+            'price_histogram': {'bins': [], 'counts': []},
+        }
+
+    counts, edges = np.histogram(prices, bins=min(20, max(1, int(np.unique(prices).size))))
+    percentiles = np.percentile(prices, [10, 25, 50, 75, 90])
+    projected = float(prices.sum())
+    current_total = float(current.sum())
+    return {
+        'sessions': int(prices.size),
+        'current_revenue': round(current_total, 2),
+        'projected_revenue': round(projected, 2),
+        'revenue_delta': round(projected - current_total, 2),
+        'average_price': round(float(prices.mean()), 2),
+        'price_percentiles': {
+            f'p{p}': round(float(v), 2) for p, v in zip((10, 25, 50, 75, 90), percentiles)
+        },
+        'price_histogram': {
+            'bins': [round(float(e), 2) for e in edges],
+            'counts': [int(c) for c in counts],
+        },
+    }
+
+
+_cache_lock = threading.Lock()
+_compiled = {}
+
+
+def get_tariff(parking):
+    """
+    Compiled tariff of a parking, compiled once per process and config.
+    Entries are keyed by parking id and checked against the config text,
+    so a stale entry left by another worker's update is recompiled on sight.
+    """
+    source = parking.tariff_config_json
+    if parking.pk is None:
+        return compile_tariff(source)
+    entry = _compiled.get(parking.pk)
+    if entry is not None and entry[0] == source:
+        return entry[1]
+    tariff = compile_tariff(source)
+    with _cache_lock:
+        _compiled[parking.pk] = (source, tariff)
+    return tariff
+
+
+def invalidate_tariff(parking_id):
+    with _cache_lock:
+        _compiled.pop(parking_id, None)
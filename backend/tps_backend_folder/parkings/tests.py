@@ -1,3 +1,424 @@
-from django.test import TestCase
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from tps_backend.testing import QueryBudgetMixin
+from tps_backend.versioning import LOCAL_VERSION_TIMEOUT, bump_version, get_version
+from users.models import CustomUser
+from vehicles.models import ParkingSession, Vehicle
+from .changes import CHANGE_RETENTION, CURSOR_HEADER, CURSOR_SETTLE_SECONDS, prune_changes
+from .counters import rebuild_counters
+from .models import (
+    DEFAULT_TARIFF_JSON, ChangeLog, CityDailyCounter, Parking, ParkingCounter, ParkingDailyCounter, ParkingEntrance,
+    Spot,
+)
+from .spatial import GEOMETRY_VERSION
+from .tariffs import compile_tariff
 
-# Create your tests here.
+_sequence = count()
+
+
+class ParkingListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_superuser('admin@tps.test', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.parking = self.create_parking()
+
+    def create_parking(self):
+        n = next(_sequence)
+        lat, lng = 45.0 + n * 0.01, 7.0 + n * 0.01
+        parking = Parking(name=f'Parking {n}', city='Torino', address='Via Roma 1', latitude=lat, longitude=lng)
+        parking.set_polygon_coords([
+            {'lat': lat, 'lng': lng}, {'lat': lat + 0.001, 'lng': lng}, {'lat': lat + 0.001, 'lng': lng + 0.001},
+        ])
+        parking.save()
+        for i in range(2):
+            ParkingEntrance.objects.create(parking=parking, address_line=f'Gate {i}', latitude=lat, longitude=lng)
+            Spot.objects.create(parking=parking, number=str(i))
+        return parking
+
+    def add_parkings(self, rows):
+        for _ in range(rows):
+            self.create_parking()
+
+    def add_sessions(self, rows):
+        for _ in range(rows):
+            vehicle = Vehicle.objects.create(user=self.user, plate=f'TS{next(_sequence):05d}')
+            ParkingSession.objects.create(user=self.user, vehicle=vehicle, parking_lot=self.parking)
+
+    def add_spots(self, rows):
+        for _ in range(rows):
+            Spot.objects.create(parking=self.parking, number=f'S{next(_sequence)}')
+
+    def test_parking_list(self):
+        self.assertConstantQueries(lambda: self.client.get('/api/parkings/'), self.add_parkings)
+
+    def test_parking_detail(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(f'/api/parkings/{self.parking.id}/'),
+            lambda rows: ParkingEntrance.objects.bulk_create([
+                ParkingEntrance(parking=self.parking, address_line='Gate', latitude=45.0, longitude=7.0)
+                for _ in range(rows)
+            ]),
+        )
+
+    def test_parking_sessions(self):
+        url = f'/api/parkings/{self.parking.id}/sessions/'
+        self.assertConstantQueries(lambda: self.client.get(url), self.add_sessions)
+        self.assertConstantQueries(lambda: self.client.get(url + '?compact=1'), self.add_sessions)
+
+    def test_spot_lists(self):
+        self.assertConstantQueries(lambda: self.client.get('/api/spots/'), self.add_spots)
+        self.assertConstantQueries(
+            lambda: self.client.get(f'/api/parkings/{self.parking.id}/spots/'), self.add_spots,
+        )
+
+    def test_search_map(self):
+        self.assertConstantQueries(lambda: self.client.get('/api/parkings/search_map/'), self.add_parkings)
+
+
+class ParkingPolygonTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_superuser('admin@tps.test', 'password'))
+        self.parking = Parking.objects.create(
+            name='Parking', city='Torino', address='Via Roma 1',
+            polygon_coordinates='[{"lat": 38.5, "lng": -120.2}, {"lat": 40.7, "lng": -120.95}, {"lat": 43.252, "lng": -126.453}]',
+        )
+
+    def test_stored_canonical(self):
+        self.assertEqual(
+            self.parking.polygon_coordinates,
+            '[{"lat":38.5,"lng":-120.2},{"lat":40.7,"lng":-120.95},{"lat":43.252,"lng":-126.453}]',
+        )
+        self.assertEqual(self.parking.polygon_polyline, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_invalid_polygon_rejected(self):
+        url = f'/api/parkings/{self.parking.id}/'
+        for polygon in ('not json', [{'lat': 45.0, 'lng': 7.0}], [{'lat': 95.0, 'lng': 7.0}] * 3):
+            response = self.client.patch(url, {'polygon_coordinates': polygon}, format='json')
+            self.assertEqual(response.status_code, 400, polygon)
+        response = self.client.patch(url, {'polygon_coordinates': [{'lat': 45.1234567, 'lng': 7.0}] * 3}, format='json')
+        self.assertEqual(response.json()['polygon_coords'], [{'lat': 45.123457, 'lng': 7.0}] * 3)
+
+    def test_search_map_polyline(self):
+        row = self.client.get('/api/parkings/search_map/?polygon_format=polyline').data[0]
+        self.assertEqual(row['polygon_polyline'], self.parking.polygon_polyline)
+        self.assertNotIn('polygon_coords', row)
+
+    def test_search_map_columnar(self):
+        Parking.objects.create(name='No polygon', city='Torino', address='Via Po 1', latitude=45.0, longitude=7.0)
+        rows = self.client.get('/api/parkings/search_map/').json()
+        data = self.client.get('/api/parkings/search_map/?layout=columnar').data
+        scale = 10 ** data['precision']
+        lat = lng = offset = 0
+        for i, row in enumerate(rows):
+            self.assertEqual(data['ids'][i], row['id'])
+            polygon = []
+            for _ in range(data['polygon_lengths'][i]):
+                lat += data['polygon_deltas'][offset]
+                lng += data['polygon_deltas'][offset + 1]
+                offset += 2
+                polygon.append({'lat': lat / scale, 'lng': lng / scale})
+            self.assertEqual(polygon, row['polygon_coords'])
+        self.assertEqual(offset, len(data['polygon_deltas']))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VersionStampTests(TestCase):
+    def test_bump(self):
+        version = get_version(GEOMETRY_VERSION)
+        self.assertEqual(get_version(GEOMETRY_VERSION), version)
+        bump_version(GEOMETRY_VERSION)
+        self.assertGreater(get_version(GEOMETRY_VERSION), version)
+
+    def test_process_local_stamps_expire(self):
+        # A bump made by another process never reaches this cache, expiry bounds the staleness
+        version = get_version(GEOMETRY_VERSION)
+        later = time.time() + LOCAL_VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertNotEqual(get_version(GEOMETRY_VERSION), version)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_superuser('etag@tps.test', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(
+            name='Etag', city='Torino', address='Via Roma 1', latitude=45.0, longitude=7.0,
+        )
+        self.detail_url = f'/api/parkings/{self.parking.id}/'
+
+    def assertRevalidates(self, url, write, changed=True):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        if changed:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+        else:
+            self.assertEqual(response.status_code, 304)
+
+    def rename(self):
+        self.assertEqual(self.client.patch(self.detail_url, {'name': 'Renamed'}).status_code, 200)
+
+    def start_session(self):
+        vehicle = Vehicle.objects.create(user=self.user, plate='ET00001')
+        ParkingSession.objects.create(user=self.user, vehicle=vehicle, parking_lot=self.parking)
+
+    def add_entrance(self):
+        ParkingEntrance.objects.create(parking=self.parking, address_line='Gate', latitude=45.001, longitude=7.001)
+
+    def test_parking_detail(self):
+        self.assertRevalidates(self.detail_url, self.rename)
+        self.assertRevalidates(self.detail_url, self.add_entrance)
+        self.assertRevalidates(self.detail_url, lambda: Spot.objects.create(parking=self.parking, number='1'))
+        self.assertRevalidates(self.detail_url, self.start_session)
+
+    def test_parking_detail_ignores_other_parkings(self):
+        other = Parking.objects.create(name='Other', city='Torino', address='Via Po 1')
+        self.assertRevalidates(
+            self.detail_url, lambda: Spot.objects.create(parking=other, number='1'), changed=False,
+        )
+
+    def test_search_map(self):
+        url = '/api/parkings/search_map/'
+        self.assertRevalidates(url, self.rename)
+        self.assertRevalidates(url, self.add_entrance)
+        # Occupancy is not part of the map payload
+        self.assertRevalidates(url, lambda: Spot.objects.create(parking=self.parking, number='1'), changed=False)
+        self.assertRevalidates(url, self.start_session, changed=False)
+
+
+class DeltaSyncTests(TestCase):
+    URL = '/api/parkings/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_superuser('sync@tps.test', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.kept, self.renamed, self.removed = (
+            Parking.objects.create(name=name, city='Torino', address='Via Roma 1')
+            for name in ('Kept', 'Renamed', 'Removed')
+        )
+        self.settle()
+
+    def settle(self, seconds=CURSOR_SETTLE_SECONDS + 1):
+        ChangeLog.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def sync(self, since, params=''):
+        response = self.client.get(f'{self.URL}?since={since}{params}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['cursor'], sorted(row['id'] for row in data['changed']), sorted(data['deleted'])
+
+    def test_delta(self):
+        cursor = int(self.client.get(self.URL)[CURSOR_HEADER])
+        added = Parking.objects.create(name='Added', city='Torino', address='Via Po 1')
+        self.assertEqual(self.client.patch(f'{self.URL}{self.renamed.id}/', {'name': 'New name'}).status_code, 200)
+        removed_id = self.removed.id
+        self.removed.delete()
+        self.settle()
+
+        cursor, changed, deleted = self.sync(cursor)
+        self.assertEqual(changed, sorted([added.id, self.renamed.id]))
+        self.assertEqual(deleted, [removed_id])
+        self.assertEqual(self.sync(cursor)[1:], ([], []))
+
+    def test_rows_leaving_the_filter_are_deleted(self):
+        cursor = int(self.client.get(f'{self.URL}?city=Torino')[CURSOR_HEADER])
+        self.renamed.city = 'Milano'
+        self.renamed.save()
+        self.settle()
+        self.assertEqual(self.sync(cursor, '&city=Torino')[1:], ([], [self.renamed.id]))
+
+    def test_settle_window(self):
+        cursor = int(self.client.get(self.URL)[CURSOR_HEADER])
+        added = Parking.objects.create(name='Added', city='Torino', address='Via Po 1')
+        # Too recent to rule out earlier commits still in flight: sent now and again next time
+        next_cursor, changed, _ = self.sync(cursor)
+        self.assertEqual(next_cursor, cursor)
+        self.assertEqual(changed, [added.id])
+        self.settle()
+        next_cursor, changed, _ = self.sync(cursor)
+        self.assertGreater(next_cursor, cursor)
+        self.assertEqual(changed, [added.id])
+
+    def test_pruned_cursor(self):
+        cursor = int(self.client.get(self.URL)[CURSOR_HEADER])
+        for parking in (self.kept, self.renamed):
+            parking.save()
+        self.settle(CHANGE_RETENTION.total_seconds() + 60)
+        self.assertGreater(prune_changes(), 0)
+        self.assertEqual(self.client.get(f'{self.URL}?since={cursor}').status_code, 410)
+        self.assertEqual(self.client.get(f'{self.URL}?since=now').status_code, 400)
+        # The newest entry survives the prune, a client that was up to date keeps syncing
+        newest = ChangeLog.objects.get().id
+        self.assertEqual(self.sync(newest)[1:], ([], []))
+
+
+class CounterRebuildTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.parking = Parking.objects.create(name='Rebuild', city='Torino', address='Via Roma 1')
+        Spot.objects.create(parking=self.parking, number='1')
+        vehicle = Vehicle.objects.create(user=user, plate='RB00001')
+        ParkingSession.objects.create(
+            user=user, vehicle=vehicle, parking_lot=self.parking, total_cost=Decimal('3.00'),
+        )
+
+    def test_rebuild_rewrites_rows_in_place(self):
+        counter = ParkingCounter.objects.get(parking=self.parking)
+        day = ParkingDailyCounter.objects.get(parking=self.parking)
+        city_day = CityDailyCounter.objects.get(city='Torino', day=day.day)
+        expected = (day.entries, day.revenue, day.peak_occupancy)
+        ParkingCounter.objects.update(total_spots=7, active_sessions=9)
+        ParkingDailyCounter.objects.update(entries=5, revenue=99, peak_occupancy=4)
+        stale = CityDailyCounter.objects.create(city='Torino', day=day.day - timedelta(days=1), entries=4)
+
+        rebuild_counters()
+
+        # The same rows are rewritten, increments waiting on their locks still apply
+        counter.refresh_from_db()
+        day.refresh_from_db()
+        city_day.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual((counter.total_spots, counter.active_sessions), (1, 1))
+        self.assertEqual((day.entries, day.revenue, day.peak_occupancy), expected)
+        self.assertEqual((day.entries, day.revenue), (1, Decimal('3.00')))
+        self.assertEqual((city_day.entries, city_day.revenue), (1, Decimal('3.00')))
+        self.assertEqual(stale.entries, 0)
+
+    def test_rebuild_creates_missing_rows(self):
+        ParkingCounter.objects.all().delete()
+        ParkingDailyCounter.objects.all().delete()
+        CityDailyCounter.objects.all().delete()
+
+        rebuild_counters()
+
+        self.assertEqual(ParkingCounter.objects.get(parking=self.parking).active_sessions, 1)
+        self.assertEqual(ParkingDailyCounter.objects.get(parking=self.parking).entries, 1)
+        self.assertEqual(CityDailyCounter.objects.get(city='Torino').peak_occupancy, 1)
+
+    def test_saved_sessions_keep_counters_current(self):
+        def counts():
+            return (
+                sorted(ParkingCounter.objects.values_list('parking_id', 'active_sessions')),
+                sorted(ParkingDailyCounter.objects.values_list('parking_id', 'day', 'entries', 'revenue')),
+                sorted(CityDailyCounter.objects.values_list('city', 'day', 'entries', 'revenue')),
+            )
+
+        def assert_matches_rebuild():
+            current = counts()
+            rebuild_counters()
+            self.assertEqual(current, counts())
+
+        other = Parking.objects.create(name='Other', city='Milano', address='Via Roma 2')
+        session = ParkingSession.objects.get()
+        # Admin edit or PATCH of parking_lot_id
+        session.parking_lot = other
+        session.save()
+        assert_matches_rebuild()
+        self.assertEqual(ParkingCounter.objects.get(parking=other).active_sessions, 1)
+        session.is_active = False
+        session.save()
+        assert_matches_rebuild()
+        session.is_active = True
+        session.save()
+        assert_matches_rebuild()
+        session.end_session()
+        assert_matches_rebuild()
+        self.assertEqual(ParkingCounter.objects.get(parking=other).active_sessions, 0)
+
+
+def baseline_prepaid_cost(tariff_config_json, duration_minutes):
+    """calculate_prepaid_cost as it was before the tariff engine (day rate only)"""
+    duration_hours = duration_minutes / 60.0
+    try:
+        config = json.loads(tariff_config_json)
+        if config.get('type', 'HOURLY_LINEAR') == 'FIXED_DAILY':
+            daily_rate = float(config.get('daily_rate', 20.00))
+            cost = min(duration_hours * daily_rate / 24.0, daily_rate)
+        else:
+            cost = duration_hours * float(config.get('day_base_rate', 2.00))
+    except (json.JSONDecodeError, ValueError, TypeError):
+        cost = duration_hours * 2.00
+    return round(cost, 2)
+
+
+class TariffEngineTests(SimpleTestCase):
+    MORNING = datetime(2026, 1, 5, 8, 0)
+
+    def assertMatchesBaseline(self, config, durations, start=MORNING):
+        raw = config if isinstance(config, str) else json.dumps(config)
+        tariff = compile_tariff(raw)
+        for minutes in durations:
+            self.assertAlmostEqual(
+                tariff.price(start, minutes), baseline_prepaid_cost(raw, minutes), places=2,
+                msg=f'{raw} for {minutes} min',
+            )
+
+    def test_fixed_daily_matches_baseline(self):
+        self.assertMatchesBaseline({'type': 'FIXED_DAILY', 'daily_rate': 18}, [30, 600, 1440, 2880])
+        self.assertMatchesBaseline({'type': 'FIXED_DAILY'}, [90, 3000])
+
+    def test_hourly_linear_matches_baseline(self):
+        # No daily_cap: daily_rate is not a cap for hourly tariffs
+        self.assertMatchesBaseline({'type': 'HOURLY_LINEAR', 'day_base_rate': 3}, [600, 2000, 4320])
+        # Inside the day window the night rate plays no part
+        self.assertMatchesBaseline(DEFAULT_TARIFF_JSON, [60, 600, 720])
+
+    def test_hourly_variable_without_rules_matches_baseline(self):
+        self.assertMatchesBaseline({'type': 'HOURLY_VARIABLE', 'day_base_rate': 1.8}, [45, 600])
+
+    def test_invalid_config_matches_baseline(self):
+        self.assertMatchesBaseline('not json', [60, 150])
+
+    def test_night_boundaries(self):
+        tariff = compile_tariff(DEFAULT_TARIFF_JSON)  # 2.50 by day, 1.50 from 22:00 to 06:00
+        cases = [
+            (datetime(2026, 1, 5, 21, 0), 120, 4.00),
+            (datetime(2026, 1, 5, 22, 0), 60, 1.50),
+            (datetime(2026, 1, 5, 5, 0), 120, 4.00),
+            (datetime(2026, 1, 5, 6, 0), 60, 2.50),
+            (datetime(2026, 1, 5, 21, 30), 540, 14.50),
+        ]
+        for start, minutes, expected in cases:
+            self.assertAlmostEqual(tariff.price(start, minutes), expected, places=2, msg=f'{start} +{minutes}')
+
+    def test_flex_rules(self):
+        for keys in (('from_hours', 'to_hours'), ('duration_from_hours', 'duration_to_hours')):
+            tariff = compile_tariff({
+                'type': 'HOURLY_VARIABLE', 'day_base_rate': 2.0,
+                'flex_rules': [{keys[0]: 2, keys[1]: 4, 'multiplier': 1.5}],
+            })
+            self.assertAlmostEqual(tariff.price(self.MORNING, 120), 4.00, places=2)
+            self.assertAlmostEqual(tariff.price(self.MORNING, 180), 7.00, places=2)
+            self.assertAlmostEqual(tariff.price(self.MORNING, 300), 12.00, places=2)
+        # Flex rules are ignored outside HOURLY_VARIABLE
+        tariff = compile_tariff({'type': 'HOURLY_LINEAR', 'day_base_rate': 2.0, 'flex_rules': [{'from_hours': 0, 'to_hours': 4, 'multiplier': 3}]})
+        self.assertAlmostEqual(tariff.price(self.MORNING, 60), 2.00, places=2)
+
+    def test_explicit_daily_cap(self):
+        tariff = compile_tariff({'type': 'HOURLY_LINEAR', 'day_base_rate': 3, 'daily_cap': 20})
+        self.assertAlmostEqual(tariff.price(self.MORNING, 600), 20.00, places=2)
+        self.assertAlmostEqual(tariff.price(self.MORNING, 30 * 60), 38.00, places=2)
+
+    def test_price_many_matches_price(self):
+        tariff = compile_tariff(DEFAULT_TARIFF_JSON)
+        starts = [datetime(2026, 1, 5, h, m) for h, m in ((0, 0), (5, 59), (21, 45), (13, 10))]
+        durations = [15, 95, 600, 3000]
+        many = tariff.price_many([s.hour * 60 + s.minute for s in starts], durations)
+        for start, minutes, price in zip(starts, durations, many):
+            self.assertAlmostEqual(tariff.price(start, minutes), float(price), places=2)
@@ -0,0 +1,112 @@
+import math
+from tps_backend.versioning import bump_version, get_version
+
+# Below this zoom tiles return clusters instead of polygons
+CLUSTER_MAX_ZOOM = 14
+MAX_TILE_ZOOM = 20
+
+# Each clustered tile is split in CLUSTER_GRID x CLUSTER_GRID buckets
+CLUSTER_GRID = 8
+
+# Occupancy inside a cached tile may lag by at most this many seconds
+TILE_CACHE_TIMEOUT = 60
+
+# Extents covering more tiles than this at a zoom are left to the TTL from there down
+MAX_INVALIDATED_TILES = 64
+
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_bbox(z, x, y):
+    """(south, west, north, east) of a slippy-map tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for_point(z, lat, lng):
+    n = 2 ** z
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_range(z, min_lat, min_lng, max_lat, max_lng):
+    """(x_min, y_min, x_max, y_max) of the tiles at zoom z touched by the extent"""
+    x_min, y_min = tile_for_point(z, max_lat, min_lng)
+    x_max, y_max = tile_for_point(z, min_lat, max_lng)
+    return x_min, y_min, x_max, y_max
+
+
+def tiles_for_extent(z, min_lat, min_lng, max_lat, max_lng):
+    """Every tile at zoom z touched by the extent"""
+    x_min, y_min, x_max, y_max = tile_range(z, min_lat, min_lng, max_lat, max_lng)
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            yield x, y
+
+
+def tile_version_name(z, x, y):
+    return f'parkings:tile:{z}:{x}:{y}'
+
+
+def tile_cache_key(z, x, y, scope):
+    version = get_version(tile_version_name(z, x, y))
+    return f'parkings:tile:{z}:{x}:{y}:v{version}:{scope}'
+
+
+def invalidate_tiles(extent):
+    """
+    Bump the version of every tile covering the extent, zoom by zoom.
+    Tile counts grow 4x per zoom, so once an extent spans more than
+    MAX_INVALIDATED_TILES the deeper zooms are left to TILE_CACHE_TIMEOUT.
+    """
+    if extent is None:
+        return
+    for z in range(MAX_TILE_ZOOM + 1):
+        x_min, y_min, x_max, y_max = tile_range(z, *extent)
+        if (x_max - x_min + 1) * (y_max - y_min + 1) > MAX_INVALIDATED_TILES:
+            break
+        for x, y in tiles_for_extent(z, *extent):
+            bump_version(tile_version_name(z, x, y))
+
+
+def cluster_parkings(rows, bbox):
+    """
+    Bucket parkings by marker into a CLUSTER_GRID x CLUSTER_GRID grid over the tile.
+    `rows` are dicts with latitude, longitude, total_spots and occupied_spots.
+    """
+    south, west, north, east = bbox
+    lat_step = (north - south) / CLUSTER_GRID
+    lng_step = (east - west) / CLUSTER_GRID
+    buckets = {}
+    for row in rows:
+        cell = (
+            min(int((row['latitude'] - south) / lat_step), CLUSTER_GRID - 1),
+            min(int((row['longitude'] - west) / lng_step), CLUSTER_GRID - 1),
+        )
+        bucket = buckets.setdefault(cell, {
+            'count': 0, 'lat_sum': 0.0, 'lng_sum': 0.0,
+            'total_spots': 0, 'occupied_spots': 0,
+        })
+        bucket['count'] += 1
+        bucket['lat_sum'] += row['latitude']
+        bucket['lng_sum'] += row['longitude']
+        bucket['total_spots'] += row['total_spots']
+        bucket['occupied_spots'] += row['occupied_spots']
+
+    return [
+        {
+            'count': b['count'],
+            'latitude': b['lat_sum'] / b['count'],
+            'longitude': b['lng_sum'] / b['count'],
+            'total_spots': b['total_spots'],
+            'occupied_spots': b['occupied_spots'],
+        }
+        for b in buckets.values()
+    ]
@@ -1,65 +1,107 @@
 from os import path
+import hashlib
+import numpy as np
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count, Q, OuterRef, Subquery, IntegerField, DecimalField, Sum, Value
-from django.db.models.functions import Coalesce
+from django.db.models import F, FilteredRelation, Q, DecimalField, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, ExtractHour, ExtractMinute
 from django.utils import timezone
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.decorators import method_decorator
 from decimal import Decimal
 from datetime import timedelta
 from django.utils import timezone
-from .models import Parking, Spot, City
-from .serializers import ParkingMapSerializer, ParkingSerializer, SpotSerializer, CitySerializer
+from .changes import PARKING, SESSION, SPOT, current_cursor, stamp_cursor, sync_delta
+from .columnar import columnar_map
+from .models import ChangeLog, Parking, ParkingCounter, Spot, City
+from .serializers import (
+    ParkingMapSerializer, ParkingSerializer, QuoteRequestSerializer,
+    SpotSerializer, CitySerializer, TariffSimulationSerializer,
+)
+from .signals import CITY_VERSION
+from .spatial import GEOMETRY_VERSION, get_parking_index, parse_bbox
+from .tariffs import compile_tariff, get_tariff, local_minute_of_day, simulate
+from .tiles import (
+    CLUSTER_MAX_ZOOM, MAX_TILE_ZOOM, TILE_CACHE_TIMEOUT,
+    cluster_parkings, tile_bbox, tile_cache_key, tile_for_point,
+)
+from tps_backend.conditional import conditional
+from tps_backend.query_plans import apply_query_plan
+from tps_backend.versioning import get_version
 from vehicles.models import ParkingSession
-from vehicles.serializers import ParkingSessionSerializer
+from vehicles.pagination import SessionCursorPagination
+from vehicles.serializers import session_list_options
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.pagination import LimitOffsetPagination
 
+# Below this zoom level polygons are smaller than a pixel, markers are enough
+MAP_POLYGON_MIN_ZOOM = CLUSTER_MAX_ZOOM
+
+
+def _manager_cities(user):
+    """Cities a manager is restricted to, '*' for everyone else"""
+    if not user.is_superuser and hasattr(user, 'role') and (user.role == 'manager'):
+        return ','.join(sorted(getattr(user, 'allowed_cities', None) or []))
+    return '*'
+
+
+def _allowed_cities(user):
+    if user.is_superuser:
+        return '*'
+    return ','.join(sorted(getattr(user, 'allowed_cities', None) or []))
+
+
+def map_scope(request):
+    """Cache discriminator for responses that depend on the user's visible cities"""
+    city_param = request.query_params.get('city', '')
+    return hashlib.md5(f'{_manager_cities(request.user)}|{city_param.lower()}'.encode()).hexdigest()
+
+
+def _parking_etag(request, pk=None):
+    # Every write that shows in a parking row (fields, entrances, counters) is in the change log
+    last_change = (
+        ChangeLog.objects.filter(resource=PARKING, parking_id=pk).aggregate(last=Max('id'))['last']
+    )
+    return ['parking', pk, last_change, timezone.localdate(), _manager_cities(request.user)]
+
+
+def _search_map_etag(request):
+    params = request.query_params
+    return [
+        'search_map', get_version(GEOMETRY_VERSION), map_scope(request),
+        params.get('bbox', ''), params.get('zoom', ''), params.get('polygon_format', ''),
+        params.get('layout', ''),
+    ]
+
+
+def _cities_etag(request):
+    return ['cities', get_version(CITY_VERSION), _allowed_cities(request.user)]
+
 class ParkingViewSet(viewsets.ModelViewSet):
     serializer_class = ParkingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
     def get_queryset(self):
-        today = timezone.now().date()
-
-        
-        active_sessions_qs = ParkingSession.objects.filter(
-            parking_lot=OuterRef('pk'),
-            is_active=True
-        ).values('parking_lot').annotate(cnt=Count('id')).values('cnt')
+        today = timezone.localdate()
 
-        
-        today_entries_qs = ParkingSession.objects.filter(
-            parking_lot=OuterRef('pk'),
-            start_time__date=today
-        ).values('parking_lot').annotate(cnt=Count('id')).values('cnt')
-        
-       
-        today_revenue_qs = ParkingSession.objects.filter(
-            parking_lot=OuterRef('pk'),
-            start_time__date=today
-        ).values('parking_lot').annotate(total=Sum('total_cost')).values('total')
-
-       
+        # Live numbers come from the counters maintained on session/spot writes,
+        # two LEFT JOINs instead of per-row subqueries over the session table
         queryset = Parking.objects.annotate(
-            annotated_total_spots=Count('spots', distinct=True),
-            
-            annotated_occupied_spots=Coalesce(
-                Subquery(active_sessions_qs, output_field=IntegerField()), 
-                0
+            today_counter=FilteredRelation(
+                'daily_counters', condition=Q(daily_counters__day=today)
             ),
-            
-            annotated_today_entries=Coalesce(
-                Subquery(today_entries_qs, output_field=IntegerField()), 
-                0
-            ),
-            
+        ).annotate(
+            annotated_total_spots=Coalesce(F('counter__total_spots'), 0),
+            annotated_occupied_spots=Coalesce(F('counter__active_sessions'), 0),
+            annotated_today_entries=Coalesce(F('today_counter__entries'), 0),
             annotated_today_revenue=Coalesce(
-                Subquery(today_revenue_qs, output_field=DecimalField()), 
+                F('today_counter__revenue'),
                 Value(Decimal('0.00'), output_field=DecimalField()),
                 output_field=DecimalField()
             )
@@ -85,8 +127,23 @@ class ParkingViewSet(viewsets.ModelViewSet):
         if city_param:
             queryset = queryset.filter(city__icontains=city_param)
 
+        if self.action in ['list', 'retrieve']:
+            queryset = apply_query_plan(queryset, self.get_serializer_class())
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """Full list, or with ?since=<cursor> only the parkings changed after it"""
+        cursor = current_cursor()
+        queryset = self.filter_queryset(self.get_queryset())
+        delta = sync_delta(request, PARKING, queryset, lambda rows: self.get_serializer(rows, many=True).data)
+        if delta is not None:
+            return delta
+        return stamp_cursor(super().list(request, *args, **kwargs), cursor)
+
+    @method_decorator(conditional(_parking_etag))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         user = self.request.user
         new_city = serializer.validated_data.get('city')
@@ -99,21 +156,168 @@ class ParkingViewSet(viewsets.ModelViewSet):
         
         serializer.save()
 
+    @action(detail=True, methods=['post'])
+    def quote(self, request, pk=None):
+        """
+        Server prices for many (start_time, duration_minutes) pairs in one call,
+        e.g. a whole duration-slider curve. start_time defaults to now.
+        """
+        parking = self.get_object()
+        serializer = QuoteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        now = timezone.now()
+        starts = [item.get('start_time') or now for item in items]
+        durations = [item['duration_minutes'] for item in items]
+        prices = get_tariff(parking).price_many(
+            [local_minute_of_day(start) for start in starts], durations
+        )
+
+        return Response({
+            'parking_id': parking.id,
+            'quotes': [
+                {'start_time': start, 'duration_minutes': duration, 'price': float(price)}
+                for start, duration, price in zip(starts, durations, prices)
+            ],
+        })
+
+    @action(detail=True, methods=['post'])
+    def simulate_tariff(self, request, pk=None):
+        """
+        Replay the last `days` of this parking's sessions through a candidate
+        tariff_config_json and return projected revenue and price distribution.
+        """
+        user = request.user
+        if not (user.is_superuser or getattr(user, 'role', None) in ['manager', 'superuser']):
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+        parking = self.get_object()
+        serializer = TariffSimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        days = serializer.validated_data['days']
+
+        # Hour/minute extracted in the current time zone by the database,
+        # rows go straight into arrays without building model instances
+        rows = (
+            ParkingSession.objects.filter(
+                parking_lot=parking,
+                start_time__gte=timezone.now() - timedelta(days=days),
+                duration_purchased_minutes__gt=0,
+            )
+            .order_by()
+            .annotate(
+                start_hour=ExtractHour('start_time'),
+                start_minute=ExtractMinute('start_time'),
+                cost=Coalesce(Cast('total_cost', FloatField()), Value(0.0)),
+            )
+            .values_list('start_hour', 'start_minute', 'duration_purchased_minutes', 'cost')
+        )
+        data = np.array(list(rows), dtype=float).reshape(-1, 4)
+
+        result = simulate(
+            compile_tariff(serializer.validated_data['tariff_config_json']),
+            data[:, 0] * 60 + data[:, 1],
+            data[:, 2],
+            data[:, 3],
+        )
+        result.update({'parking_id': parking.id, 'days': days})
+        return Response(result)
+
     @action(detail=True, methods=['get'])
     def spots(self, request, pk=None):
+        cursor = current_cursor()
         parking = self.get_object()
         spots = parking.spots.all()
+        delta = sync_delta(
+            request, SPOT, spots, lambda rows: SpotSerializer(rows, many=True).data, parking_id=parking.id,
+        )
+        if delta is not None:
+            return delta
         serializer = SpotSerializer(spots, many=True)
-        return Response(serializer.data)
+        return stamp_cursor(Response(serializer.data), cursor)
 
     @action(detail=True, methods=['get'])
     def sessions(self, request, pk=None):
-        sessions = ParkingSession.objects.filter(parking_lot_id=pk, is_active=True).order_by('-start_time')
-        serializer = ParkingSessionSerializer(sessions, many=True)
-        return Response(serializer.data)
+        """
+        Active sessions of the parking. Accepts ?since= (delta sync),
+        ?cursor= / ?page_size= (cursor pagination), ?compact=1 and ?fields=.
+        """
+        cursor = current_cursor()
+        serializer_class, context = session_list_options(request)
+        sessions = apply_query_plan(
+            ParkingSession.objects.filter(parking_lot_id=pk, is_active=True).order_by('-start_time'),
+            serializer_class,
+        )
+
+        def serialize(rows):
+            return serializer_class(rows, many=True, context=context).data
+
+        delta = sync_delta(request, SESSION, sessions, serialize, parking_id=pk)
+        if delta is not None:
+            return delta
+        paginator = SessionCursorPagination()
+        page = paginator.paginate_queryset(sessions, request, view=self)
+        if page is not None:
+            return stamp_cursor(paginator.get_paginated_response(serialize(page)), cursor)
+        return stamp_cursor(Response(serialize(sessions)), cursor)
     
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional(_search_map_etag))
     def search_map(self, request):
+        """
+        Map markers and polygons.
+        Optional viewport mode: ?bbox=south,west,north,east returns only the
+        parkings intersecting the viewport, resolved through the spatial index.
+        ?zoom=<n> below MAP_POLYGON_MIN_ZOOM drops polygons (sub-pixel at that scale).
+        ?polygon_format=polyline returns `polygon_polyline` (encoded polyline,
+        5 decimals) instead of the `polygon_coords` list.
+        ?layout=columnar returns parallel arrays with quantized, delta-encoded
+        polygons instead of one object per parking (see parkings.columnar).
+        """
+        bbox_param = self.request.query_params.get('bbox')
+        zoom_param = self.request.query_params.get('zoom')
+        polygon_format = self.request.query_params.get('polygon_format', 'json')
+        if polygon_format not in ('json', 'polyline'):
+            return Response({"detail": "polygon_format must be 'json' or 'polyline'."}, status=status.HTTP_400_BAD_REQUEST)
+        layout = self.request.query_params.get('layout', 'rows')
+        if layout not in ('rows', 'columnar'):
+            return Response({"detail": "layout must be 'rows' or 'columnar'."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self._map_queryset()
+        if queryset is None:
+            queryset = Parking.objects.none()
+        queryset = queryset.defer('polygon_polyline' if polygon_format == 'json' else 'polygon_coordinates')
+
+        include_polygons = True
+        if zoom_param:
+            try:
+                include_polygons = int(zoom_param) >= MAP_POLYGON_MIN_ZOOM
+            except ValueError:
+                return Response({"detail": "zoom must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if bbox_param:
+            try:
+                bbox = parse_bbox(bbox_param)
+            except ValueError as e:
+                return Response({"detail": f"Invalid bbox: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            visible_ids = get_parking_index().query(*bbox)
+            queryset = queryset.filter(id__in=visible_ids) if visible_ids else queryset.none()
+
+        if layout == 'columnar':
+            return Response(columnar_map(queryset, include_polygons))
+
+        serializer = ParkingMapSerializer(
+            queryset, many=True, context={
+                'request': request,
+                'include_polygons': include_polygons,
+                'polygon_format': polygon_format,
+            }
+        )
+        return Response(serializer.data)
+
+
+    def _map_queryset(self):
+        """Parkings visible on the map for this user, None if the manager has no city"""
         user = self.request.user
         city_param = self.request.query_params.get('city')
         queryset = Parking.objects.all().defer('tariff_config_json') 
@@ -122,11 +326,67 @@ class ParkingViewSet(viewsets.ModelViewSet):
             if allowed:
                 queryset = queryset.filter(city__in=allowed)
             else:
-                return Response([])
+                return None
         if city_param:
             queryset = queryset.filter(city__icontains=city_param)
-        serializer = ParkingMapSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path=r'map_tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)')
+    def map_tiles(self, request, z=None, x=None, y=None):
+        """
+        Slippy-map tile of the parking map.
+        Below CLUSTER_MAX_ZOOM returns aggregated clusters (count, centroid, spots),
+        from CLUSTER_MAX_ZOOM up returns the full parkings with polygons.
+        Responses are cached per tile and invalidated when a parking in the tile changes.
+        """
+        z, x, y = int(z), int(x), int(y)
+        if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return Response({"detail": "Tile out of range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = tile_cache_key(z, x, y, map_scope(request))
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        data = {'z': z, 'x': x, 'y': y, 'clustered': z < CLUSTER_MAX_ZOOM}
+        queryset = self._map_queryset()
+        bbox = tile_bbox(z, x, y)
+        visible_ids = get_parking_index().query(*bbox) if queryset is not None else set()
+        if not visible_ids:
+            queryset = Parking.objects.none()
+        else:
+            queryset = queryset.filter(id__in=visible_ids)
+
+        if data['clustered']:
+            markers = [
+                (pk, lat, lng)
+                for pk, lat, lng in queryset.values_list('id', 'marker_latitude', 'marker_longitude')
+                # A parking is counted only in the tile holding its marker
+                if lat is not None and tile_for_point(z, lat, lng) == (x, y)
+            ]
+            ids = [pk for pk, _, _ in markers]
+            counters = {
+                parking_id: (total, active)
+                for parking_id, total, active in ParkingCounter.objects.filter(parking_id__in=ids)
+                .values_list('parking_id', 'total_spots', 'active_sessions')
+            }
+            data['clusters'] = cluster_parkings(
+                (
+                    {
+                        'latitude': lat,
+                        'longitude': lng,
+                        'total_spots': counters.get(pk, (0, 0))[0],
+                        'occupied_spots': counters.get(pk, (0, 0))[1],
+                    }
+                    for pk, lat, lng in markers
+                ),
+                bbox,
+            )
+        else:
+            data['parkings'] = list(ParkingMapSerializer(queryset, many=True).data)
+
+        cache.set(cache_key, data, TILE_CACHE_TIMEOUT)
+        return Response(data)
 
 
 class SpotViewSet(viewsets.ModelViewSet):
@@ -151,11 +411,24 @@ class SpotViewSet(viewsets.ModelViewSet):
             
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        cursor = current_cursor()
+        queryset = self.filter_queryset(self.get_queryset())
+        scope = {}
+        parking_id = request.query_params.get('parking')
+        if parking_id and parking_id.isdigit():
+            scope['parking_id'] = int(parking_id)
+        delta = sync_delta(request, SPOT, queryset, lambda rows: self.get_serializer(rows, many=True).data, **scope)
+        if delta is not None:
+            return delta
+        return stamp_cursor(super().list(request, *args, **kwargs), cursor)
+
     def perform_create(self, serializer):
         serializer.save()
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(_cities_etag)
 def get_authorized_cities(request):
     """
     Return only cities that the authenticated manager is authorized to access
@@ -213,6 +486,7 @@ class CityViewSet(viewsets.ModelViewSet):
             return City.objects.none()
 
     @action(detail=False, methods=['get'], url_path='list_with_coordinates')
+    @method_decorator(conditional(_cities_etag))
     def list_with_coordinates(self, request):
         """
         Return list of cities with their center coordinates
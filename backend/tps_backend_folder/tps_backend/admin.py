@@ -5,15 +5,15 @@ from parkings.models import Parking, City
 from users.models import CustomUser
 from vehicles.models import ParkingSession
 from django.db.models import Sum
-from django.utils import timezone
 from decimal import Decimal
+from .dates import day_bounds
 
 class CustomAdminSite(admin.AdminSite):
     def index(self, request, extra_context=None):
         """
         Override the default admin index to show dashboard statistics
         """
-        today = timezone.now().date()
+        today_start, today_end = day_bounds()
         
         # Get statistics
         total_parkings = Parking.objects.count()
@@ -22,7 +22,7 @@ class CustomAdminSite(admin.AdminSite):
         
         # Calculate today's revenue
         today_revenue = ParkingSession.objects.filter(
-            start_time__date=today
+            start_time__gte=today_start, start_time__lt=today_end
         ).aggregate(total=Sum('total_cost'))['total'] or Decimal('0.00')
         
         # Get recent sessions
@@ -3,6 +3,18 @@ ASGI config for tps_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live push channel (``/api/events/...``, see tps_backend.views) keeps
+one long-lived streaming response per connected manager or officer. Under
+ASGI a connection is a suspended coroutine, which is why app.yaml and the
+Procfile serve this module::
+
+    gunicorn tps_backend.asgi:application -k uvicorn_worker.UvicornWorker
+
+Under WSGI the streams cannot work (the response would be buffered until
+the stream ends, which it never does), so they answer 501 there. With
+several workers or instances, set REDIS_URL so events published by one
+process reach every other.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
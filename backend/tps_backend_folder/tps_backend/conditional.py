@@ -0,0 +1,35 @@
+import hashlib
+from functools import wraps
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def conditional(etag_parts):
+    """
+    Conditional GET from version stamps: `etag_parts(request, *args, **kwargs)`
+    returns the stamps and request scope the response depends on, and a
+    matching If-None-Match gets 304 Not Modified before the view runs, so
+    neither the queryset nor the serializer is evaluated.
+
+    Use directly on function views, or through method_decorator on viewset
+    methods (below @action).
+    """
+    def etag_func(request, *args, **kwargs):
+        key = '|'.join(str(part) for part in etag_parts(request, *args, **kwargs))
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                # Errors must not be revalidated into a 304 later
+                del response['ETag']
+                return response
+            # Clients may keep the body but must revalidate before reusing it
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
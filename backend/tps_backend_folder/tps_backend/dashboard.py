@@ -1,71 +1,128 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import CharField, Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models import Sum
-from vehicles.models import Fine, ParkingSession, GlobalSettings
+from vehicles.models import Fine, ParkingSession
+from parkings.models import CityDailyCounter
+from vehicles.global_settings import get_global_settings
 from users.models import CustomUser
+from .dates import day_bounds
+from .versioning import bump_version, get_version
+
+DASHBOARD_VERSION = 'dashboard'
+
+# Upper bound on staleness for changes that bypass signals (bulk expiry)
+DASHBOARD_CACHE_TIMEOUT = 30
+
+FEED_PER_KIND = 5
+FEED_SIZE = 10
+
+FEED_TITLES = {
+    'user': 'New User',
+    'session': 'Session Started',
+    'fine_payment': 'Fine Paid',
+    'fine_issued': 'Violation Issued',
+}
+
+
+def _feed_branch(queryset, kind, timestamp, identifier, amount):
+    """Recent rows of one table in the common activity feed shape"""
+    branch = (
+        queryset.order_by()
+        .annotate(
+            feed_kind=Value(kind, output_field=CharField()),
+            feed_time=F(timestamp),
+            feed_identifier=identifier,
+            feed_amount=amount,
+        )
+        .values_list('feed_kind', 'feed_time', 'feed_identifier', 'feed_amount')
+    )
+    if connection.features.supports_slicing_ordering_in_compound:
+        return branch.order_by('-feed_time')[:FEED_PER_KIND]
+    # Backends without LIMIT inside UNION branches: restrict through the primary key
+    latest = queryset.order_by(f'-{timestamp}').values('pk')[:FEED_PER_KIND]
+    return branch.filter(pk__in=latest)
 
-def dashboard_callback(request, context):
-    now = timezone.now()
-    today = now.date()
 
-    total_users = CustomUser.objects.filter(role='user').count()
-    new_users_today = CustomUser.objects.filter(role='user').filter(date_joined__date=today).count()
+def _activity_feed():
+    no_amount = Value(None, output_field=DecimalField(max_digits=10, decimal_places=2))
+    plate = Coalesce(F('vehicle__plate'), Value('Unknown'), output_field=CharField())
+    branches = [
+        _feed_branch(
+            CustomUser.objects.filter(role='user'), 'user', 'date_joined',
+            F('email'), no_amount,
+        ),
+        _feed_branch(
+            ParkingSession.objects.all(), 'session', 'start_time',
+            plate, F('total_cost'),
+        ),
+        _feed_branch(
+            Fine.objects.filter(status='paid', paid_at__isnull=False), 'fine_payment', 'paid_at',
+            plate, F('amount'),
+        ),
+        _feed_branch(
+            Fine.objects.all(), 'fine_issued', 'issued_at',
+            plate, F('amount'),
+        ),
+    ]
+    rows = branches[0].union(*branches[1:], all=True).order_by('-feed_time')[:FEED_SIZE]
+    return [
+        {
+            'type': kind,
+            'timestamp': timestamp,
+            'identifier': identifier,
+            'title': FEED_TITLES[kind],
+            'amount': amount,
+        }
+        for kind, timestamp, identifier, amount in rows
+    ]
+
+
+def _dashboard_data():
+    """One aggregate query per table, plus the activity feed union"""
+    today_start, today_end = day_bounds()
+
+    users = CustomUser.objects.filter(role='user').aggregate(
+        total=Count('id'),
+        new_today=Count('id', filter=Q(date_joined__gte=today_start, date_joined__lt=today_end)),
+    )
+    # Served by the active-only partial index
     active_sessions = ParkingSession.objects.filter(is_active=True).count()
+    # Revenue comes from the daily rollups, which also cover archived sessions
+    revenue = CityDailyCounter.objects.aggregate(
+        all=Sum('revenue'),
+        today=Sum('revenue', filter=Q(day=timezone.localdate())),
+    )
+    fines = Fine.objects.aggregate(
+        active=Count('id', filter=~Q(status__in=['paid', 'cancelled'])),
+        disputed=Count('id', filter=Q(status='disputed')),
+    )
 
-    all_revenue = ParkingSession.objects.aggregate(sum=Sum('total_cost'))['sum'] or 0
-    today_revenue = ParkingSession.objects.filter(start_time__date=today).aggregate(sum=Sum('total_cost'))['sum'] or 0
-
-    active_violations_count = Fine.objects.exclude(status__in=['paid', 'cancelled']).count()
-    pending_disputes = Fine.objects.filter(status='disputed').count()
-
-    activity_feed = []
-
-    recent_users = CustomUser.objects.filter(role='user').order_by('-date_joined')[:5]
-    for user in recent_users:
-        activity_feed.append({
-            'type': 'user',
-            'timestamp': user.date_joined,
-            'identifier': user.email,
-            'title': 'New User',
-            'amount': None,
-        })
-
-    recent_sessions = ParkingSession.objects.select_related('vehicle').order_by('-start_time')[:5]
-    for session in recent_sessions:
-        plate = session.vehicle.plate if session.vehicle else "Unknown"
-        activity_feed.append({
-            'type': 'session',
-            'timestamp': session.start_time,
-            'identifier': plate,
-            'title': 'Session Started',
-            'amount': session.total_cost, 
-        })
-
-    recent_paid_fines = Fine.objects.filter(status='paid', paid_at__isnull=False).select_related('vehicle').order_by('-paid_at')[:5]
-    for fine in recent_paid_fines:
-        plate = fine.vehicle.plate if fine.vehicle else "Unknown"
-        activity_feed.append({
-            'type': 'fine_payment',
-            'timestamp': fine.paid_at,
-            'identifier': plate,
-            'title': 'Fine Paid',
-            'amount': fine.amount,
-        })
-
-    recent_issued_fines = Fine.objects.select_related('vehicle').order_by('-issued_at')[:5]
-    for fine in recent_issued_fines:
-        plate = fine.vehicle.plate if fine.vehicle else "Unknown"
-        activity_feed.append({
-            'type': 'fine_issued',
-            'timestamp': fine.issued_at,
-            'identifier': plate,
-            'title': 'Violation Issued',
-            'amount': fine.amount,
-        })
-
-    activity_feed.sort(key=lambda x: x['timestamp'], reverse=True)
-    final_activity = activity_feed[:10]
-
-    system_config = GlobalSettings.objects.first()
+    return {
+        "stats": {
+            "total_users": users['total'],
+            "new_users_today": users['new_today'],
+            "active_sessions": active_sessions,
+            "all_revenue": round(revenue['all'] or 0, 2),
+            "today_revenue": round(revenue['today'] or 0, 2),
+            "active_violations_count": fines['active'],
+            "pending_disputes": fines['disputed'],
+        },
+        "recent_activity": _activity_feed(),
+    }
+
+
+def dashboard_callback(request, context):
+    key = f'dashboard:v{get_version(DASHBOARD_VERSION)}'
+    data = cache.get(key)
+    if data is None:
+        data = _dashboard_data()
+        cache.set(key, data, DASHBOARD_CACHE_TIMEOUT)
+
+    system_config = get_global_settings()
 
     if not system_config:
         violation_types = []
@@ -74,19 +131,24 @@ def dashboard_callback(request, context):
         if not violation_types:
             violation_types = []
 
+    context.update(data)
     context.update({
-        "stats": {
-            "total_users": total_users,
-            "new_users_today": new_users_today,
-            "active_sessions": active_sessions,
-            "all_revenue": round(all_revenue, 2),
-            "today_revenue": round(today_revenue, 2),
-            "active_violations_count": active_violations_count,
-            "pending_disputes": pending_disputes,
-        },
-        "recent_activity": final_activity,
         "system_config": system_config,
         "violation_types": violation_types,
     })
-    
-    return context
\ No newline at end of file
+
+    return context
+
+
+def invalidate_dashboard():
+    bump_version(DASHBOARD_VERSION)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_save, sender=ParkingSession)
+@receiver(post_delete, sender=ParkingSession)
+@receiver(post_save, sender=Fine)
+@receiver(post_delete, sender=Fine)
+def dashboard_data_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_dashboard)
@@ -0,0 +1,14 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+
+
+def day_bounds(day=None):
+    """
+    [start, end) of a local calendar day as aware datetimes.
+    Filtering `field__gte=start, field__lt=end` can use an index on the
+    column, unlike `field__date=day` which converts every row.
+    """
+    day = day or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
@@ -0,0 +1,173 @@
+"""
+Live event broker for the push channel (see tps_backend.views).
+
+Events are published on named channels ('parking:<id>', 'city:<name>')
+from ordinary sync code, usually signal receivers after commit, and
+delivered to the asyncio queues of the streaming connections subscribed in
+this process.
+
+With REDIS_URL set, events go through a Redis pub/sub channel instead and a
+relay thread in every process hands them to the local subscribers, so a
+session started on one worker reaches managers connected to another.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = 'tps:events'
+
+# Events buffered per connection before a slow client is told to resync
+QUEUE_SIZE = 100
+
+# Sent instead of the dropped events when a client's queue overflowed
+RESYNC_EVENT = 'resync'
+
+# Superuser officers patrol every city
+ALL_CITIES = '*'
+
+
+def parking_channel(parking_id):
+    return f'parking:{parking_id}'
+
+
+def city_channel(city):
+    return f'city:{city}'
+
+
+class Subscription:
+    """Queue of one streaming connection, fed from any thread"""
+
+    def __init__(self, channels, loop):
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def _put(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop the backlog, the client reloads its state on resync
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'event': RESYNC_EVENT, 'data': {}})
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    async def get(self):
+        message = await self.queue.get()
+        if message['event'] == RESYNC_EVENT:
+            self.overflowed = False
+        return message
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._relay = None
+
+    def subscribe(self, channels):
+        """Register the running event loop's connection on the given channels"""
+        subscription = Subscription(channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        if getattr(settings, 'REDIS_URL', None):
+            self._start_relay()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def connection_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+    def deliver(self, channels, message):
+        """Hand a message to the subscribers of this process"""
+        with self._lock:
+            targets = {s for channel in channels for s in self._subscribers.get(channel, ())}
+        for subscription in targets:
+            try:
+                subscription.deliver(message)
+            except RuntimeError:
+                # Loop already closed, the connection is going away
+                self.unsubscribe(subscription)
+
+    def publish(self, channels, event, data):
+        message = {'event': event, 'data': data}
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        if redis_url:
+            try:
+                payload = json.dumps({'channels': list(channels), **message}, cls=DjangoJSONEncoder)
+                _redis_client(redis_url).publish(REDIS_CHANNEL, payload)
+                return
+            except Exception:
+                logger.exception("Redis publish failed, delivering locally only")
+        # Same JSON round trip as the Redis path, so every subscriber gets plain data
+        self.deliver(channels, json.loads(json.dumps(message, cls=DjangoJSONEncoder)))
+
+    def _start_relay(self):
+        with self._lock:
+            if self._relay is not None and self._relay.is_alive():
+                return
+            self._relay = threading.Thread(
+                target=self._relay_forever, args=(settings.REDIS_URL,), name='tps-events-relay', daemon=True,
+            )
+            self._relay.start()
+
+    def _relay_forever(self, redis_url):
+        while True:
+            try:
+                pubsub = _redis_client(redis_url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_CHANNEL)
+                for item in pubsub.listen():
+                    message = json.loads(item['data'])
+                    self.deliver(message.pop('channels'), message)
+            except Exception:
+                logger.exception("Event relay lost its Redis connection, retrying")
+                time.sleep(1)
+
+
+_redis_clients = {}
+
+
+def _redis_client(url):
+    client = _redis_clients.get(url)
+    if client is None:
+        import redis
+
+        client = _redis_clients[url] = redis.Redis.from_url(url)
+    return client
+
+
+broker = Broker()
+
+
+def publish(channels, event, data):
+    broker.publish(channels, event, data)
+
+
+def publish_on_commit(channels, event, data):
+    """Publish once the current transaction commits, never for rolled back changes"""
+    transaction.on_commit(lambda: publish(channels, event, data))
@@ -0,0 +1,111 @@
+"""
+Producers of the live push channel: occupancy, session and officer shift
+events, published on commit to the parking and city channels.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from parkings.models import ParkingCounter
+from users.models import Shift
+from vehicles.models import ParkingSession
+from .events import ALL_CITIES, city_channel, parking_channel, publish, publish_on_commit
+
+
+def occupancy_rows(**filters):
+    rows = ParkingCounter.objects.filter(**filters).values(
+        'parking_id', 'parking__city', 'active_sessions', 'total_spots',
+    )
+    return [
+        {
+            'parking_id': row['parking_id'],
+            'city': row['parking__city'],
+            # Same numbers as the parking list/detail endpoints
+            'total_spots': row['total_spots'],
+            'occupied_spots': row['active_sessions'],
+            'available_spots': max(row['total_spots'] - row['active_sessions'], 0),
+        }
+        for row in rows
+    ]
+
+
+def publish_occupancy(parking_ids):
+    """Current counters of the given parkings, one query for all of them"""
+    for row in occupancy_rows(parking_id__in=[pk for pk in parking_ids if pk]):
+        publish([parking_channel(row['parking_id']), city_channel(row['city'])], 'occupancy', row)
+
+
+def publish_occupancy_on_commit(parking_ids):
+    parking_ids = list(parking_ids)
+    transaction.on_commit(lambda: publish_occupancy(parking_ids))
+
+
+def session_data(session):
+    return {
+        'session_id': session.id,
+        'parking_id': session.parking_lot_id,
+        'plate': session.vehicle.plate if session.vehicle_id else None,
+        'start_time': session.start_time,
+        'planned_end_time': session.planned_end_time,
+        'end_time': session.end_time,
+        'is_active': session.is_active,
+    }
+
+
+def _session_channels(session):
+    if not session.parking_lot_id:
+        return []
+    return [parking_channel(session.parking_lot_id), city_channel(session.parking_lot.city)]
+
+
+def shift_data(shift):
+    officer = shift.officer
+    return {
+        'shift_id': shift.id,
+        'officer_id': officer.id,
+        'email': officer.email,
+        'first_name': officer.first_name,
+        'last_name': officer.last_name,
+        'role': officer.role,
+        'shift_start': shift.start_time,
+        'shift_end': shift.end_time,
+    }
+
+
+def _officer_channels(officer):
+    if officer.is_superuser:
+        return [city_channel(ALL_CITIES)]
+    return [city_channel(city) for city in officer.allowed_cities or []]
+
+
+@receiver(post_save, sender=ParkingSession)
+def push_session_saved(sender, instance, created, **kwargs):
+    channels = _session_channels(instance)
+    if not channels:
+        return
+    if created:
+        publish_on_commit(channels, 'session_started', session_data(instance))
+    elif not instance.is_active:
+        # A later edit of an ended session repeats the event, clients treat it as idempotent
+        publish_on_commit(channels, 'session_ended', session_data(instance))
+    else:
+        return
+    publish_occupancy_on_commit([instance.parking_lot_id])
+
+
+@receiver(post_delete, sender=ParkingSession)
+def push_session_deleted(sender, instance, **kwargs):
+    channels = _session_channels(instance)
+    if channels and instance.is_active:
+        publish_on_commit(channels, 'session_ended', session_data(instance))
+        publish_occupancy_on_commit([instance.parking_lot_id])
+
+
+@receiver(post_save, sender=Shift)
+def push_shift_saved(sender, instance, created, **kwargs):
+    if created and instance.status == 'OPEN':
+        event = 'shift_started'
+    elif instance.status == 'CLOSED':
+        event = 'shift_ended'
+    else:
+        return
+    publish_on_commit(_officer_channels(instance.officer), event, shift_data(instance))
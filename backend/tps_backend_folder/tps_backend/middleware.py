@@ -2,6 +2,24 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import logout  
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency, gzip only
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+# Per-response cost matters more than the last few percent of size
+BROTLI_QUALITY = 5
+
+# Brotli has no BREACH mitigation, keep it to API payloads. HTML pages (admin,
+# browsable API) carry CSRF tokens and go through GZipMiddleware, which pads
+# them with a random-length filename.
+BROTLI_CONTENT_TYPES = ('application/json',)
 
 class SuperUserOnlyMiddleware:
     def __init__(self, get_response):
@@ -19,4 +37,39 @@ class SuperUserOnlyMiddleware:
                     messages.error(request, "Access Denied.")
                     return redirect('admin:login')
 
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Response compression negotiated on Accept-Encoding: brotli for JSON when the
+    client accepts it and the brotli package is installed, gzip otherwise (Django's
+    GZipMiddleware). Event streams are left alone, compressing them would
+    hold back events until a compressor block fills up.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or len(response.content) < 200
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(BROTLI_CONTENT_TYPES)
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+        # Same as gzip: the body changed, a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,13 @@
+def apply_query_plan(queryset, serializer_class):
+    """
+    Apply the relations a serializer reads per row, declared on it as
+    `select_related_fields` and `prefetch_related_fields`, so list endpoints
+    stay at a fixed number of queries whatever the row count.
+    """
+    select = getattr(serializer_class, 'select_related_fields', ())
+    prefetch = getattr(serializer_class, 'prefetch_related_fields', ())
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
@@ -0,0 +1,92 @@
+"""
+orjson-based renderer and parser for the REST API, enabled in settings
+with FAST_JSON=True. Output matches DRF's JSONRenderer for the project's
+types: Decimal as float, datetimes as ISO 8601 with milliseconds and 'Z' for
+UTC, anything else through DRF's own encoder. Without orjson installed both
+classes behave exactly like the DRF defaults.
+
+RawJSON marks text that is already valid JSON (e.g. stored polygons), so it
+is embedded in the output as is instead of being parsed and re-encoded.
+"""
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# orjson < 3.9 has no Fragment, raw JSON is then parsed once and re-encoded
+FRAGMENT = getattr(orjson, 'Fragment', None)
+
+ORJSON_OPTIONS = (
+    # Datetimes go through DRF's encoder for its exact format (ms precision, 'Z')
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if orjson else 0
+)
+
+
+class RawJSON:
+    """Already serialized JSON text, rendered verbatim by JSON renderers"""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f'RawJSON({self.text[:40]!r})'
+
+
+class PassthroughJSONEncoder(JSONEncoder):
+    """DRF's encoder, plus RawJSON for the stdlib code path"""
+
+    def default(self, obj):
+        if isinstance(obj, RawJSON):
+            return json.loads(obj.text)
+        return super().default(obj)
+
+
+_drf_encoder = PassthroughJSONEncoder()
+
+
+def _default(obj):
+    if isinstance(obj, RawJSON):
+        if FRAGMENT is not None:
+            return FRAGMENT(obj.text)
+        return orjson.loads(obj.text)
+    return _drf_encoder.default(obj)
+
+
+def supports_raw_json(renderer):
+    """True when RawJSON values can be handed to this renderer"""
+    return isinstance(renderer, JSONRenderer) and issubclass(renderer.encoder_class, PassthroughJSONEncoder)
+
+
+class ORJSONRenderer(JSONRenderer):
+    encoder_class = PassthroughJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
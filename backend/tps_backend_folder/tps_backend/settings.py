@@ -51,6 +51,8 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # After WhiteNoise: static files are served pre-compressed by it
+    'tps_backend.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -106,6 +108,26 @@ DATABASES = {
 #     }
 # }
 
+# Shared cache for version stamps and cached settings. Set REDIS_URL in
+# production so every gunicorn worker and instance sees a bump immediately.
+# Without it each worker falls back to its own in-memory cache, where
+# version stamps expire after LOCAL_VERSION_TIMEOUT (tps_backend.versioning)
+# so changes made elsewhere show up within that window.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = []
 
 PASSWORD_HASHERS = [
@@ -134,6 +156,20 @@ REST_FRAMEWORK = {
     ),
 }
 
+# orjson renderer/parser (tps_backend.renderers), same output as the DRF
+# defaults for the project's types. Opt in with FAST_JSON=True.
+FAST_JSON = os.environ.get("FAST_JSON", "False") == "True"
+if FAST_JSON:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'tps_backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = (
+        'tps_backend.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    )
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 CORS_ALLOW_METHODS = [
@@ -157,6 +193,11 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Response headers readable by browser clients (delta sync cursor)
+CORS_EXPOSE_HEADERS = [
+    'x-sync-cursor',
+]
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 STATIC_URL = '/static/'
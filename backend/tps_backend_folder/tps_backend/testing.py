@@ -0,0 +1,40 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for list endpoints: the number of queries must not grow
+    with the number of rows, i.e. every per-row relation is covered by the
+    endpoint's select_related/prefetch_related plan.
+    """
+
+    def capture_queries(self, request):
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', response))
+        return [query['sql'] for query in context.captured_queries]
+
+    def assertConstantQueries(self, request, add_rows, rows=(2, 6)):
+        """
+        Call add_rows(n) for each size in `rows` (cumulative) and check that
+        request() issues the same number of queries at every size.
+        """
+        baseline = None
+        total = 0
+        for size in rows:
+            add_rows(size)
+            total += size
+            if baseline is None:
+                # Warm-up once rows exist: one-off loads on the first serialized row
+                # (e.g. the cached GlobalSettings) must not count as the baseline
+                request()
+                baseline = self.capture_queries(request)
+                continue
+            queries = self.capture_queries(request)
+            if len(queries) != len(baseline):
+                self.fail(
+                    f"Query count grows with rows: {len(baseline)} queries at {rows[0]} rows, "
+                    f"{len(queries)} at {total}:\n"
+                    + '\n'.join(queries)
+                )
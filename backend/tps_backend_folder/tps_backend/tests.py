@@ -0,0 +1,144 @@
+from datetime import timedelta
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+from django.db.models import Q, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from parkings.models import CityDailyCounter, Parking
+from users.models import CustomUser
+from vehicles.models import Fine, ParkingSession, Vehicle
+from .dashboard import _dashboard_data, dashboard_callback
+from .dates import day_bounds
+from .middleware import CompressionMiddleware
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    BODY = b'{"token": "abcdef"}' * 50
+
+    def compress(self, content_type):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        middleware = CompressionMiddleware(lambda request: HttpResponse(self.BODY, content_type=content_type))
+        fake_brotli = mock.Mock(compress=mock.Mock(return_value=b'br'))
+        with mock.patch('tps_backend.middleware.brotli', fake_brotli):
+            return middleware(request)
+
+    def test_json_uses_brotli(self):
+        response = self.compress('application/json')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response.content, b'br')
+
+    def test_html_falls_back_to_gzip(self):
+        # Pages with CSRF tokens need GZipMiddleware's BREACH mitigation
+        response = self.compress('text/html; charset=utf-8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+def baseline_dashboard():
+    """Dashboard stats and feed as computed before the single-pass queries, one query per number"""
+    today_start, today_end = day_bounds()
+    users = CustomUser.objects.filter(role='user')
+    feed = [
+        {'type': 'user', 'timestamp': user.date_joined, 'identifier': user.email, 'title': 'New User', 'amount': None}
+        for user in users.order_by('-date_joined')[:5]
+    ]
+    feed += [
+        {
+            'type': 'session', 'timestamp': session.start_time,
+            'identifier': session.vehicle.plate if session.vehicle else 'Unknown',
+            'title': 'Session Started', 'amount': session.total_cost,
+        }
+        for session in ParkingSession.objects.select_related('vehicle').order_by('-start_time')[:5]
+    ]
+    paid = Fine.objects.filter(status='paid', paid_at__isnull=False).select_related('vehicle').order_by('-paid_at')
+    feed += [
+        {
+            'type': 'fine_payment', 'timestamp': fine.paid_at, 'identifier': fine.vehicle.plate,
+            'title': 'Fine Paid', 'amount': fine.amount,
+        }
+        for fine in paid[:5]
+    ]
+    feed += [
+        {
+            'type': 'fine_issued', 'timestamp': fine.issued_at, 'identifier': fine.vehicle.plate,
+            'title': 'Violation Issued', 'amount': fine.amount,
+        }
+        for fine in Fine.objects.select_related('vehicle').order_by('-issued_at')[:5]
+    ]
+    feed.sort(key=lambda row: row['timestamp'], reverse=True)
+    return {
+        'stats': {
+            'total_users': users.count(),
+            'new_users_today': users.filter(date_joined__gte=today_start, date_joined__lt=today_end).count(),
+            'active_sessions': ParkingSession.objects.filter(is_active=True).count(),
+            'all_revenue': round(CityDailyCounter.objects.aggregate(sum=Sum('revenue'))['sum'] or 0, 2),
+            'today_revenue': round(
+                CityDailyCounter.objects.filter(day=timezone.localdate()).aggregate(sum=Sum('revenue'))['sum'] or 0, 2,
+            ),
+            'active_violations_count': Fine.objects.exclude(status__in=['paid', 'cancelled']).count(),
+            'pending_disputes': Fine.objects.filter(status='disputed').count(),
+        },
+        'recent_activity': feed[:10],
+    }
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # Distinct timestamps, the feed order is then fully determined
+        minutes = count(1)
+        self.ago = lambda: now - timedelta(minutes=next(minutes) * 7)
+        parking = Parking.objects.create(name='Dashboard', city='Torino', address='Via Roma 1')
+        users = []
+        for n in range(7):
+            user = CustomUser.objects.create_user(f'user{n}@tps.test', 'password')
+            CustomUser.objects.filter(pk=user.pk).update(date_joined=self.ago() - timedelta(days=n % 3))
+            users.append(user)
+        CustomUser.objects.create_user('controller@tps.test', 'password', role='controller')
+        vehicles = [Vehicle.objects.create(user=user, plate=f'DB{n:05d}') for n, user in enumerate(users)]
+        sessions = []
+        for n, vehicle in enumerate(vehicles):
+            start = self.ago() - timedelta(days=n % 2)
+            sessions.append(ParkingSession.objects.create(
+                user=vehicle.user, vehicle=vehicle, parking_lot=parking, start_time=start,
+                is_active=n % 3 == 0, total_cost=Decimal(f'{n}.50'),
+            ))
+        ParkingSession.objects.create(user=users[0], parking_lot=parking, start_time=self.ago())
+        for n, status in enumerate(['paid', 'paid', 'unpaid', 'disputed', 'cancelled', 'paid', 'unpaid']):
+            issued_at = self.ago()
+            Fine.objects.create(
+                vehicle=vehicles[n], session=sessions[n], amount=Decimal(f'{40 + n}.00'), issued_at=issued_at,
+                status=status, paid_at=self.ago() if status == 'paid' else None,
+            )
+
+    def test_matches_per_query_baseline(self):
+        self.assertEqual(_dashboard_data(), baseline_dashboard())
+
+    def test_deleted_sessions_leave_the_revenue(self):
+        session = ParkingSession.objects.create(
+            user=CustomUser.objects.get(email='user0@tps.test'), parking_lot=Parking.objects.get(),
+            total_cost=Decimal('9.99'),
+        )
+        session.delete()
+        # Owners deleting a session, or a vehicle with its sessions
+        Vehicle.objects.get(plate='DB00002').delete()
+
+        # Exact again, as when revenue was summed over the session table
+        today_start, today_end = day_bounds()
+        revenue = ParkingSession.objects.aggregate(
+            all=Sum('total_cost'),
+            today=Sum('total_cost', filter=Q(start_time__gte=today_start, start_time__lt=today_end)),
+        )
+        stats = _dashboard_data()['stats']
+        self.assertEqual(stats['all_revenue'], revenue['all'])
+        self.assertEqual(stats['today_revenue'], revenue['today'])
+        self.assertEqual(stats['active_sessions'], ParkingSession.objects.filter(is_active=True).count())
+
+    def test_cache_refreshes_after_a_write(self):
+        context = dashboard_callback(None, {})
+        self.assertEqual(context['stats'], baseline_dashboard()['stats'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Fine.objects.create(vehicle=Vehicle.objects.first(), status='disputed')
+        self.assertEqual(dashboard_callback(None, {})['stats']['pending_disputes'], 2)
+        self.assertEqual(dashboard_callback(None, {}), {**context, **baseline_dashboard()})
@@ -4,6 +4,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from . import views
 
 # Customize admin site
 admin.site.site_header = "TPS Management System"
@@ -17,6 +18,11 @@ urlpatterns = [
     path('api/payments/', include('payments.urls')),
     path('api/', include('parkings.urls')),
     path('api/', include('vehicles.urls')),
+
+    # Live push channel (Server-Sent Events)
+    path('api/events/ticket/', views.stream_ticket, name='events-ticket'),
+    path('api/events/parkings/<int:pk>/', views.parking_events, name='parking-events'),
+    path('api/events/city/', views.city_events, name='city-events'),
 ]
 
 if settings.DEBUG:
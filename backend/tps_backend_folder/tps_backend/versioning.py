@@ -0,0 +1,53 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY_PREFIX = 'version:'
+
+# Cache backends that live inside a single process
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Without a shared cache a bump only reaches the process that made it (other
+# workers, instances, management commands never see it). Stamps then expire
+# after this many seconds and are re-seeded, which bounds how long any process
+# serves stale derived data. With a shared cache stamps never expire.
+LOCAL_VERSION_TIMEOUT = 30
+
+
+def _cache_key(name):
+    return f'{VERSION_KEY_PREFIX}{name}'
+
+
+def version_timeout():
+    """Timeout of version keys: None on a shared cache, LOCAL_VERSION_TIMEOUT otherwise"""
+    if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_BACKENDS:
+        return LOCAL_VERSION_TIMEOUT
+    return None
+
+
+def get_version(name):
+    """
+    Return the current version stamp for a named resource.
+    A missing key (first use, eviction or expiry) is seeded with a time-based
+    value, so a re-seeded counter never collides with a version seen before.
+    """
+    key = _cache_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Invalidate everything derived from the named resource"""
+    key = _cache_key(name)
+    try:
+        # incr keeps the key's expiry
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), version_timeout())
+        return cache.get(key)
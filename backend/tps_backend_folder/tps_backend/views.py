@@ -0,0 +1,165 @@
+"""
+Server-Sent Events streams replacing the polling of the manager and
+officer apps. Each stream starts with a `snapshot` event, then pushes
+`occupancy`, `session_started`, `session_ended`, `shift_started` and
+`shift_ended` events as they are committed. A `resync` event asks the
+client to reload its state (it fell too far behind). Comment lines are
+sent as keep-alives.
+
+Browsers' EventSource cannot set headers, so besides the Authorization
+header the streams accept `?ticket=`: a signed, one-use ticket valid for
+TICKET_MAX_AGE_SECONDS, issued by POST /api/events/ticket/. Unlike the JWT
+it is useless once it shows up in an access log.
+
+The streams need the ASGI server (tps_backend.asgi); under WSGI they
+answer 501 instead of tying up a worker.
+"""
+import asyncio
+import json
+import secrets
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from parkings.models import Parking
+from users.models import CustomUser, Shift
+from .events import ALL_CITIES, broker, city_channel, parking_channel
+from .live import occupancy_rows, shift_data
+
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+STREAM_ROLES = ['controller', 'manager', 'superuser']
+
+TICKET_MAX_AGE_SECONDS = 30
+TICKET_SALT = 'tps_backend.views.stream_ticket'
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stream_ticket(request):
+    """One-use ticket for opening an event stream with ?ticket="""
+    ticket = signing.dumps({'user': request.user.pk, 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT)
+    return Response({'ticket': ticket, 'expires_in': TICKET_MAX_AGE_SECONDS})
+
+
+def _redeem_ticket(ticket):
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=TICKET_MAX_AGE_SECONDS)
+    except signing.BadSignature:
+        return None
+    # First redemption claims the nonce (across workers when the cache is shared)
+    if not cache.add(f'events:ticket:{payload["nonce"]}', True, TICKET_MAX_AGE_SECONDS):
+        return None
+    return CustomUser.objects.filter(pk=payload['user'], is_active=True).first()
+
+
+def _authenticate(request):
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        ticket = request.GET.get('ticket')
+        return _redeem_ticket(ticket) if ticket else None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def _not_asgi():
+    # StreamingHttpResponse under WSGI drains the async iterator before sending anything
+    return JsonResponse({"detail": "Live events require the ASGI server."}, status=501)
+
+
+def _city_allowed(user, city):
+    if user.is_superuser:
+        return True
+    return user.role in STREAM_ROLES and city in (user.allowed_cities or [])
+
+
+def _parking_snapshot(parking):
+    return {'occupancy': occupancy_rows(parking_id=parking.id)}
+
+
+def _city_snapshot(city):
+    shifts = Shift.objects.filter(status='OPEN').select_related('officer')
+    return {
+        'occupancy': occupancy_rows(parking__city=city),
+        'active_officers': [
+            shift_data(shift) for shift in shifts
+            if shift.officer.is_superuser or city in (shift.officer.allowed_cities or [])
+        ],
+    }
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":"))}\n\n'
+
+
+async def _stream(channels, snapshot):
+    subscription = broker.subscribe(channels)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        yield _sse('snapshot', await sync_to_async(snapshot)())
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield _sse(message['event'], message['data'])
+    finally:
+        # Runs when the client disconnects and the server cancels the stream
+        broker.unsubscribe(subscription)
+
+
+def _event_stream(channels, snapshot):
+    response = StreamingHttpResponse(_stream(channels, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def parking_events(request, pk):
+    """Live occupancy and sessions of one parking (manager parking detail)"""
+    if not isinstance(request, ASGIRequest):
+        return _not_asgi()
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    parking = await Parking.objects.filter(pk=pk).only('id', 'city').afirst()
+    if parking is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    if not _city_allowed(user, parking.city):
+        return JsonResponse({"detail": f"Unauthorized city: {parking.city}"}, status=403)
+
+    return _event_stream([parking_channel(parking.id)], lambda: _parking_snapshot(parking))
+
+
+@require_GET
+async def city_events(request):
+    """Live occupancy, sessions and officer shifts of a city (?city=<name>)"""
+    if not isinstance(request, ASGIRequest):
+        return _not_asgi()
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    city = request.GET.get('city')
+    if not city:
+        return JsonResponse({"detail": "City parameter is required."}, status=400)
+    if not _city_allowed(user, city):
+        return JsonResponse({"detail": f"Unauthorized city: {city}"}, status=403)
+
+    return _event_stream([city_channel(city), city_channel(ALL_CITIES)], lambda: _city_snapshot(city))
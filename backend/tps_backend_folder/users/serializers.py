@@ -5,7 +5,7 @@ from django.core import exceptions
 from django.contrib.auth.tokens import default_token_generator
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import serializers
-from vehicles.models import GlobalSettings 
+from vehicles.global_settings import get_global_settings
 
 
 class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -21,7 +21,7 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
         if self.user.role != 'user' and not self.user.is_superuser:
             raise serializers.ValidationError({"detail": "Accesso negato. Questa app è solo per clienti."})
         if self.user.role == 'user':
-            config = GlobalSettings.objects.first()
+            config = get_global_settings()
             limit = config.max_violations if config else 3
             if self.user.violations_count >= limit:
                 raise serializers.ValidationError(
@@ -1,3 +1,79 @@
-from django.test import TestCase
+import time
+from itertools import count
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from tps_backend.testing import QueryBudgetMixin
+from tps_backend.versioning import bump_version
+from vehicles.global_settings import LOCAL_TTL_SECONDS, SETTINGS_VERSION, invalidate_global_settings
+from vehicles.models import Fine, GlobalSettings, Vehicle
+from .models import CustomUser, Shift
 
-# Create your tests here.
+_sequence = count()
+
+
+class UserListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.manager = CustomUser.objects.create_user(
+            'manager@tps.test', 'password', role='manager', allowed_cities=['Torino'],
+        )
+        self.client = APIClient()
+
+    def add_fines(self, rows):
+        for _ in range(rows):
+            vehicle = Vehicle.objects.create(user=self.user, plate=f'TF{next(_sequence):05d}')
+            Fine.objects.create(vehicle=vehicle)
+
+    def add_shifts(self, rows):
+        for _ in range(rows):
+            officer = CustomUser.objects.create_user(
+                f'officer{next(_sequence)}@tps.test', 'password', role='controller', allowed_cities=['Torino'],
+            )
+            Shift.objects.create(officer=officer)
+            Shift.objects.create(officer=self.manager)
+
+    def test_user_fines(self):
+        self.client.force_authenticate(self.user)
+        self.assertConstantQueries(lambda: self.client.get('/api/users/me/fines/'), self.add_fines)
+
+    def test_shift_history(self):
+        self.client.force_authenticate(self.manager)
+        self.assertConstantQueries(lambda: self.client.get('/api/users/shifts/history/'), self.add_shifts)
+
+    def test_active_officers(self):
+        self.client.force_authenticate(self.manager)
+        self.assertConstantQueries(
+            lambda: self.client.get('/api/users/shifts/active-officers/?city=Torino'), self.add_shifts,
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ViolationTypesTests(TestCase):
+    URL = '/api/users/violations/types/'
+    OLD = [{'name': 'No Parking', 'amount': 50}]
+    NEW = [{'name': 'No Parking', 'amount': 80}]
+
+    def setUp(self):
+        GlobalSettings.objects.create(violation_config=self.OLD)
+        invalidate_global_settings()
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user('officer@tps.test', 'password'))
+
+    def test_etag_follows_the_served_copy(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.json(), self.OLD)
+        etag = response['ETag']
+
+        # Saved by another worker: the stamp moves on while the local copy is still trusted
+        GlobalSettings.objects.update(violation_config=self.NEW)
+        bump_version(SETTINGS_VERSION)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.json(), self.OLD)
+        self.assertEqual(response['ETag'], etag)
+
+        with mock.patch('time.monotonic', return_value=time.monotonic() + LOCAL_TTL_SECONDS + 1):
+            response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.NEW)
+        self.assertNotEqual(response['ETag'], etag)
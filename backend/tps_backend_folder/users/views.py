@@ -28,7 +28,11 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from .models import Shift
 from .serializers import ShiftSerializer
 from django.utils import timezone
-from vehicles.models import Vehicle, Fine, GlobalSettings, ParkingSession
+from vehicles.models import Vehicle, Fine, ParkingSession, normalize_plate
+from vehicles.global_settings import get_global_settings, global_settings_snapshot
+from tps_backend.conditional import conditional
+from django.utils.decorators import method_decorator
+from parkings.changes import FINE, current_cursor, stamp_cursor, sync_delta
 from rest_framework.parsers import MultiPartParser, FormParser
 from datetime import timedelta
 
@@ -51,7 +55,7 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
             raise serializers.ValidationError({"detail": "Access denied."})
 
         if self.user.role == 'user':
-            config = GlobalSettings.objects.first()
+            config = get_global_settings()
             limit = config.max_violations if config else 3
             if self.user.violations_count >= limit:
                 raise serializers.ValidationError(
@@ -344,7 +348,7 @@ class ReportViolationView(APIView):
         if not plate or not reason:
             return Response({"detail": "Plate and reason are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        config = GlobalSettings.objects.first()
+        config = get_global_settings()
         
         if config and config.violation_config:
             violation_prices = {item['name']: float(item['amount']) for item in config.violation_config}
@@ -362,7 +366,7 @@ class ReportViolationView(APIView):
         amount = violation_prices[reason]
 
         try:
-            vehicle = Vehicle.objects.get(plate__iexact=plate)
+            vehicle = Vehicle.objects.get(plate_normalized=normalize_plate(plate))
             user = vehicle.user
 
             user.violations_count += 1
@@ -391,24 +395,32 @@ class ReportViolationView(APIView):
         except Vehicle.DoesNotExist:
             return Response({"detail": "Vehicle not found."}, status=status.HTTP_404_NOT_FOUND)
 
+def _fine_rows(fines):
+    data = []
+    for fine in fines:
+        data.append({
+            'id': fine.id,
+            'vehicle_plate': fine.vehicle.plate,
+            'amount': fine.amount,
+            'reason': fine.reason,
+            'status': fine.status,
+            'issued_at': fine.issued_at,
+            'notes': fine.notes if hasattr(fine, 'notes') else "",
+            'contestation_reason': fine.contestation_reason 
+        })
+    return data
+
 class UserFinesView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        fines = Fine.objects.filter(vehicle__user=request.user).order_by('-issued_at')
-        data = []
-        for fine in fines:
-            data.append({
-                'id': fine.id,
-                'vehicle_plate': fine.vehicle.plate,
-                'amount': fine.amount,
-                'reason': fine.reason,
-                'status': fine.status,
-                'issued_at': fine.issued_at,
-                'notes': fine.notes if hasattr(fine, 'notes') else "",
-                'contestation_reason': fine.contestation_reason 
-            })
-        return Response(data, status=status.HTTP_200_OK)
+        """All fines of the user's vehicles, or with ?since=<cursor> only those changed after it"""
+        cursor = current_cursor()
+        fines = Fine.objects.filter(vehicle__user=request.user).select_related('vehicle').order_by('-issued_at')
+        delta = sync_delta(request, FINE, fines, _fine_rows, owner_id=request.user.id)
+        if delta is not None:
+            return delta
+        return stamp_cursor(Response(_fine_rows(fines), status=status.HTTP_200_OK), cursor)
 
 class PayFineView(APIView):
     permission_classes = [IsAuthenticated]
@@ -427,7 +439,7 @@ class PayFineView(APIView):
         if user.violations_count > 0:
             user.violations_count -= 1
             
-            config = GlobalSettings.objects.first()
+            config = get_global_settings()
             limit = config.max_violations if config else 3
 
             if user.violations_count < limit and not user.is_active:
@@ -470,7 +482,7 @@ class CheckPlateView(APIView):
             return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
             
         try:
-            vehicle = Vehicle.objects.get(plate__iexact=plate)
+            vehicle = Vehicle.objects.get(plate_normalized=normalize_plate(plate))
         except Vehicle.DoesNotExist:
             return Response({"status": "NO_VEHICLE", "message": "Vehicle not found in the system."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -488,7 +500,7 @@ class CheckPlateView(APIView):
                 "expires_at": last_session.end_time
             }, status=status.HTTP_200_OK)
 
-        config = GlobalSettings.objects.first()
+        config = get_global_settings()
         grace_minutes = config.grace_period_minutes if config else 15
         
         expiration_time = last_session.end_time if last_session.end_time else now
@@ -511,6 +523,13 @@ class CheckPlateView(APIView):
     
 # In api/views.py
 
+def _violation_types_etag(request):
+    # The body is rendered from this same copy, so a worker still serving an
+    # older row never labels it with the newer version
+    request.global_settings, version = global_settings_snapshot()
+    return ['violation_types', version]
+
+
 class ViolationTypesView(APIView):
     """
     GET /api/violations/types/
@@ -518,8 +537,9 @@ class ViolationTypesView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional(_violation_types_etag))
     def get(self, request):
-        config = GlobalSettings.objects.first()
+        config = request.global_settings
         
         if not config or not config.violation_config:
             return Response([
@@ -5,3 +5,10 @@ class VehiclesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vehicles'
     verbose_name = 'Vehicle Management'
+
+    def ready(self):
+        from . import global_settings  # noqa: F401
+        # Admin dashboard cache invalidation receivers
+        from tps_backend import dashboard  # noqa: F401
+        # Live push channel producers
+        from tps_backend import live  # noqa: F401
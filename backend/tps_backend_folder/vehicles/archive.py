@@ -0,0 +1,139 @@
+import json
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from parkings.changes import FINE, SESSION, log_changes
+from .models import ArchivedFine, ArchivedParkingSession, ArchiveExport, Fine, ParkingSession
+
+# Closed rows older than this many days leave the live tables
+DEFAULT_HORIZON_DAYS = 365
+BATCH_SIZE = 5000
+
+SETTLED_FINE_STATUSES = ['paid', 'cancelled']
+
+SESSION_COLUMNS = [
+    'id', 'user_id', 'vehicle_id', 'parking_lot_id',
+    'start_time', 'end_time', 'total_cost', 'duration_purchased_minutes',
+    'planned_end_time', 'prepaid_cost', 'is_expired', 'expired_at',
+]
+FINE_COLUMNS = [
+    'id', 'vehicle_id', 'session_id', 'issued_by_id',
+    'amount', 'reason', 'status', 'issued_at', 'paid_at',
+    'notes', 'evidence_image', 'contestation_reason',
+]
+
+# Columns whose day a row counts on in the daily rollups
+ACTIVITY_COLUMNS = ('start_time', 'end_time', 'issued_at', 'paid_at')
+
+# Change log entry (object_id, parking_id, owner_id) of an archived row
+CHANGE_LOG_COLUMNS = {
+    Fine: (FINE, ['id', 'session__parking_lot_id', 'vehicle__user_id']),
+    ParkingSession: (SESSION, ['id', 'parking_lot_id', 'user_id']),
+}
+
+
+def archivable_fines(cutoff):
+    return Fine.objects.filter(status__in=SETTLED_FINE_STATUSES, issued_at__lt=cutoff)
+
+
+def archivable_sessions(cutoff):
+    # Sessions still referenced by a live fine stay, the fine would lose its link
+    return ParkingSession.objects.filter(is_active=False, start_time__lt=cutoff).exclude(
+        Exists(Fine.objects.filter(session=OuterRef('pk')))
+    )
+
+
+def _session_rows(queryset):
+    return queryset.values(*SESSION_COLUMNS, plate=F('vehicle__plate'), city=F('parking_lot__city'))
+
+
+def _fine_rows(queryset):
+    return queryset.values(
+        *FINE_COLUMNS,
+        plate=F('vehicle__plate'),
+        parking_lot_id=F('session__parking_lot_id'),
+        city=F('session__parking_lot__city'),
+    )
+
+
+def _delete_ids(model, ids):
+    """
+    Plain DELETE without the ORM collector: moving rows to cold storage
+    must not fire the live-data signals (counters, enforcement log, bans).
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+
+
+def _log_removed(model, ids):
+    # Archived rows leave the live lists, delta-syncing clients must drop them
+    resource, columns = CHANGE_LOG_COLUMNS[model]
+    log_changes(resource, model.objects.filter(id__in=ids).values_list(*columns), deleted=True)
+
+
+def _record_export(export, kind, rows):
+    """Count an exported batch and push the export's last_day past every day it counted on"""
+    last_day = max(
+        timezone.localdate(row[column]) for row in rows for column in ACTIVITY_COLUMNS if row.get(column)
+    )
+    ArchiveExport.objects.filter(pk=export.pk).update(
+        last_day=Greatest(Coalesce('last_day', Value(last_day)), Value(last_day)),
+        **{f'{kind}s': F(f'{kind}s') + len(rows)},
+    )
+
+
+def rebuild_floor():
+    """First day rebuild_counters can recompute, None while no export took history out of the database"""
+    last_day = ArchiveExport.objects.aggregate(last=Max('last_day'))['last']
+    return last_day + timedelta(days=1) if last_day else None
+
+
+def _archive(queryset, rows_of, cold_model, kind, out, batch_size, export=None):
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(rows_of(queryset.order_by('id'))[:batch_size])
+            if not rows:
+                return total
+            for row in rows:
+                row['plate'] = row['plate'] or ''
+                if 'city' in row:
+                    row['city'] = row['city'] or ''
+            if out is not None:
+                for row in rows:
+                    out.write(json.dumps({'kind': kind, **row}, cls=DjangoJSONEncoder) + '\n')
+                _record_export(export, kind, rows)
+            else:
+                cold_model.objects.bulk_create([cold_model(**row) for row in rows], ignore_conflicts=True)
+            ids = [row['id'] for row in rows]
+            _log_removed(queryset.model, ids)
+            _delete_ids(queryset.model, ids)
+        total += len(rows)
+
+
+def archive_history(horizon_days=DEFAULT_HORIZON_DAYS, out=None, batch_size=BATCH_SIZE, now=None):
+    """
+    Move settled fines and closed sessions older than the horizon out of
+    the live tables, into the Archived* tables or, when `out` is a text
+    stream, as JSON lines into it. Returns (sessions, fines) moved.
+    Rows exported to a stream are gone from the database: the run is
+    recorded as an ArchiveExport, and rebuild_counters no longer recomputes
+    the days they counted on.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=horizon_days)
+    export = None
+    if out is not None:
+        export = ArchiveExport.objects.create(path=str(getattr(out, 'name', '')), cutoff=cutoff)
+    # Fines first, so their sessions become archivable in the same run
+    fines = _archive(archivable_fines(cutoff), _fine_rows, ArchivedFine, 'fine', out, batch_size, export)
+    sessions = _archive(
+        archivable_sessions(cutoff), _session_rows, ArchivedParkingSession, 'session', out, batch_size, export,
+    )
+    if export is not None and not (sessions or fines):
+        export.delete()
+    return sessions, fines
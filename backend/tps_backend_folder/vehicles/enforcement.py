@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from .global_settings import get_global_settings
+from .models import ParkingSession, Vehicle, normalize_plate
+
+NO_SESSION = 'no_session'
+ACTIVE = 'active'
+GRACE_PERIOD = 'grace_period'
+EXPIRED = 'expired'
+UNAUTHORIZED = 'unauthorized'
+
+# Upper bound of plates accepted by one bulk check
+MAX_BULK_PLATES = 500
+
+# Grace minutes when no GlobalSettings row exists, as ParkingSessionSerializer reports
+DEFAULT_GRACE_MINUTES = 5
+
+
+@dataclass(frozen=True)
+class PlateStatus:
+    """
+    Enforcement verdict for one plate.
+    `reference_time` is the effective end of the paid period, set once it has passed.
+    """
+    status: str
+    can_issue_ticket: bool
+    message: str
+    session: ParkingSession = None
+    reference_time: datetime = None
+
+
+def grace_minutes():
+    config = get_global_settings()
+    return config.grace_period_minutes if config else DEFAULT_GRACE_MINUTES
+
+
+def enforcement_sessions():
+    """Sessions with everything a controller screen needs loaded in the same query"""
+    return ParkingSession.objects.select_related('vehicle', 'parking_lot').order_by('-start_time')
+
+
+def session_status(session, now=None, grace=None):
+    """Active / grace period / expired verdict for a session, computed in memory"""
+    now = now or timezone.now()
+    grace = grace_minutes() if grace is None else grace
+    planned_end = session.planned_end_time
+
+    if session.is_active and not session.end_time and (not planned_end or now < planned_end):
+        return PlateStatus(ACTIVE, False, "Session is active (Ongoing).", session)
+
+    reference_time = session.paid_until or now
+
+    if now < reference_time:
+        return PlateStatus(ACTIVE, False, "Session is active.", session)
+
+    grace_end = reference_time + timedelta(minutes=grace)
+    if now < grace_end:
+        grace_end_local = timezone.localtime(grace_end).strftime('%H:%M')
+        return PlateStatus(
+            GRACE_PERIOD, False, f"In Grace Period (Expires at {grace_end_local})",
+            session, reference_time,
+        )
+    return PlateStatus(EXPIRED, True, "Session expired. You can issue a ticket.", session, reference_time)
+
+
+def no_session_status(plate):
+    return PlateStatus(NO_SESSION, True, f"No session found for {plate}. Issue Ticket?")
+
+
+def resolve_plate(plate, now=None):
+    """
+    Latest session of a plate with its vehicle and parking in a single query,
+    then the verdict in memory.
+    """
+    normalized = normalize_plate(plate)
+    session = (
+        enforcement_sessions().filter(vehicle__plate_normalized=normalized).first()
+        if normalized else None
+    )
+    if session is None:
+        return no_session_status(plate)
+    return session_status(session, now)
+
+
+def resolve_plates(plates, now=None):
+    """
+    Bulk resolve_plate(): one query for the latest session of every plate,
+    whatever the number of plates. Returns verdicts in input order.
+    """
+    now = now or timezone.now()
+    normalized = {plate: normalize_plate(plate) for plate in plates}
+
+    latest_session = (
+        ParkingSession.objects.filter(vehicle=OuterRef('pk')).order_by('-start_time').values('pk')[:1]
+    )
+    latest_ids = (
+        Vehicle.objects.filter(plate_normalized__in={n for n in normalized.values() if n})
+        .values(latest=Subquery(latest_session))
+    )
+    sessions = {
+        session.vehicle.plate_normalized: session
+        for session in enforcement_sessions().filter(pk__in=latest_ids)
+    }
+
+    grace = grace_minutes()
+    return [
+        session_status(sessions[normalized[plate]], now, grace)
+        if normalized[plate] in sessions else no_session_status(plate)
+        for plate in plates
+    ]
+
+
+def can_inspect(user, session):
+    """Controllers only see sessions in their allowed cities"""
+    if user.is_superuser or getattr(user, 'role', None) != 'controller':
+        return True
+    if not session.parking_lot:
+        return True
+    return session.parking_lot.city in (getattr(user, 'allowed_cities', None) or [])
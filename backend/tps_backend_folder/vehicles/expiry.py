@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from datetime import timedelta
+from parkings.changes import SESSION, log_changes
+from parkings.counters import record_sessions_ended
+from tps_backend.live import publish_occupancy_on_commit
+from .enforcement import grace_minutes
+from .models import ParkingSession
+
+# Sessions expired per UPDATE, bounds lock time and statement size
+BATCH_SIZE = 10000
+
+
+def expirable_sessions(now=None):
+    """Active sessions whose planned end plus the grace period has passed"""
+    now = now or timezone.now()
+    deadline = now - timedelta(minutes=grace_minutes())
+    return ParkingSession.objects.filter(is_active=True, planned_end_time__lt=deadline)
+
+
+def expire_batch(now=None, batch_size=BATCH_SIZE):
+    """
+    Expire up to batch_size sessions with set-based statements and
+    adjust the parking counters. Returns the number of sessions expired.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            expirable_sessions(now)
+            .select_for_update(skip_locked=True)
+            .order_by('planned_end_time')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        batch = ParkingSession.objects.filter(id__in=ids)
+        counts = dict(
+            batch.values('parking_lot_id').annotate(cnt=Count('id')).order_by().values_list('parking_lot_id', 'cnt')
+        )
+        log_changes(SESSION, batch.values_list('id', 'parking_lot_id', 'user_id'))
+        # Same outcome as end_session(), the paid period stops at the planned end
+        expired = batch.update(
+            is_active=False,
+            is_expired=True,
+            expired_at=now,
+            end_time=F('planned_end_time'),
+            total_cost=F('prepaid_cost'),
+        )
+        record_sessions_ended(counts)
+        # One occupancy event per parking instead of one per expired session
+        publish_occupancy_on_commit(counts)
+    return expired
+
+
+def expire_sessions(now=None, batch_size=BATCH_SIZE):
+    """Expire every overdue session, batch after batch. Returns the total."""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        expired = expire_batch(now, batch_size)
+        total += expired
+        if expired < batch_size:
+            return total
@@ -0,0 +1,71 @@
+import threading
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from tps_backend.versioning import bump_version, get_version, version_timeout
+from .models import GlobalSettings
+
+SETTINGS_VERSION = 'vehicles:global_settings'
+
+# How long a worker trusts its local copy before re-checking the shared version
+LOCAL_TTL_SECONDS = 5
+
+_MISSING = object()
+_lock = threading.Lock()
+# (config, version) currently served by this process
+_local = {'current': None, 'checked_at': 0.0}
+
+
+def _cache_key(version):
+    return f'vehicles:global_settings:v{version}'
+
+
+def global_settings_snapshot():
+    """
+    (config, version) of the copy get_global_settings() serves, read together:
+    responses validated by an ETag must hash the version of the row they
+    actually contain, not the latest stamp, which may already be newer.
+    """
+    now = time.monotonic()
+    current = _local['current']
+    if current is not None and now - _local['checked_at'] < LOCAL_TTL_SECONDS:
+        return current
+
+    version = get_version(SETTINGS_VERSION)
+    with _lock:
+        current = _local['current']
+        if current is None or current[1] != version:
+            config = cache.get(_cache_key(version), _MISSING)
+            if config is _MISSING:
+                config = GlobalSettings.objects.first()
+                cache.set(_cache_key(version), config, version_timeout())
+            current = _local['current'] = (config, version)
+        _local['checked_at'] = now
+    return current
+
+
+def get_global_settings():
+    """
+    Active GlobalSettings row (the most recent one) or None.
+    Served from process memory; the shared version stamp is re-checked at most
+    every LOCAL_TTL_SECONDS, and the row itself is shared across workers
+    through the cache. Without a shared cache a save elsewhere is picked up
+    once the local stamp expires (LOCAL_VERSION_TIMEOUT in tps_backend.versioning).
+    The returned instance is shared: read it, never modify it.
+    """
+    return global_settings_snapshot()[0]
+
+
+def invalidate_global_settings():
+    bump_version(SETTINGS_VERSION)
+    with _lock:
+        _local['current'] = None
+
+
+@receiver(post_save, sender=GlobalSettings)
+@receiver(post_delete, sender=GlobalSettings)
+def global_settings_changed(sender, instance, **kwargs):
+    # After commit, so no worker caches a row that could still be rolled back
+    transaction.on_commit(invalidate_global_settings)
@@ -0,0 +1,30 @@
+import gzip
+from django.core.management.base import BaseCommand
+from vehicles.archive import BATCH_SIZE, DEFAULT_HORIZON_DAYS, archive_history
+
+
+class Command(BaseCommand):
+    help = "Move closed sessions and settled fines older than the horizon to cold storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=DEFAULT_HORIZON_DAYS,
+            help=f"Archive rows older than this many days (default {DEFAULT_HORIZON_DAYS})",
+        )
+        parser.add_argument(
+            '--file', metavar='PATH',
+            help=(
+                "Write the rows as gzip-compressed JSON lines to PATH instead of the archive tables. "
+                "They leave the database for good: rebuild_parking_counters keeps the daily rollups "
+                "of their days as they are and can no longer recompute them"
+            ),
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with gzip.open(options['file'], 'at', encoding='utf-8') as out:
+                sessions, fines = archive_history(options['days'], out, options['batch_size'])
+        else:
+            sessions, fines = archive_history(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {sessions} sessions and {fines} fines."))
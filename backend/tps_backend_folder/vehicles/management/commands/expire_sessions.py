@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from parkings.changes import prune_changes
+from vehicles.expiry import BATCH_SIZE, expire_sessions
+from vehicles.offline import prune_events
+
+
+class Command(BaseCommand):
+    help = "Expire active sessions past their planned end plus the grace period"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SECONDS',
+            help="Keep running, expiring sessions every SECONDS (0 = run once)",
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_sessions(batch_size=options['batch_size'])
+            pruned = prune_events()
+            pruned_changes = prune_changes()
+            self.stdout.write(
+                f"Expired {expired} sessions, pruned {pruned} enforcement events and {pruned_changes} change log entries."
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+        self.stdout.write(self.style.SUCCESS("Session expiry done."))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:40
+
+import re
+from django.db import migrations, models
+
+
+def normalize_plate(raw):
+    # Frozen copy of vehicles.models.normalize_plate
+    if not raw:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", raw.strip().upper())
+
+
+def backfill_plate_normalized(apps, schema_editor):
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+
+    seen = {}
+    vehicles = []
+    for vehicle in Vehicle.objects.only('id', 'plate').iterator(chunk_size=2000):
+        vehicle.plate_normalized = normalize_plate(vehicle.plate)
+        if vehicle.plate_normalized in seen:
+            raise RuntimeError(
+                f"Plates '{seen[vehicle.plate_normalized]}' and '{vehicle.plate}' normalize to "
+                f"'{vehicle.plate_normalized}'. Merge or rename one of the vehicles and migrate again."
+            )
+        seen[vehicle.plate_normalized] = vehicle.plate
+        vehicles.append(vehicle)
+    Vehicle.objects.bulk_update(vehicles, ['plate_normalized'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='plate_normalized',
+            field=models.CharField(editable=False, max_length=15, null=True),
+        ),
+        migrations.RunPython(backfill_plate_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='plate_normalized',
+            field=models.CharField(editable=False, max_length=15, unique=True),
+        ),
+    ]
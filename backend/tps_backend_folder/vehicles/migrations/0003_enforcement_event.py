@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_vehicle_plate_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnforcementEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('plate_normalized', models.CharField(max_length=15)),
+                ('valid_from', models.DateTimeField(blank=True, null=True)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('removed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Enforcement Event',
+                'verbose_name_plural': 'Enforcement Events',
+                'indexes': [models.Index(fields=['city', 'id'], name='vehicles_en_city_d1ba7d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0004_parking_counters'),
+        ('vehicles', '0003_enforcement_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['planned_end_time'], name='session_active_planned_end_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parkings', '0004_parking_counters'),
+        ('vehicles', '0004_session_expiry_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['vehicle'], name='session_active_vehicle_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='session_active_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['parking_lot', '-start_time'], name='session_active_parking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(fields=['vehicle', '-start_time'], name='session_vehicle_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(fields=['vehicle', '-end_time'], name='session_vehicle_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(fields=['parking_lot', 'start_time'], name='session_parking_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(fields=['user', '-start_time'], name='session_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsession',
+            index=models.Index(fields=['-start_time'], name='session_start_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0005_session_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFine',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('vehicle_id', models.BigIntegerField(null=True)),
+                ('plate', models.CharField(blank=True, max_length=15)),
+                ('session_id', models.BigIntegerField(null=True)),
+                ('issued_by_id', models.BigIntegerField(null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reason', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('unpaid', 'Unpaid'), ('paid', 'Paid'), ('disputed', 'Disputed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('issued_at', models.DateTimeField()),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('evidence_image', models.CharField(blank=True, max_length=255, null=True)),
+                ('contestation_reason', models.TextField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archived Fine',
+                'verbose_name_plural': 'Archived Fines',
+                'ordering': ['-issued_at'],
+                'indexes': [models.Index(fields=['vehicle_id', '-issued_at'], name='archived_fine_vehicle_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedParkingSession',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('vehicle_id', models.BigIntegerField(null=True)),
+                ('plate', models.CharField(blank=True, max_length=15)),
+                ('parking_lot_id', models.BigIntegerField(null=True)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('total_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('duration_purchased_minutes', models.IntegerField(default=0)),
+                ('planned_end_time', models.DateTimeField(blank=True, null=True)),
+                ('prepaid_cost', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('is_expired', models.BooleanField(default=False)),
+                ('expired_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archived Parking Session',
+                'verbose_name_plural': 'Archived Parking Sessions',
+                'ordering': ['-start_time'],
+                'indexes': [models.Index(fields=['parking_lot_id', 'start_time'], name='archived_session_parking_idx'), models.Index(fields=['vehicle_id', '-start_time'], name='archived_session_vehicle_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0006_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedfine',
+            name='city',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='archivedfine',
+            name='parking_lot_id',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
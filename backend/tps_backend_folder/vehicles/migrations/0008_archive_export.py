@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0007_archived_fine_parking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('cutoff', models.DateTimeField()),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('sessions', models.IntegerField(default=0)),
+                ('fines', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archive Export',
+                'verbose_name_plural': 'Archive Exports',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
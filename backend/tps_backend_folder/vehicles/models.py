@@ -1,9 +1,23 @@
-from django.db import models
+import re
+from django.db import models, transaction
 from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.utils import timezone
 from parkings.models import Parking
+from parkings.changes import FINE, SESSION, log_change
+from parkings.counters import (
+    record_session_started, record_session_changed, record_session_removed,
+    record_fine_issued, record_fine_paid, record_fine_removed,
+)
+
+
+def normalize_plate(raw: str) -> str:
+    if not raw:
+        return ""
+    s = raw.strip().upper()
+    s = re.sub(r"[^A-Z0-9]", "", s)
+    return s
 
 
 class GlobalSettings(models.Model):
@@ -30,6 +44,8 @@ class GlobalSettings(models.Model):
 class Vehicle(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     plate = models.CharField(max_length=15, unique=True)
+    # Uppercase alphanumerics only, every plate lookup goes through this column
+    plate_normalized = models.CharField(max_length=15, unique=True, editable=False)
     name = models.CharField(max_length=50, null=True)
     is_favorite = models.BooleanField(default=False)
 
@@ -40,6 +56,13 @@ class Vehicle(models.Model):
     def __str__(self):
         return f"{self.plate} ({self.name})"
 
+    def save(self, *args, **kwargs):
+        self.plate_normalized = normalize_plate(self.plate)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'plate' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'plate_normalized'}
+        super().save(*args, **kwargs)
+
 class ParkingSession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, null=True)
@@ -70,18 +93,132 @@ class ParkingSession(models.Model):
         verbose_name = "Parking Session"
         verbose_name_plural = "Parking Sessions"
         ordering = ['-start_time']
+        indexes = [
+            # Expiry scans only the active sessions, in deadline order
+            models.Index(
+                fields=['planned_end_time'],
+                condition=models.Q(is_active=True),
+                name='session_active_planned_end_idx',
+            ),
+            # Active-only partial indexes stay small however long the history grows
+            models.Index(
+                fields=['vehicle'],
+                condition=models.Q(is_active=True),
+                name='session_active_vehicle_idx',
+            ),
+            models.Index(
+                fields=['user'],
+                condition=models.Q(is_active=True),
+                name='session_active_user_idx',
+            ),
+            models.Index(
+                fields=['parking_lot', '-start_time'],
+                condition=models.Q(is_active=True),
+                name='session_active_parking_idx',
+            ),
+            # Latest session per vehicle (enforcement, plate checks)
+            models.Index(fields=['vehicle', '-start_time'], name='session_vehicle_start_idx'),
+            models.Index(fields=['vehicle', '-end_time'], name='session_vehicle_end_idx'),
+            # Per-parking day ranges and history windows
+            models.Index(fields=['parking_lot', 'start_time'], name='session_parking_start_idx'),
+            # A user's session list
+            models.Index(fields=['user', '-start_time'], name='session_user_start_idx'),
+            # Global recent activity
+            models.Index(fields=['-start_time'], name='session_start_idx'),
+        ]
 
     def end_session(self):
-        self.end_time = timezone.now()
-        self.is_active = False
-        self.total_cost = self.prepaid_cost 
-        self.save()
+        with transaction.atomic():
+            self.end_time = timezone.now()
+            self.is_active = False
+            self.total_cost = self.prepaid_cost 
+            # count_session_saved frees the active slot
+            self.save()
 
     def __str__(self):
         if self.vehicle:
             return f"Session {self.id} - {self.vehicle.plate}"
         return f"Session {self.id} - [No Vehicle]"
 
+    @property
+    def paid_until(self):
+        """End of the paid period, None while an open-ended session is running"""
+        if self.planned_end_time and self.end_time:
+            # Ended early: the paid period stops at the actual end
+            return min(self.end_time, self.planned_end_time)
+        return self.planned_end_time or self.end_time
+
+@receiver(pre_save, sender=ParkingSession)
+def remember_previous_session_state(sender, instance, **kwargs):
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (
+            ParkingSession.objects.filter(pk=instance.pk)
+            .values_list('is_active', 'parking_lot_id', 'parking_lot__city', 'total_cost').first()
+        )
+
+@receiver(post_save, sender=ParkingSession)
+def count_session_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if created:
+        record_session_started(instance)
+    elif previous:
+        record_session_changed(instance, previous)
+
+@receiver(post_delete, sender=ParkingSession)
+def count_session_removed(sender, instance, **kwargs):
+    record_session_removed(instance)
+
+
+class EnforcementEvent(models.Model):
+    """
+    Append-only log of session validity changes per city.
+    The id is the sequence number officers sync their offline snapshot from.
+    """
+    city = models.CharField(max_length=100)
+    plate_normalized = models.CharField(max_length=15)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    removed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Enforcement Event"
+        verbose_name_plural = "Enforcement Events"
+        indexes = [
+            models.Index(fields=['city', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.city} {self.plate_normalized}"
+
+def _log_enforcement_event(session, removed):
+    if not session.vehicle_id or not session.parking_lot_id:
+        return
+    EnforcementEvent.objects.create(
+        city=session.parking_lot.city,
+        plate_normalized=session.vehicle.plate_normalized,
+        valid_from=session.start_time,
+        valid_until=session.paid_until,
+        removed=removed,
+    )
+
+@receiver(post_save, sender=ParkingSession)
+def log_session_saved(sender, instance, **kwargs):
+    _log_enforcement_event(instance, removed=False)
+
+@receiver(post_delete, sender=ParkingSession)
+def log_session_deleted(sender, instance, **kwargs):
+    _log_enforcement_event(instance, removed=True)
+
+@receiver(post_save, sender=ParkingSession)
+@receiver(post_delete, sender=ParkingSession)
+def log_session_change(sender, instance, signal, **kwargs):
+    log_change(
+        SESSION, instance.pk, parking_id=instance.parking_lot_id, owner_id=instance.user_id,
+        deleted=signal is post_delete,
+    )
+
 # --- FINE / VIOLATION MODELS ---
 
 def fine_evidence_path(instance, filename):
@@ -118,6 +255,37 @@ class Fine(models.Model):
 
     def __str__(self):
         return f"Fine #{self.id} - {self.vehicle.plate}"
+
+@receiver(pre_save, sender=Fine)
+def remember_previous_fine_status(sender, instance, **kwargs):
+    instance._previous_payment = None
+    if instance.pk:
+        instance._previous_payment = (
+            Fine.objects.filter(pk=instance.pk).values_list('status', 'paid_at').first()
+        )
+
+@receiver(post_save, sender=Fine)
+def count_fine_saved(sender, instance, created, **kwargs):
+    previous_status, previous_paid_at = getattr(instance, '_previous_payment', None) or (None, None)
+    with transaction.atomic():
+        if created:
+            record_fine_issued(instance)
+        if instance.status == 'paid' and previous_status != 'paid':
+            record_fine_paid(instance)
+        elif previous_status == 'paid' and instance.status != 'paid':
+            record_fine_paid(instance, paid=False, paid_at=previous_paid_at)
+
+@receiver(post_delete, sender=Fine)
+def count_fine_removed(sender, instance, **kwargs):
+    record_fine_removed(instance)
+
+@receiver(post_save, sender=Fine)
+@receiver(post_delete, sender=Fine)
+def log_fine_change(sender, instance, signal, **kwargs):
+    log_change(
+        FINE, instance.pk, owner_id=instance.vehicle.user_id if instance.vehicle_id else None,
+        deleted=signal is post_delete,
+    )
     
 @receiver(post_save, sender=Fine)
 @receiver(post_delete, sender=Fine)
@@ -136,7 +304,8 @@ def update_user_violation_count(sender, instance, **kwargs):
     
     # --- LOGICA DINAMICA (MAX VIOLATIONS) ---
     # 1. Recuperiamo la configurazione attiva
-    config = GlobalSettings.objects.first()
+    from .global_settings import get_global_settings
+    config = get_global_settings()
     
     # 2. Se esiste, usiamo il suo valore, altrimenti fallback a 3
     limit = config.max_violations if config else 3
@@ -147,4 +316,90 @@ def update_user_violation_count(sender, instance, **kwargs):
     else:
         user.is_active = True 
         
-    user.save(update_fields=['violations_count', 'is_active'])
\ No newline at end of file
+    user.save(update_fields=['violations_count', 'is_active'])
+# --- COLD STORAGE ---
+# Closed sessions and settled fines past the archive horizon are moved here
+# by `manage.py archive_history`, keeping the live tables small. Relations are
+# kept as plain ids so archived rows never block deletes in the live tables.
+
+class ArchivedParkingSession(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(null=True)
+    vehicle_id = models.BigIntegerField(null=True)
+    plate = models.CharField(max_length=15, blank=True)
+    parking_lot_id = models.BigIntegerField(null=True)
+    city = models.CharField(max_length=100, blank=True)
+
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField(null=True, blank=True)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    duration_purchased_minutes = models.IntegerField(default=0)
+    planned_end_time = models.DateTimeField(null=True, blank=True)
+    prepaid_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    is_expired = models.BooleanField(default=False)
+    expired_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Archived Parking Session"
+        verbose_name_plural = "Archived Parking Sessions"
+        ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['parking_lot_id', 'start_time'], name='archived_session_parking_idx'),
+            models.Index(fields=['vehicle_id', '-start_time'], name='archived_session_vehicle_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived session {self.id} - {self.plate or '[No Vehicle]'}"
+
+class ArchivedFine(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    vehicle_id = models.BigIntegerField(null=True)
+    plate = models.CharField(max_length=15, blank=True)
+    session_id = models.BigIntegerField(null=True)
+    parking_lot_id = models.BigIntegerField(null=True)
+    city = models.CharField(max_length=100, blank=True)
+    issued_by_id = models.BigIntegerField(null=True)
+
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    reason = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=Fine.STATUS_CHOICES)
+    issued_at = models.DateTimeField()
+    paid_at = models.DateTimeField(null=True, blank=True)
+    notes = models.TextField(blank=True, null=True)
+    evidence_image = models.CharField(max_length=255, blank=True, null=True)
+    contestation_reason = models.TextField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Archived Fine"
+        verbose_name_plural = "Archived Fines"
+        ordering = ['-issued_at']
+        indexes = [
+            models.Index(fields=['vehicle_id', '-issued_at'], name='archived_fine_vehicle_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived fine #{self.id} - {self.plate}"
+
+class ArchiveExport(models.Model):
+    """
+    A run of `archive_history --file`: rows moved to a file instead of the
+    Archived* tables. Nothing left in the database covers them, so
+    rebuild_counters keeps the rollups up to `last_day` as they are.
+    """
+    path = models.CharField(max_length=255, blank=True)
+    cutoff = models.DateTimeField()
+    # Latest day any exported row counted on (start, end, issue or payment)
+    last_day = models.DateField(null=True, blank=True)
+    sessions = models.IntegerField(default=0)
+    fines = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Archive Export"
+        verbose_name_plural = "Archive Exports"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Export to {self.path or '[stream]'} ({self.sessions} sessions, {self.fines} fines)"
@@ -0,0 +1,140 @@
+"""
+Offline enforcement snapshots for the officer app.
+
+A snapshot lists, for one city, every plate whose latest session is still
+valid or within its grace period, as rows of
+[plate_normalized, valid_from, valid_until, grace_until] (epoch seconds,
+valid_until/grace_until null while an open-ended session runs).
+
+`seq` is the id of the last EnforcementEvent already reflected. Passing it
+back as `since` returns only the plates changed afterwards:
+`upserts` replace the row of their plate, `removed` rows drop the plate's
+row when its valid_from matches. Rows are idempotent, so a client may
+safely receive the same change twice.
+"""
+import gzip
+import json
+from datetime import timedelta
+from django.db.models import Max, Min, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from .enforcement import enforcement_sessions, grace_minutes
+from .models import EnforcementEvent
+
+SNAPSHOT_FORMAT = 1
+COLUMNS = ['plate', 'valid_from', 'valid_until', 'grace_until']
+
+# Events younger than this may belong to transactions still in flight, the
+# cursor stays behind them so they are sent again on the next sync
+SEQ_SETTLE_SECONDS = 5
+
+EVENT_RETENTION = timedelta(days=2)
+
+
+def _epoch(moment):
+    return int(moment.timestamp()) if moment else None
+
+
+def _row(plate, valid_from, valid_until, grace):
+    grace_until = valid_until + timedelta(minutes=grace) if valid_until else None
+    return [plate, _epoch(valid_from), _epoch(valid_until), _epoch(grace_until)]
+
+
+def _settled_seq(now, after=0):
+    """Highest event id that no in-flight transaction can still precede"""
+    settled = (
+        EnforcementEvent.objects.filter(id__gt=after, created_at__lt=now - timedelta(seconds=SEQ_SETTLE_SECONDS))
+        .aggregate(seq=Max('id'))['seq']
+    )
+    return settled or after
+
+
+def build_snapshot(city, now=None):
+    now = now or timezone.now()
+    grace = grace_minutes()
+    seq = _settled_seq(now)
+
+    # Coarse SQL filter, the exact window is computed per row below
+    horizon = now - timedelta(minutes=grace)
+    sessions = (
+        enforcement_sessions()
+        .filter(parking_lot__city=city, vehicle__isnull=False)
+        .filter(
+            Q(is_active=True, end_time__isnull=True)
+            | Q(planned_end_time__gt=horizon)
+            | Q(end_time__gt=horizon)
+        )
+        .order_by('start_time')
+    )
+
+    rows = {}
+    for session in sessions:
+        row = _row(session.vehicle.plate_normalized, session.start_time, session.paid_until, grace)
+        if row[3] is None or row[3] > _epoch(now):
+            # Ascending start_time: the latest session of a plate wins
+            rows[row[0]] = row
+
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'city': city,
+        'seq': seq,
+        'generated_at': _epoch(now),
+        'grace_minutes': grace,
+        'columns': COLUMNS,
+        'rows': list(rows.values()),
+    }
+
+
+def build_delta(city, since, now=None):
+    """Changes after `since`, or None when pruned events make a full snapshot necessary"""
+    now = now or timezone.now()
+    oldest = EnforcementEvent.objects.aggregate(oldest=Min('id'))['oldest']
+    if oldest is not None and since < oldest - 1:
+        return None
+
+    grace = grace_minutes()
+    latest = {}
+    for event in EnforcementEvent.objects.filter(city=city, id__gt=since).order_by('id'):
+        latest[event.plate_normalized] = event
+
+    upserts = []
+    removed = []
+    for plate, event in latest.items():
+        row = _row(plate, event.valid_from, event.valid_until, grace)
+        (removed if event.removed else upserts).append(row)
+
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'city': city,
+        'since': since,
+        'seq': _settled_seq(now, since),
+        'generated_at': _epoch(now),
+        'grace_minutes': grace,
+        'columns': COLUMNS,
+        'upserts': upserts,
+        'removed': removed,
+    }
+
+
+def prune_events(now=None):
+    """Drop events older than EVENT_RETENTION, always keeping the newest one"""
+    now = now or timezone.now()
+    newest = EnforcementEvent.objects.aggregate(newest=Max('id'))['newest']
+    if newest is None:
+        return 0
+    deleted, _ = EnforcementEvent.objects.filter(
+        created_at__lt=now - EVENT_RETENTION, id__lt=newest
+    ).delete()
+    return deleted
+
+
+def compact_response(payload, request):
+    """Compact JSON, gzip-compressed when the client accepts it"""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    response = HttpResponse(content_type='application/json')
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        body = gzip.compress(body)
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response.content = body
+    return response
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SessionCursorPagination(CursorPagination):
+    """
+    Opt-in cursor pagination for session lists, newest first.
+    Only requests carrying ?cursor= or ?page_size= are paginated, so
+    existing clients keep receiving the plain list.
+    Response: {"next": <url>, "previous": <url>, "results": [...]}
+    """
+    ordering = ('-start_time', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import GlobalSettings, Vehicle, ParkingSession
+from .models import Vehicle, ParkingSession, normalize_plate
+from .global_settings import get_global_settings
+from .enforcement import MAX_BULK_PLATES
 from parkings.models import Parking 
 from parkings.serializers import ParkingSerializer 
 
@@ -15,6 +17,17 @@ class VehicleSerializer(serializers.ModelSerializer):
         fields = ['id', 'plate', 'name', 'is_favorite']
         read_only_fields = ['id']
 
+    def validate_plate(self, value):
+        normalized = normalize_plate(value)
+        if not normalized:
+            raise serializers.ValidationError("Invalid plate.")
+        duplicates = Vehicle.objects.filter(plate_normalized=normalized)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("A vehicle with this plate already exists.")
+        return value
+
 class ParkingSessionSerializer(serializers.ModelSerializer):
     vehicle = VehicleSerializer(read_only=True)
     parking_lot = ParkingSerializer(read_only=True)
@@ -33,6 +46,10 @@ class ParkingSessionSerializer(serializers.ModelSerializer):
     # --- NUOVO CAMPO CALCOLATO PER IL FRONTEND ---
     grace_period_minutes = serializers.SerializerMethodField()
 
+    # Query plan of list endpoints, see tps_backend.query_plans
+    select_related_fields = ('vehicle', 'parking_lot')
+    prefetch_related_fields = ('parking_lot__entrances',)
+
     class Meta:
         model = ParkingSession
         fields = [
@@ -49,11 +66,65 @@ class ParkingSessionSerializer(serializers.ModelSerializer):
             'grace_period_minutes' 
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields=a,b,... keeps only those fields (plus id, the key of delta sync)
+        requested = self.context.get('fields')
+        if requested:
+            for name in set(self.fields) - set(requested) - {'id'}:
+                self.fields.pop(name)
+
     # Metodo per recuperare il valore dinamico dalle impostazioni globali
     def get_grace_period_minutes(self, obj):
-        config = GlobalSettings.objects.first()
+        config = get_global_settings()
         return config.grace_period_minutes if config else 5
 
+class ParkingStubSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Parking
+        fields = ['id', 'name']
+
+class CompactParkingSessionSerializer(ParkingSessionSerializer):
+    """
+    Session list rows with the parking reduced to an id + name stub: no
+    entrances, polygon or tariff per row, and nothing queried beyond a
+    select_related of vehicle and parking_lot.
+    """
+    parking_lot = ParkingStubSerializer(read_only=True)
+    prefetch_related_fields = ()
+
+def session_list_options(request):
+    """
+    Serializer class and extra context for a session list request:
+    ?compact=1 selects the compact rows, ?fields=a,b,... the fields to return.
+    """
+    params = request.query_params
+    compact = params.get('compact', '').lower() in ['1', 'true']
+    fields = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+    serializer_class = CompactParkingSessionSerializer if compact else ParkingSessionSerializer
+    return serializer_class, {'fields': fields}
+
+class EnforcementParkingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Parking
+        fields = ['id', 'name', 'city', 'address']
+
+class EnforcementSessionSerializer(ParkingSessionSerializer):
+    """
+    Session as shown to a controller after a plate check: the parking is
+    reduced to what the officer screen needs, so nothing is queried beyond
+    the select_related of vehicles.enforcement.
+    """
+    parking_lot = EnforcementParkingSerializer(read_only=True)
+    prefetch_related_fields = ()
+
+class PlateCheckSerializer(serializers.Serializer):
+    plates = serializers.ListField(
+        child=serializers.CharField(max_length=32),
+        allow_empty=False,
+        max_length=MAX_BULK_PLATES,
+    )
+
 class ControllerParkingSessionSerializer(ParkingSessionSerializer):
     """
     Serializzatore specializzato per il Controllore. 
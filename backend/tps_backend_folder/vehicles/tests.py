@@ -1,3 +1,409 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from parkings.changes import PARKING, SESSION
+from parkings.counters import rebuild_counters
+from parkings.models import (
+    ChangeLog, CityDailyCounter, Parking, ParkingCounter, ParkingDailyCounter, ParkingEntrance,
+)
+from tps_backend.testing import QueryBudgetMixin
+from tps_backend.versioning import LOCAL_VERSION_TIMEOUT
+from users.models import CustomUser
+from .archive import FINE_COLUMNS, SESSION_COLUMNS, archive_history
+from .enforcement import DEFAULT_GRACE_MINUTES, EXPIRED, GRACE_PERIOD, UNAUTHORIZED, grace_minutes
+from .expiry import expire_sessions
+from .global_settings import LOCAL_TTL_SECONDS, get_global_settings, invalidate_global_settings
+from .models import (
+    ArchivedFine, ArchivedParkingSession, ArchiveExport, EnforcementEvent, Fine, GlobalSettings, ParkingSession, Vehicle,
+)
+from .offline import EVENT_RETENTION, SEQ_SETTLE_SECONDS, build_delta, build_snapshot, prune_events
 
-# Create your tests here.
+_sequence = count()
+
+
+class SessionListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_sessions(self, rows):
+        # A parking per session, each with its own entrances
+        for _ in range(rows):
+            n = next(_sequence)
+            parking = Parking.objects.create(name=f'Parking {n}', city='Torino', address='Via Roma 1')
+            ParkingEntrance.objects.create(parking=parking, address_line='Gate', latitude=45.0, longitude=7.0)
+            vehicle = Vehicle.objects.create(user=self.user, plate=f'TS{n:05d}')
+            ParkingSession.objects.create(user=self.user, vehicle=vehicle, parking_lot=parking)
+
+    def test_session_list(self):
+        self.assertConstantQueries(lambda: self.client.get('/api/sessions/'), self.add_sessions)
+
+    def test_compact_paginated_session_list(self):
+        self.assertConstantQueries(
+            lambda: self.client.get('/api/sessions/?compact=1&page_size=100'), self.add_sessions,
+        )
+
+    def test_active_sessions(self):
+        self.assertConstantQueries(lambda: self.client.get('/api/sessions/active/'), self.add_sessions)
+
+    def test_vehicle_list(self):
+        self.assertConstantQueries(
+            lambda: self.client.get('/api/vehicles/'),
+            lambda rows: [
+                Vehicle.objects.create(user=self.user, plate=f'TV{next(_sequence):05d}') for _ in range(rows)
+            ],
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GlobalSettingsCacheTests(TestCase):
+    def setUp(self):
+        self.config = GlobalSettings.objects.create(grace_period_minutes=15)
+        invalidate_global_settings()
+
+    def test_save_invalidates(self):
+        self.assertEqual(get_global_settings().grace_period_minutes, 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.grace_period_minutes = 5
+            self.config.save()
+        self.assertEqual(get_global_settings().grace_period_minutes, 5)
+
+    def test_change_from_another_worker(self):
+        self.assertEqual(get_global_settings().grace_period_minutes, 15)
+        # Saved by another worker: its version bump never reaches this process-local cache
+        GlobalSettings.objects.filter(pk=self.config.pk).update(grace_period_minutes=5)
+        self.assertEqual(get_global_settings().grace_period_minutes, 15)
+        later = time.time() + LOCAL_VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later), \
+                mock.patch('time.monotonic', return_value=time.monotonic() + LOCAL_TTL_SECONDS + 1):
+            self.assertEqual(get_global_settings().grace_period_minutes, 5)
+
+
+class SessionExpiryTests(TestCase):
+    def setUp(self):
+        GlobalSettings.objects.create(grace_period_minutes=15)
+        invalidate_global_settings()
+        self.user = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.parking = Parking.objects.create(name='Expiry', city='Torino', address='Via Roma 1')
+        self.now = timezone.now()
+
+    def start_session(self, minutes_overdue):
+        vehicle = Vehicle.objects.create(user=self.user, plate=f'EX{next(_sequence):05d}')
+        return ParkingSession.objects.create(
+            user=self.user, vehicle=vehicle, parking_lot=self.parking,
+            start_time=self.now - timedelta(hours=2),
+            planned_end_time=self.now - timedelta(minutes=minutes_overdue),
+            duration_purchased_minutes=60, prepaid_cost=Decimal('2.50'),
+        )
+
+    def active_sessions(self):
+        return ParkingCounter.objects.get(parking=self.parking).active_sessions
+
+    def test_expire_overdue_sessions(self):
+        overdue = [self.start_session(30), self.start_session(20)]
+        in_grace = self.start_session(10)
+        running = self.start_session(-30)
+        self.assertEqual(self.active_sessions(), 4)
+        last_change = ChangeLog.objects.order_by('-id').values_list('id', flat=True).first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # One session per batch, expire_sessions keeps going until none is left
+            self.assertEqual(expire_sessions(self.now, batch_size=1), 2)
+
+        for session in overdue:
+            session.refresh_from_db()
+            self.assertFalse(session.is_active)
+            self.assertTrue(session.is_expired)
+            self.assertEqual(session.expired_at, self.now)
+            self.assertEqual(session.end_time, session.planned_end_time)
+            self.assertEqual(session.total_cost, session.prepaid_cost)
+        for session in (in_grace, running):
+            session.refresh_from_db()
+            self.assertTrue(session.is_active)
+            self.assertFalse(session.is_expired)
+        self.assertEqual(self.active_sessions(), 2)
+        self.assertCountEqual(
+            ChangeLog.objects.filter(id__gt=last_change).values_list('resource', 'object_id', 'parking_id'),
+            # Occupancy changed once per batch
+            [(SESSION, session.id, self.parking.id) for session in overdue]
+            + [(PARKING, self.parking.id, self.parking.id)] * 2,
+        )
+
+    def test_grace_period_from_global_settings(self):
+        session = self.start_session(10)
+        self.assertEqual(expire_sessions(self.now), 0)
+        GlobalSettings.objects.update(grace_period_minutes=5)
+        invalidate_global_settings()
+        self.assertEqual(expire_sessions(self.now), 1)
+        session.refresh_from_db()
+        self.assertTrue(session.is_expired)
+
+
+class ArchiveHistoryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.parking = Parking.objects.create(name='Archive', city='Torino', address='Via Roma 1')
+        self.vehicle = Vehicle.objects.create(user=self.user, plate='AR00001')
+        self.now = timezone.now()
+        old = self.now - timedelta(days=400)
+        self.old_session = self.closed_session(old)
+        self.kept_session = self.closed_session(old)
+        self.recent_session = self.closed_session(self.now - timedelta(days=10))
+        self.paid_fine = Fine.objects.create(
+            vehicle=self.vehicle, session=self.old_session, issued_by=self.user, amount=Decimal('50.00'),
+            issued_at=old, status='paid', paid_at=old + timedelta(days=2),
+        )
+        # Still open, keeps its session in the live table
+        self.open_fine = Fine.objects.create(vehicle=self.vehicle, session=self.kept_session, issued_at=old)
+        rebuild_counters()
+
+    def closed_session(self, start):
+        return ParkingSession.objects.create(
+            user=self.user, vehicle=self.vehicle, parking_lot=self.parking, start_time=start,
+            end_time=start + timedelta(hours=1), is_active=False, total_cost=Decimal('2.00'),
+        )
+
+    def counters(self):
+        return (
+            list(ParkingCounter.objects.values_list('parking_id', 'total_spots', 'active_sessions')),
+            list(ParkingDailyCounter.objects.order_by('day').values(
+                'parking_id', 'day', 'entries', 'revenue', 'fines_issued', 'fines_paid', 'peak_occupancy',
+            )),
+            list(CityDailyCounter.objects.order_by('day').values(
+                'city', 'day', 'entries', 'revenue', 'fines_issued', 'fines_paid', 'peak_occupancy',
+            )),
+        )
+
+    def test_archive_round_trip(self):
+        session = ParkingSession.objects.filter(pk=self.old_session.pk).values(*SESSION_COLUMNS).get()
+        fine = Fine.objects.filter(pk=self.paid_fine.pk).values(*FINE_COLUMNS).get()
+        counters = self.counters()
+
+        self.assertEqual(archive_history(now=self.now), (1, 1))
+
+        self.assertFalse(ParkingSession.objects.filter(pk=self.old_session.pk).exists())
+        self.assertFalse(Fine.objects.filter(pk=self.paid_fine.pk).exists())
+        self.assertCountEqual(
+            ParkingSession.objects.values_list('id', flat=True), [self.kept_session.id, self.recent_session.id],
+        )
+        self.assertEqual(Fine.objects.get().pk, self.open_fine.pk)
+        archived_session = ArchivedParkingSession.objects.filter(pk=session['id'])
+        self.assertEqual(archived_session.values(*SESSION_COLUMNS).get(), session)
+        self.assertEqual(archived_session.values_list('plate', 'city').get(), ('AR00001', 'Torino'))
+        archived_fine = ArchivedFine.objects.filter(pk=fine['id'])
+        self.assertEqual(archived_fine.values(*FINE_COLUMNS).get(), fine)
+        self.assertEqual(archived_fine.values_list('parking_lot_id', 'city').get(), (self.parking.id, 'Torino'))
+
+        # Moving rows to cold storage changes no total, now or after a rebuild
+        self.assertEqual(self.counters(), counters)
+        rebuild_counters()
+        self.assertEqual(self.counters(), counters)
+
+    def test_file_export_keeps_rollups(self):
+        counters = self.counters()
+        out = io.StringIO()
+
+        self.assertEqual(archive_history(now=self.now, out=out), (1, 1))
+
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertFalse(ArchivedParkingSession.objects.exists())
+        self.assertFalse(ArchivedFine.objects.exists())
+        export = ArchiveExport.objects.get()
+        self.assertEqual((export.sessions, export.fines), (1, 1))
+        # The fine was paid two days after the session started
+        self.assertEqual(export.last_day, timezone.localdate(self.paid_fine.paid_at))
+
+        # No source rows left for the exported days, a rebuild must not zero them
+        self.assertEqual(rebuild_counters(), export.last_day + timedelta(days=1))
+        self.assertEqual(self.counters(), counters)
+        # Later days are still recomputed
+        ParkingDailyCounter.objects.filter(day=timezone.localdate(self.recent_session.start_time)).update(entries=9)
+        rebuild_counters()
+        self.assertEqual(self.counters(), counters)
+
+    def test_empty_export_is_not_recorded(self):
+        archive_history(now=self.now, out=io.StringIO())
+        self.assertEqual(archive_history(now=self.now, out=io.StringIO()), (0, 0))
+        self.assertEqual(ArchiveExport.objects.count(), 1)
+
+    def test_archive_is_idempotent(self):
+        archive_history(now=self.now)
+        self.assertEqual(archive_history(now=self.now), (0, 0))
+        self.assertEqual(ArchivedParkingSession.objects.count(), 1)
+        self.assertEqual(ArchivedFine.objects.count(), 1)
+
+
+class PlateCheckTests(TestCase):
+    def setUp(self):
+        self.config = GlobalSettings.objects.create(grace_period_minutes=15)
+        invalidate_global_settings()
+        owner = CustomUser.objects.create_user('driver@tps.test', 'password')
+        controller = CustomUser.objects.create_user(
+            'controller@tps.test', 'password', role='controller', allowed_cities=['Torino'],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(controller)
+        torino = Parking.objects.create(name='Torino', city='Torino', address='Via Roma 1')
+        milano = Parking.objects.create(name='Milano', city='Milano', address='Via Dante 1')
+        now = timezone.now()
+
+        def session(plate, parking, minutes_overdue, hours_ago=2):
+            vehicle = Vehicle.objects.filter(plate=plate).first() or Vehicle.objects.create(user=owner, plate=plate)
+            return ParkingSession.objects.create(
+                user=owner, vehicle=vehicle, parking_lot=parking,
+                start_time=now - timedelta(hours=hours_ago),
+                planned_end_time=now - timedelta(minutes=minutes_overdue),
+            )
+
+        session('AB123CD', torino, -60)
+        # Only the latest session of a plate counts
+        session('EF456GH', torino, 120, hours_ago=5)
+        self.in_grace = session('EF456GH', torino, 10)
+        session('IJ789KL', torino, 30)
+        session('MN012OP', milano, 30)
+
+    def search(self, plate):
+        return self.client.get('/api/sessions/search_by_plate/', {'plate': plate})
+
+    def check(self, plates):
+        response = self.client.post('/api/sessions/check_plates/', {'plates': plates}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_bulk_matches_single_checks(self):
+        plates = ['ij789kl', 'AB 123 CD', 'ZZ999ZZ', 'MN012OP', 'EF456GH', 'AB123CD', 'ij789kl']
+        results = self.check(plates)
+        self.assertEqual([result['plate'] for result in results], plates)
+        for plate, result in zip(plates, results):
+            single = self.search(plate)
+            if single.status_code == 403:
+                self.assertEqual(result['status'], UNAUTHORIZED)
+                self.assertFalse(result['can_issue_ticket'])
+                self.assertEqual(result['message'], single.json()['detail'])
+                self.assertIsNone(result['session_data'])
+            else:
+                self.assertEqual(single.status_code, 200)
+                self.assertEqual({**single.json(), 'plate': plate}, result)
+        self.assertEqual(results[3]['message'], 'Unauthorized city: Milano')
+        self.assertEqual(results[4]['status'], GRACE_PERIOD)
+        self.assertEqual(results[4]['session_data']['id'], self.in_grace.id)
+
+    def test_grace_period_from_global_settings(self):
+        self.assertEqual(grace_minutes(), 15)
+        self.assertEqual(self.search('EF456GH').json()['status'], GRACE_PERIOD)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.grace_period_minutes = 5
+            self.config.save()
+        self.assertEqual(self.search('EF456GH').json()['status'], EXPIRED)
+        self.assertEqual(self.check(['EF456GH'])[0]['status'], EXPIRED)
+
+        GlobalSettings.objects.all().delete()
+        invalidate_global_settings()
+        self.assertEqual(grace_minutes(), DEFAULT_GRACE_MINUTES)
+
+
+class OfflineSnapshotTests(TestCase):
+    URL = '/api/sessions/offline_snapshot/'
+
+    def setUp(self):
+        GlobalSettings.objects.create(grace_period_minutes=15)
+        invalidate_global_settings()
+        self.owner = CustomUser.objects.create_user('driver@tps.test', 'password')
+        self.controller = CustomUser.objects.create_user(
+            'controller@tps.test', 'password', role='controller', allowed_cities=['Torino'],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.controller)
+        self.torino = Parking.objects.create(name='Torino', city='Torino', address='Via Roma 1')
+        self.milano = Parking.objects.create(name='Milano', city='Milano', address='Via Dante 1')
+        self.now = timezone.now()
+
+        self.open_ended = self.start('AB123CD', self.torino, None)
+        self.paid = self.start('EF456GH', self.torino, 30)
+        self.in_grace = self.start('IJ789KL', self.torino, -10)
+        self.start('MN012OP', self.torino, -30)
+        self.start('QR345ST', self.milano, 30)
+
+    def start(self, plate, parking, minutes_left):
+        vehicle = Vehicle.objects.create(user=self.owner, plate=plate)
+        return ParkingSession.objects.create(
+            user=self.owner, vehicle=vehicle, parking_lot=parking,
+            start_time=self.now - timedelta(hours=1),
+            planned_end_time=self.now + timedelta(minutes=minutes_left) if minutes_left is not None else None,
+        )
+
+    def settle(self, seconds=SEQ_SETTLE_SECONDS + 1):
+        EnforcementEvent.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def row(self, session, grace=15):
+        end = session.paid_until
+        return [
+            session.vehicle.plate_normalized, int(session.start_time.timestamp()),
+            int(end.timestamp()) if end else None,
+            int((end + timedelta(minutes=grace)).timestamp()) if end else None,
+        ]
+
+    def test_snapshot(self):
+        self.settle()
+        snapshot = build_snapshot('Torino', self.now)
+        self.assertEqual(snapshot['seq'], EnforcementEvent.objects.latest('id').id)
+        self.assertEqual(snapshot['grace_minutes'], 15)
+        self.assertCountEqual(snapshot['rows'], [self.row(s) for s in (self.open_ended, self.paid, self.in_grace)])
+
+    def test_delta(self):
+        self.settle()
+        seq = build_snapshot('Torino')['seq']
+        added = self.start('UV678WX', self.torino, 60)
+        self.paid.end_session()
+        removed = self.row(self.in_grace)
+        self.in_grace.delete()
+        self.start('YZ901AB', self.milano, 60)
+        self.settle()
+
+        delta = build_delta('Torino', seq)
+        self.paid.refresh_from_db()
+        self.assertCountEqual(delta['upserts'], [self.row(added), self.row(self.paid)])
+        self.assertEqual(delta['removed'], [removed])
+        self.assertGreater(delta['seq'], seq)
+        empty = build_delta('Torino', delta['seq'])
+        self.assertEqual((empty['upserts'], empty['removed'], empty['seq']), ([], [], delta['seq']))
+
+    def test_endpoint(self):
+        self.settle()
+        response = self.client.get(self.URL, {'city': 'Torino'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        snapshot = json.loads(gzip.decompress(response.content))
+        self.assertCountEqual(snapshot['rows'], build_snapshot('Torino')['rows'])
+
+        response = self.client.get(self.URL, {'city': 'Torino', 'since': snapshot['seq']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['upserts'], [])
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'city': 'Torino', 'since': 'x'}).status_code, 400)
+
+    def test_old_sequence(self):
+        self.settle()
+        seq = build_snapshot('Torino')['seq']
+        self.start('UV678WX', self.torino, 60)
+        self.start('YZ901AB', self.torino, 60)
+        self.settle(EVENT_RETENTION.total_seconds() + 60)
+        self.assertGreater(prune_events(), 0)
+        self.assertIsNone(build_delta('Torino', seq))
+        self.assertEqual(self.client.get(self.URL, {'city': 'Torino', 'since': seq}).status_code, 410)
+
+    def test_city_permissions(self):
+        self.assertEqual(self.client.get(self.URL, {'city': 'Milano'}).status_code, 403)
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(self.URL, {'city': 'Torino'}).status_code, 403)
+        self.client.force_authenticate(CustomUser.objects.create_superuser('admin@tps.test', 'password'))
+        self.assertEqual(self.client.get(self.URL, {'city': 'Milano'}).status_code, 200)
@@ -2,53 +2,39 @@ from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Vehicle, ParkingSession
-from .serializers import VehicleSerializer, ParkingSessionSerializer, ControllerParkingSessionSerializer
+from .models import Vehicle, ParkingSession, normalize_plate
+from .serializers import (
+    VehicleSerializer, ParkingSessionSerializer, ControllerParkingSessionSerializer,
+    EnforcementSessionSerializer, PlateCheckSerializer, session_list_options,
+)
+from .enforcement import UNAUTHORIZED, resolve_plate, resolve_plates, can_inspect
+from .offline import build_delta, build_snapshot, compact_response
+from .pagination import SessionCursorPagination
 from parkings.models import Parking
+from tps_backend.query_plans import apply_query_plan
+from parkings.changes import SESSION, current_cursor, stamp_cursor, sync_delta
+from parkings.tariffs import get_tariff
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 import json
 from .models import Vehicle, Fine
 # OCR imports
 import os
-import re
 import requests
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 
 
-def calculate_prepaid_cost(parking_lot, duration_minutes):
+def calculate_prepaid_cost(parking_lot, duration_minutes, start_time=None):
     """
-    Calcola il costo prepagato utilizzando la tariff_config_json.
-    Supporta HOURLY_LINEAR e FIXED_DAILY di base.
+    Calcola il costo prepagato con la tariffa compilata del parcheggio
+    (FIXED_DAILY, HOURLY_LINEAR, HOURLY_VARIABLE con fasce giorno/notte e flex rules).
     """
     if not parking_lot or not parking_lot.tariff_config_json:
         return 0.00
 
-    duration_hours = duration_minutes / 60.0
-    cost = 0.00
-
-    try:
-        config = json.loads(parking_lot.tariff_config_json)
-        tariff_type = config.get('type', 'HOURLY_LINEAR')
-
-        if tariff_type == 'FIXED_DAILY':
-            daily_rate = float(config.get('daily_rate', 20.00))
-            # Logica Proporzionale con Cap Giornaliero
-            hourly_proportion = daily_rate / 24.0
-            calculated = duration_hours * hourly_proportion
-            cost = daily_rate if calculated > daily_rate else calculated
-
-        else:  # HOURLY_LINEAR (e fallback per VARIABLE)
-            # Usa day_base_rate come riferimento standard
-            hourly_rate = float(config.get('day_base_rate', 2.00))
-            cost = duration_hours * hourly_rate
-
-    except (json.JSONDecodeError, ValueError, TypeError):
-        # Fallback di emergenza
-        cost = duration_hours * 2.00
-
-    return round(cost, 2)
+    return get_tariff(parking_lot).price(start_time or timezone.now(), duration_minutes)
 
 
 class VehicleViewSet(viewsets.ModelViewSet):
@@ -98,12 +84,44 @@ class ParkingSessionViewSet(viewsets.ModelViewSet):
     """
     serializer_class = ParkingSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SessionCursorPagination
+
+    # Read-only list actions accepting ?compact=1 and ?fields=
+    LIST_ACTIONS = ['list', 'active']
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return ParkingSession.objects.filter(user=self.request.user)
+            return apply_query_plan(
+                ParkingSession.objects.filter(user=self.request.user), self.get_serializer_class(),
+            )
         return ParkingSession.objects.none()
 
+    def get_serializer_class(self):
+        if self.action in self.LIST_ACTIONS:
+            return session_list_options(self.request)[0]
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.LIST_ACTIONS:
+            context.update(session_list_options(self.request)[1])
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """
+        Full list, or with ?since=<cursor> only the sessions changed after it.
+        ?cursor= / ?page_size= switch to cursor pagination.
+        """
+        cursor = current_cursor()
+        queryset = self.filter_queryset(self.get_queryset())
+        delta = sync_delta(
+            request, SESSION, queryset, lambda rows: self.get_serializer(rows, many=True).data,
+            owner_id=request.user.id,
+        )
+        if delta is not None:
+            return delta
+        return stamp_cursor(super().list(request, *args, **kwargs), cursor)
+
     @action(detail=False, methods=['get'])
     def active(self, request):
         active_sessions = self.get_queryset().filter(is_active=True)
@@ -117,9 +135,9 @@ class ParkingSessionViewSet(viewsets.ModelViewSet):
 
         duration_minutes = serializer.validated_data.pop('duration_purchased_minutes', 0)
 
-        prepaid_cost_server = calculate_prepaid_cost(parking_lot, duration_minutes)
-
         start_time = timezone.now()
+
+        prepaid_cost_server = calculate_prepaid_cost(parking_lot, duration_minutes, start_time)
         
         if duration_minutes > 0:
             end_time = start_time + timedelta(minutes=duration_minutes)
@@ -134,18 +152,20 @@ class ParkingSessionViewSet(viewsets.ModelViewSet):
         if ParkingSession.objects.filter(vehicle=vehicle, is_active=True).exists():
             raise serializers.ValidationError("This vehicle already has an active session.")
 
-        serializer.save(
-            user=user,
-            start_time=start_time,
-            planned_end_time=planned_end_time,
-            end_time=end_time, 
-            duration_purchased_minutes=duration_minutes,
-            prepaid_cost=prepaid_cost_server,
-            total_cost=prepaid_cost_server,
-            is_active=True,
-            is_expired=False,
-            expired_at=None,
-        )
+        # Session row and parking counters (post_save) commit together
+        with transaction.atomic():
+            serializer.save(
+                user=user,
+                start_time=start_time,
+                planned_end_time=planned_end_time,
+                end_time=end_time, 
+                duration_purchased_minutes=duration_minutes,
+                prepaid_cost=prepaid_cost_server,
+                total_cost=prepaid_cost_server,
+                is_active=True,
+                is_expired=False,
+                expired_at=None,
+            )
     @action(detail=True, methods=['post'])
     def end_session(self, request, pk=None):
         session = self.get_object()
@@ -166,104 +186,107 @@ class ParkingSessionViewSet(viewsets.ModelViewSet):
         if not plate:
             return Response({"detail": "Plate parameter is required."}, status=400)
 
-        sessions = ParkingSession.objects.filter(
-            vehicle__plate__iexact=plate
-        ).order_by('-start_time')
-
-        if not sessions.exists():
+        result = resolve_plate(plate)
+        if result.session is None:
             return Response({
-                "status": "no_session",
-                "can_issue_ticket": True,
-                "message": f"No session found for {plate}. Issue Ticket?",
+                "status": result.status,
+                "can_issue_ticket": result.can_issue_ticket,
+                "message": result.message,
                 "session_data": None
             }, status=200)
 
-        session = sessions.first()
-        
-        session_data = ParkingSessionSerializer(session).data
-        
-        now = timezone.now()
-        grace_minutes = getattr(session, 'grace_period_minutes', 5)
-
-        reference_time = None
-        
-        if session.planned_end_time:
-            if session.end_time:
-                if session.end_time > session.planned_end_time:
-                    reference_time = session.planned_end_time
-                else:
-                    reference_time = session.end_time
-            else:
-
-                reference_time = session.planned_end_time
-        else:
-            if session.end_time:
-                reference_time = session.end_time
-            else:
-
-                reference_time = now 
-
-        grace_end_time_utc = reference_time + timedelta(minutes=grace_minutes)
-
-        grace_end_time_local_str = timezone.localtime(grace_end_time_utc).strftime('%H:%M')
-
-        status_code = "active"
-        can_issue_ticket = False
-        message = "Session is active."
-
-        if session.is_active and not session.end_time and (not session.planned_end_time or now < session.planned_end_time):
-             return Response({
-                "status": "active",
-                "can_issue_ticket": False,
-                "message": "Session is active (Ongoing).",
-                "session_data": session_data
-            }, status=200)
-
-        if now < reference_time:
-            status_code = "active"
-            can_issue_ticket = False
-            message = "Session is active."
-        
-        elif now < grace_end_time_utc:
-            status_code = "grace_period"
-            can_issue_ticket = False
-            message = f"In Grace Period (Expires at {grace_end_time_local_str})"
-            session_data['end_time'] = reference_time
-            
-        else:
-            status_code = "expired"
-            can_issue_ticket = True
-            message = "Session expired. You can issue a ticket."
-            session_data['end_time'] = reference_time
+        if not can_inspect(request.user, result.session):
+            return Response({
+                "detail": f"Unauthorized city: {result.session.parking_lot.city}"
+            }, status=403)
 
-        user = request.user
-        if not (user.is_superuser or (hasattr(user, 'role') and user.role == 'superuser')):
-            if hasattr(user, 'role') and user.role == 'controller':
-                if session.parking_lot:
-                    lot_city = session.parking_lot.city
-                    allowed = getattr(user, 'allowed_cities', [])
-                    if not allowed: allowed = []
-                    
-                    if lot_city not in allowed:
-                        return Response({
-                            "detail": f"Unauthorized city: {lot_city}"
-                        }, status=403)
+        session_data = EnforcementSessionSerializer(result.session).data
+        if result.reference_time:
+            session_data['end_time'] = result.reference_time
 
         return Response({
-            "status": status_code,            
-            "can_issue_ticket": can_issue_ticket,
-            "message": message,
+            "status": result.status,
+            "can_issue_ticket": result.can_issue_ticket,
+            "message": result.message,
             "session_data": session_data
         }, status=200)
-    
 
+    @action(detail=False, methods=['post'])
+    def check_plates(self, request):
+        """Bulk search_by_plate for officer sweeps, results in request order"""
+        serializer = PlateCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        plates = serializer.validated_data['plates']
+
+        results = resolve_plates(plates)
+        visible = [r.session for r in results if r.session is not None and can_inspect(request.user, r.session)]
+        session_data = {
+            session.pk: data
+            for session, data in zip(visible, EnforcementSessionSerializer(visible, many=True).data)
+        }
+
+        response = []
+        for plate, result in zip(plates, results):
+            if result.session is None:
+                response.append({
+                    "plate": plate,
+                    "status": result.status,
+                    "can_issue_ticket": result.can_issue_ticket,
+                    "message": result.message,
+                    "session_data": None
+                })
+            elif result.session.pk not in session_data:
+                response.append({
+                    "plate": plate,
+                    "status": UNAUTHORIZED,
+                    "can_issue_ticket": False,
+                    "message": f"Unauthorized city: {result.session.parking_lot.city}",
+                    "session_data": None
+                })
+            else:
+                data = dict(session_data[result.session.pk])
+                if result.reference_time:
+                    data['end_time'] = result.reference_time
+                response.append({
+                    "plate": plate,
+                    "status": result.status,
+                    "can_issue_ticket": result.can_issue_ticket,
+                    "message": result.message,
+                    "session_data": data
+                })
+        return Response({"results": response}, status=200)
 
-def normalize_plate(raw: str) -> str:
-    if not raw:
-        return ""
-    s = raw.strip().upper()
-    s = re.sub(r"[^A-Z0-9]", "", s)
-    return s
+    @action(detail=False, methods=['get'])
+    def offline_snapshot(self, request):
+        """
+        Valid sessions of a city for offline plate checks.
+        ?city=<name> for the full snapshot, plus &since=<seq> for the changes after it.
+        """
+        user = request.user
+        city = request.query_params.get('city')
+        if not city:
+            return Response({"detail": "City parameter is required."}, status=400)
+        if not user.is_superuser and getattr(user, 'role', None) not in ['controller', 'manager', 'superuser']:
+            return Response({"detail": "Permission denied."}, status=403)
+        if not user.is_superuser and city not in (getattr(user, 'allowed_cities', None) or []):
+            return Response({"detail": f"Unauthorized city: {city}"}, status=403)
+
+        since = request.query_params.get('since')
+        if since is None:
+            return compact_response(build_snapshot(city), request)
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"detail": "since must be an integer."}, status=400)
+
+        delta = build_delta(city, since)
+        if delta is None:
+            return Response(
+                {"detail": "Sequence too old, download the full snapshot again."},
+                status=status.HTTP_410_GONE,
+            )
+        return compact_response(delta, request)
+    
 
 
 class PlateOCRView(APIView):